@@ -1,19 +1,91 @@
 "Base Dataset class ..."
 
-import math
-import collections
-
+import MySQLdb.cursors
+import numpy as np
 from redis import Redis
 
 from gn2.base import species
-from gn2.utility import chunks
 from gn2.utility.tools import get_setting
+from gn2.utility.arrays import nan_to_none, index_positions
 from gn3.monads import MonadicDict, query_sql
 from pymonad.maybe import Maybe, Nothing
 from .datasetgroup import DatasetGroup
 from gn2.wqflask.database import database_connection
-from gn2.utility.db_tools import escape, mescape, create_in_clause
+from gn2.utility.db_tools import create_in_clause
+from gn2.base.reference_data import strain_ids
 from .utils import fetch_cached_results, cache_dataset_results
+from .utils import fetch_dataset_metadata, cache_dataset_metadata
+
+# Number of traits whose sample data is fetched per query by
+# `DataSet.retrieve_sample_data_bulk`
+SAMPLE_DATA_QUERY_CHUNK = 1000
+
+
+class BulkSampleData:
+    """The sample data of many traits of one dataset, as traits x samples
+    arrays of the values, standard errors and counts (NaN where there are
+    none). `present` marks the samples each trait has data for.
+
+    `rows` gives a trait's data in the form `retrieve_sample_data` returns
+    it, so the traits can be created from it without querying again."""
+
+    def __init__(self, trait_names, samples, names2, values, errors, counts,
+                 present, extra_rows=()):
+        self.trait_names = trait_names
+        self.samples = samples
+        self.names2 = names2
+        self.values = values
+        self.errors = errors
+        self.counts = counts
+        self.present = present
+        # Rows every trait has, appended after those from the database
+        self.extra_rows = list(extra_rows)
+        self.__trait_rows__ = {
+            str(name): row for (row, name) in enumerate(trait_names)}
+
+    @classmethod
+    def from_rows(cls, trait_names, trait_rows):
+        """The sample data of `trait_names` from the `(sample, value, error,
+        count, name2)` rows of each trait in `trait_rows`, as
+        `retrieve_sample_data` returns them. The samples are kept in the order
+        they first appear in."""
+        names2 = {}
+        for rows in trait_rows.values():
+            for (sample, _value, _error, _count, name2) in rows:
+                names2.setdefault(sample, name2)
+        samples = list(names2)
+        sample_columns = {name: column for (column, name) in enumerate(samples)}
+        shape = (len(trait_names), len(samples))
+        (values, errors, counts) = (
+            np.full(shape, np.nan), np.full(shape, np.nan),
+            np.full(shape, np.nan))
+        present = np.zeros(shape, dtype=bool)
+        for (row, name) in enumerate(trait_names):
+            for (sample, value, error, count, _name2) in trait_rows.get(
+                    name, ()):
+                column = sample_columns[sample]
+                values[row, column] = np.nan if value is None else value
+                errors[row, column] = np.nan if error is None else error
+                counts[row, column] = np.nan if count is None else count
+                present[row, column] = True
+        return cls(trait_names, samples, [names2[name] for name in samples],
+                   values, errors, counts, present)
+
+    def rows(self, trait_name):
+        """The `(sample, value, error, count, name2)` rows of `trait_name`,
+        ordered by sample, or an empty list if it has no data"""
+        row = self.__trait_rows__.get(str(trait_name))
+        if row is None:
+            return []
+        columns = np.flatnonzero(self.present[row])
+        values = nan_to_none(self.values[row:row+1, columns])[0]
+        errors = nan_to_none(self.errors[row:row+1, columns])[0]
+        counts = nan_to_none(self.counts[row:row+1, columns])[0]
+        return [
+            (self.samples[column], value, error,
+             None if count is None else int(count), self.names2[column])
+            for (column, value, error, count)
+            in zip(columns, values, errors, counts)] + self.extra_rows
 
 
 class DataSet:
@@ -22,6 +94,9 @@ class DataSet:
     Published phenotype, genotype, or user input dataset(temp)
 
     """
+    # Attributes looked up in the database when a dataset is created
+    METADATA_ATTRIBUTES = ("id", "name", "fullname", "shortname",
+                           "data_scale", "tissue", "accession_id")
 
     def __init__(self, name, get_samplelist=True, group_name=None, redis_conn=Redis()):
 
@@ -40,15 +115,36 @@ class DataSet:
             # sets self.group and self.group_id and gets genotype
             self.group = DatasetGroup(self, name=group_name)
         else:
-            self.check_confidentiality()
-            self.retrieve_other_names()
-            # sets self.group and self.group_id and gets genotype
-            self.group = DatasetGroup(self)
-            self.accession_id = self.get_accession_id()
+            metadata = fetch_dataset_metadata(self.type, name)
+            if metadata is None:
+                self.check_confidentiality()
+                self.retrieve_other_names()
+                # sets self.group and self.group_id and gets genotype
+                self.group = DatasetGroup(self)
+                self.accession_id = self.get_accession_id()
+                cache_dataset_metadata(self.type, name, self.metadata())
+            else:
+                self.restore_metadata(metadata)
         if get_samplelist == True:
             self.group.get_samplelist(redis_conn)
         self.species = species.TheSpecies(dataset=self)
 
+    def metadata(self):
+        """The attributes of the dataset and its group that are read from the
+        database on creation. Per-request state, like the samplelist or the
+        trait data, is not part of it."""
+        return {"dataset": {attr: getattr(self, attr)
+                            for attr in self.METADATA_ATTRIBUTES
+                            if hasattr(self, attr)},
+                "group": self.group.metadata()}
+
+    def restore_metadata(self, metadata):
+        """Set up the dataset and its group from `metadata`, as returned by
+        `metadata()`, instead of querying the database"""
+        for (attr, value) in metadata["dataset"].items():
+            setattr(self, attr, value)
+        self.group = DatasetGroup.from_metadata(metadata["group"])
+
     def as_monadic_dict(self):
         _result = MonadicDict({
             'name': self.name,
@@ -180,17 +276,9 @@ class DataSet:
         if self.group.parlist != None and self.group.f1list != None:
             if (self.group.parlist + self.group.f1list) in self.samplelist:
                 self.samplelist += self.group.parlist + self.group.f1list
+        results = strain_ids(self.group.species, self.samplelist)
+        sample_ids = [results[item] for item in self.samplelist]
         with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT Strain.Name, Strain.Id FROM "
-                "Strain, Species WHERE Strain.Name IN "
-                f"{create_in_clause(self.samplelist)} "
-                "AND Strain.SpeciesId=Species.Id AND "
-                "Species.name = %s", (self.group.species,)
-            )
-            results = dict(cursor.fetchall())
-            sample_ids = [results[item] for item in self.samplelist]
-
             sorted_samplelist = [strain_name for strain_name, strain_id in sorted(
                 results.items(), key=lambda item: item[1])]
 
@@ -220,86 +308,157 @@ class DataSet:
             if (self.group.parlist + self.group.f1list) in self.samplelist:
                 self.samplelist += self.group.parlist + self.group.f1list
 
-        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
+        results = strain_ids(self.group.species, self.samplelist)
+        sample_ids = [
+            sample_id for sample_id in
+            (results.get(item) for item in self.samplelist
+             if item is not None)
+            if sample_id is not None
+        ]
+        cached_results = fetch_cached_results(self.name, self.type, self.samplelist)
+        if cached_results is None:
+            with database_connection(get_setting("SQL_URI")) as conn:
+                (trait_names, trait_matrix) = self.fetch_trait_matrix(
+                    conn, sample_ids)
+            cache_dataset_results(self.name, self.type, self.samplelist,
+                                  trait_names, trait_matrix)
+        else:
+            (trait_names, trait_matrix) = cached_results
+
+        self.trait_data = dict(zip(trait_names, nan_to_none(trait_matrix)))
+        self.trait_names = trait_names
+        self.trait_matrix = trait_matrix
+
+    def sample_data_bulk_query(self, trait_names):
+        """The query, and its parameters, for the `(trait, sample, value,
+        error, count, name2)` rows of `trait_names`, or None for datasets
+        whose sample data is only retrieved a trait at a time"""
+        return None
+
+    def retrieve_sample_data_bulk(self, trait_names):
+        """Fetch the sample data of all of `trait_names`, as
+        `retrieve_sample_data` does for a single trait, with one query for
+        every `SAMPLE_DATA_QUERY_CHUNK` traits. The rows are streamed through
+        a server-side cursor into the arrays of a `BulkSampleData`. Datasets
+        with no `sample_data_bulk_query` retrieve each trait's data in turn."""
+        trait_names = list(dict.fromkeys(str(name) for name in trait_names))
+        queries = [
+            self.sample_data_bulk_query(
+                trait_names[start:start + SAMPLE_DATA_QUERY_CHUNK])
+            for start in range(0, len(trait_names), SAMPLE_DATA_QUERY_CHUNK)]
+        if any(query is None for query in queries):
+            return BulkSampleData.from_rows(
+                trait_names, {name: self.retrieve_sample_data(name)
+                              for name in trait_names})
+
+        trait_rows = {name: row for (row, name) in enumerate(trait_names)}
+        sample_columns = {}
+        names2 = {}
+        cells = []
+        with database_connection(get_setting("SQL_URI")) as conn:
+            for (query, params) in queries:
+                with conn.cursor(MySQLdb.cursors.SSCursor) as cursor:
+                    cursor.execute(query, params)
+                    while True:
+                        rows = cursor.fetchmany(10000)
+                        if not rows:
+                            break
+                        (traits, samples, values, errors, counts,
+                         row_names2) = zip(*rows)
+                        for (sample, name2) in zip(samples, row_names2):
+                            if sample not in sample_columns:
+                                sample_columns[sample] = len(sample_columns)
+                                names2[sample] = name2
+                        cells.append((
+                            [trait_rows[str(trait)] for trait in traits],
+                            [sample_columns[sample] for sample in samples],
+                            np.array(values, dtype=float),
+                            np.array(errors, dtype=float),
+                            np.array(counts, dtype=float)))
+
+        # Samples in the order the per-trait queries sort them by name
+        samples = sorted(sample_columns, key=lambda name: (name.lower(), name))
+        column_order = np.empty(len(samples), dtype=int)
+        column_order[[sample_columns[name] for name in samples]] = np.arange(
+            len(samples))
+        shape = (len(trait_names), len(samples))
+        (values, errors, counts) = (
+            np.full(shape, np.nan), np.full(shape, np.nan),
+            np.full(shape, np.nan))
+        present = np.zeros(shape, dtype=bool)
+        for (rows, columns, row_values, row_errors, row_counts) in cells:
+            columns = column_order[columns]
+            values[rows, columns] = row_values
+            errors[rows, columns] = row_errors
+            counts[rows, columns] = row_counts
+            present[rows, columns] = True
+        return BulkSampleData(trait_names, samples,
+                              [names2[name] for name in samples],
+                              values, errors, counts, present)
+
+    def fetch_trait_matrix(self, conn, sample_ids):
+        """Fetch the values of every trait in the dataset for `sample_ids`.
+
+        The values are streamed in long format, one `(DataId, StrainId,
+        value)` row per cell, through a server-side cursor and written straight
+        into a traits x samples array; cells with no value are NaN. Traits are
+        ordered as in the `{Phenotype,ProbeSet,Geno}` table. Returns the trait
+        names and the array."""
+        if self.type == "Publish":
+            trait_query = (
+                "SELECT PublishXRef.DataId, PublishXRef.Id "
+                "FROM (Phenotype, PublishXRef, PublishFreeze) "
+                "WHERE PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+                "AND PublishFreeze.Name = %s "
+                "AND Phenotype.Id = PublishXRef.PhenotypeId "
+                "ORDER BY Phenotype.Id")
+            freeze_join = "PublishXRef.InbredSetId = PublishFreeze.InbredSetId"
+        else:
+            trait_query = (
+                "SELECT {0}XRef.DataId, {0}.Name FROM ({0}, {0}XRef, {0}Freeze) "
+                "WHERE {0}XRef.{0}FreezeId = {0}Freeze.Id "
+                "AND {0}Freeze.Name = %s AND {0}.Id = {0}XRef.{0}Id "
+                "ORDER BY {0}.Id").format(self.type)
+            freeze_join = "{0}XRef.{0}FreezeId = {0}Freeze.Id".format(
+                self.type)
+
+        with conn.cursor() as cursor:
+            cursor.execute(trait_query, (self.name,))
+            traits = cursor.fetchall()
+        trait_names = [trait_name for (_data_id, trait_name) in traits]
+        # traits sharing a DataId share its row of values
+        (data_ids, trait_data_rows) = np.unique(
+            np.array([data_id for (data_id, _name) in traits]),
+            return_inverse=True)
+
+        if len(trait_names) == 0 or len(sample_ids) == 0:
+            return (trait_names, np.full((len(trait_names), len(sample_ids)),
+                                         np.nan))
+        strain_ids = np.unique(sample_ids)
+        values = np.full((len(data_ids), len(strain_ids)), np.nan)
+
+        with conn.cursor(MySQLdb.cursors.SSCursor) as cursor:
             cursor.execute(
-                "SELECT Strain.Name, Strain.Id FROM Strain, Species "
-                f"WHERE Strain.Name IN {create_in_clause(self.samplelist)} "
-                "AND Strain.SpeciesId=Species.Id "
-                "AND Species.name = %s",
-                (self.group.species,)
-            )
-            results = dict(cursor.fetchall())
-            sample_ids = [
-                sample_id for sample_id in
-                (results.get(item) for item in self.samplelist
-                 if item is not None)
-                if sample_id is not None
-            ]
-
-            # MySQL limits the number of tables that can be used in a join to 61,
-            # so we break the sample ids into smaller chunks
-            # Postgres doesn't have that limit, so we can get rid of this after we transition
-            chunk_size = 50
-            number_chunks = int(math.ceil(len(sample_ids) / chunk_size))
-
-            cached_results = fetch_cached_results(self.name, self.type, self.samplelist)
-
-            if cached_results is None:
-                trait_sample_data = []
-                for sample_ids_step in chunks.divide_into_chunks(sample_ids, number_chunks):
-                    if self.type == "Publish":
-                        dataset_type = "Phenotype"
-                    else:
-                        dataset_type = self.type
-                    temp = ['T%s.value' % item for item in sample_ids_step]
-                    if self.type == "Publish":
-                        query = "SELECT {}XRef.Id".format(escape(self.type))
-                    else:
-                        query = "SELECT {}.Name".format(escape(dataset_type))
-                    data_start_pos = 1
-                    if len(temp) > 0:
-                        query = query + ", " + ', '.join(temp)
-                    query += ' FROM ({}, {}XRef, {}Freeze) '.format(*mescape(dataset_type,
-                                                                             self.type,
-                                                                             self.type))
-
-                    for item in sample_ids_step:
-                        query += """
-                                left join {}Data as T{} on T{}.Id = {}XRef.DataId
-                                and T{}.StrainId={}\n
-                                """.format(*mescape(self.type, item, item, self.type, item, item))
-
-                    if self.type == "Publish":
-                        query += """
-                                WHERE {}XRef.InbredSetId = {}Freeze.InbredSetId
-                                and {}Freeze.Name = '{}'
-                                and {}.Id = {}XRef.{}Id
-                                order by {}.Id
-                                """.format(*mescape(self.type, self.type, self.type, self.name,
-                                                    dataset_type, self.type, dataset_type, dataset_type))
-                    else:
-                        query += """
-                                WHERE {}XRef.{}FreezeId = {}Freeze.Id
-                                and {}Freeze.Name = '{}'
-                                and {}.Id = {}XRef.{}Id
-                                order by {}.Id
-                                """.format(*mescape(self.type, self.type, self.type, self.type,
-                                                    self.name, dataset_type, self.type, self.type, dataset_type))
-                    cursor.execute(query)
-                    results = cursor.fetchall()
-                    trait_sample_data.append([list(result) for result in results])
-
-                trait_count = len(trait_sample_data[0])
-                self.trait_data = collections.defaultdict(list)
-
-                data_start_pos = 1
-                for trait_counter in range(trait_count):
-                    trait_name = trait_sample_data[0][trait_counter][0]
-                    for chunk_counter in range(int(number_chunks)):
-                        self.trait_data[trait_name] += (
-                            trait_sample_data[chunk_counter][trait_counter][data_start_pos:])
-
-                cache_dataset_results(
-                    self.name, self.type, self.samplelist, self.trait_data)
-            else:
-                self.trait_data = cached_results
+                "SELECT {0}Data.Id, {0}Data.StrainId, {0}Data.value "
+                "FROM {0}Data, {0}XRef, {0}Freeze "
+                "WHERE {0}Data.Id = {0}XRef.DataId AND {1} "
+                "AND {0}Freeze.Name = %s AND {0}Data.StrainId IN ({2})".format(
+                    self.type, freeze_join,
+                    ", ".join(["%s"] * len(strain_ids))),
+                (self.name,) + tuple(strain_ids.tolist()))
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                (row_data_ids, row_strain_ids, row_values) = zip(*rows)
+                trait_rows = index_positions(data_ids, row_data_ids)
+                known = trait_rows >= 0
+                values[trait_rows[known],
+                       np.searchsorted(strain_ids,
+                                       np.array(row_strain_ids)[known])] = (
+                    np.array(row_values, dtype=float)[known])
+
+        # one column per requested sample, in the order they were requested
+        return (trait_names,
+                values[np.ix_(trait_data_rows,
+                              np.searchsorted(strain_ids, sample_ids))])
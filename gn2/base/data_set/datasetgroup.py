@@ -9,6 +9,7 @@ from .markers import Markers, HumanMarkers
 from gn2.utility import webqtlUtil
 from gn2.utility import gen_geno_ob
 from gn2.db import webqtlDatabaseFunction
+from gn2.base.reference_data import inbred_set
 from gn2.maintenance import get_group_samplelists
 from gn2.wqflask.database import database_connection
 from gn2.utility.tools import (
@@ -30,23 +31,19 @@ class DatasetGroup:
 
     def __init__(self, dataset, name=None):
         """This sets self.group and self.group_id"""
-        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-            if not name:
+        if not name:
+            with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
                 cursor.execute(dataset.query_for_group,
                                (dataset.name,))
-            else:
-                cursor.execute(
-                    "SELECT InbredSet.Name, "
-                    "InbredSet.Id, "
-                    "InbredSet.GeneticType, "
-                    "InbredSet.InbredSetCode "
-                    "FROM InbredSet WHERE Name = %s",
-                    (name,))
-            results = cursor.fetchone()
-            if results:
-                (self.name, self.id, self.genetic_type, self.code) = results
-            else:
-                self.name = name or dataset.name
+                results = cursor.fetchone()
+        else:
+            group = inbred_set(name)
+            results = group and tuple(group[column] for column in (
+                "Name", "Id", "GeneticType", "InbredSetCode"))
+        if results:
+            (self.name, self.id, self.genetic_type, self.code) = results
+        else:
+            self.name = name or dataset.name
         if self.name == 'BXD300':
             self.name = "BXD"
 
@@ -63,6 +60,28 @@ class DatasetGroup:
         self._datasets = None
         self.genofile = None
 
+    # Attributes looked up in the database when a group is created
+    METADATA_ATTRIBUTES = ("name", "id", "genetic_type", "code", "f1list",
+                           "parlist", "mapping_id", "mapping_names",
+                           "species")
+
+    def metadata(self):
+        """The attributes of the group read from the database on creation"""
+        return {attr: getattr(self, attr) for attr in self.METADATA_ATTRIBUTES
+                if hasattr(self, attr)}
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Create a group from `metadata`, as returned by `metadata()`,
+        without querying the database"""
+        group = cls.__new__(cls)
+        group.__dict__.update(metadata)
+        group.incparentsf1 = False
+        group.allsamples = None
+        group._datasets = None
+        group.genofile = None
+        return group
+
     def get_mapping_methods(self):
         mapping_id = ()
         with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
@@ -175,7 +194,8 @@ class DatasetGroup:
                 full_filename = str(locate(self.genofile, 'genotype'))
         else:
             full_filename = str(locate(self.name + '.geno', 'genotype'))
-        genotype_1 = gen_geno_ob.genotype(full_filename)
+        genotype_1 = gen_geno_ob.load_genotype(
+            full_filename, cache_dirs=(webqtlConfig.CACHEDIR,))
 
         if genotype_1.type == "group" and self.parlist:
             genotype_2 = genotype_1.add(
@@ -66,11 +66,38 @@ GenoFreeze.Name = %s"""
                  trait, self.name,))
             results = list(cursor.fetchall())
 
-        if self.group.name in webqtlUtil.ParInfo:
-            f1_1, f1_2, ref, nonref = webqtlUtil.ParInfo[self.group.name]
-            results.append([f1_1, 0, None, None, f1_1])
-            results.append([f1_2, 0, None, None, f1_2])
-            results.append([ref, -1, None, None, ref])
-            results.append([nonref, 1, None, None, nonref])
+        return results + self.parent_rows()
 
-        return results
+    def parent_rows(self):
+        """Rows for the parents and F1s of the group, added to the sample data
+        of every marker"""
+        if self.group.name not in webqtlUtil.ParInfo:
+            return []
+        f1_1, f1_2, ref, nonref = webqtlUtil.ParInfo[self.group.name]
+        return [[f1_1, 0, None, None, f1_1],
+                [f1_2, 0, None, None, f1_2],
+                [ref, -1, None, None, ref],
+                [nonref, 1, None, None, nonref]]
+
+    def sample_data_bulk_query(self, trait_names):
+        return (
+            "SELECT Geno.Name, Strain.Name, GenoData.value, "
+            "GenoSE.error, NULL, Strain.Name2 "
+            "FROM (GenoData, GenoFreeze, Strain, Geno, "
+            "GenoXRef) LEFT JOIN GenoSE ON "
+            "(GenoSE.DataId = GenoData.Id AND "
+            "GenoSE.StrainId = GenoData.StrainId) "
+            "WHERE Geno.SpeciesId = %s AND "
+            f"Geno.Name IN ({', '.join(['%s'] * len(trait_names))}) "
+            "AND GenoXRef.GenoId = Geno.Id "
+            "AND GenoXRef.GenoFreezeId = GenoFreeze.Id "
+            "AND GenoFreeze.Name = %s AND "
+            "GenoXRef.DataId = GenoData.Id "
+            "AND GenoData.StrainId = Strain.Id",
+            (webqtlDatabaseFunction.retrieve_species_id(self.group.name),
+             *trait_names, self.name))
+
+    def retrieve_sample_data_bulk(self, trait_names):
+        bulk = super().retrieve_sample_data_bulk(trait_names)
+        bulk.extra_rows = self.parent_rows()
+        return bulk
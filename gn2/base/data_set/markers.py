@@ -1,39 +1,189 @@
 "Base Class: Markers - "
 
-import math
+import numpy as np
 
+from gn2.base import webqtlConfig
+from gn2.utility.arrays import file_stamp
+from gn2.utility.arrays import index_positions
+from gn2.utility.arrays import read_array_file
+from gn2.utility.arrays import sidecar_paths
+from gn2.utility.arrays import write_array_file
 from gn2.utility.tools import locate, flat_files
 
+# Parsed marker files are cached in binary marker tables, next to the marker
+# file or in the cache directory. A table holds the names, chromosomes and Mb
+# positions of the markers in file order, plus the names in sorted order so
+# that markers can be looked up by name without reading the whole file. A
+# table records the mtime and size of its marker file and is ignored once
+# they no longer match.
+MARKER_TABLE_MAGIC = b"GN2MARK1"
+MARKER_TABLE_EXT = ".gn2markers"
+
+
+def __chromosome__(chr_name):
+    if chr_name in ("X", "Y", "M"):
+        return chr_name
+    return int(chr_name)
+
+
+class MarkerTable:
+    """The markers of a marker file as parallel arrays"""
+
+    def __init__(self, names, chrs, mbs, sorted_names=None, sorted_rows=None):
+        self.names = np.asanyarray(names)
+        self.chrs = np.asanyarray(chrs)
+        self.Mb = np.asanyarray(mbs, dtype=np.float64)
+        if sorted_rows is None:
+            sorted_rows = np.argsort(self.names, kind="stable")
+            sorted_names = self.names[sorted_rows]
+        self.sorted_names = sorted_names
+        self.sorted_rows = sorted_rows
+
+    @classmethod
+    def from_markers(cls, markers):
+        """Build a table from `(name, chr, Mb)` tuples"""
+        (names, chrs, mbs) = tuple(zip(*markers)) or ((), (), ())
+        return cls(np.array([name.encode("utf-8") for name in names],
+                            dtype=bytes),
+                   np.array([str(chr_name).encode("utf-8")
+                             for chr_name in chrs], dtype=bytes),
+                   np.array(mbs, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self, names):
+        """The rows of the markers called `names`, in file order. Names that
+        are not in the table are skipped."""
+        keys = np.array([name.encode("utf-8") for name in names], dtype=bytes)
+        if len(self) == 0 or keys.size == 0:
+            return np.array([], dtype=np.intp)
+        found = np.searchsorted(self.sorted_names, keys)
+        found[found == len(self)] = 0
+        found = found[self.sorted_names[found] == keys]
+        return np.unique(self.sorted_rows[found])
+
+    def marker_dicts(self, rows=None):
+        """The markers at `rows` (all of them by default) as
+        `{name, chr, Mb}` dicts"""
+        if rows is None:
+            rows = slice(None)
+        return [{"name": name, "Mb": mb, "chr": __chromosome__(chr_name)}
+                for (name, chr_name, mb) in zip(
+                    np.char.decode(self.names[rows], "utf-8").tolist(),
+                    np.char.decode(self.chrs[rows], "utf-8").tolist(),
+                    self.Mb[rows].tolist())]
+
+
+def write_marker_table(table, file_path, table_path):
+    """Write the MarkerTable `table`, read from `file_path`, to
+    `table_path`"""
+    return write_array_file(
+        table_path, MARKER_TABLE_MAGIC, {"source": file_stamp(file_path)},
+        [table.names, table.chrs, table.Mb, table.sorted_names,
+         np.asarray(table.sorted_rows, dtype=np.int64)])
+
+
+def read_marker_table(file_path, table_path):
+    """Load a MarkerTable from `table_path`; None if the table is missing,
+    unreadable or older than `file_path`"""
+    try:
+        (header, arrays) = read_array_file(table_path, MARKER_TABLE_MAGIC)
+    except (OSError, ValueError, KeyError):
+        return None
+    if header["source"] != file_stamp(file_path):
+        return None
+    return MarkerTable(*arrays)
+
+
+def load_marker_table(file_path, parse_markers, cache_dirs=()):
+    """Return the MarkerTable for the marker file `file_path`, from a fresh
+    table file if there is one. Otherwise `parse_markers(file_handle)`, which
+    yields `(name, chr, Mb)` tuples, is run over the file and the table is
+    written to the first writable location."""
+    paths = sidecar_paths(file_path, MARKER_TABLE_EXT, cache_dirs)
+    for table_path in paths:
+        table = read_marker_table(file_path, table_path)
+        if table is not None:
+            return table
+
+    with open(file_path, "r") as marker_fh:
+        table = MarkerTable.from_markers(list(parse_markers(marker_fh)))
+    for table_path in paths:
+        try:
+            write_marker_table(table, file_path, table_path)
+            break
+        except OSError:
+            continue
+    return table
+
+
+def parse_bimbam_snps(bimbam_fh):
+    """Yield `(name, chr, Mb)` for each marker in a BIMBAM SNP annotation
+    file. The delimiter is detected from the first line."""
+    first_line = bimbam_fh.readline()
+    for delimiter in (", ", ",", "\t", " "):
+        if len(first_line.split(delimiter)) > 2:
+            break
+    bimbam_fh.seek(0)
+    for line in bimbam_fh:
+        if not line.strip():
+            continue
+        (name, position, chr_name) = line.split(delimiter)[:3]
+        yield (name.rstrip(), chr_name.rstrip(), float(position) / 1000000)
+
+
+def parse_plink_bim(bim_fh):
+    """Yield `(name, chr, Mb)` for each marker in a PLINK .bim file"""
+    for line in bim_fh:
+        splat = line.split()
+        if splat:
+            yield (splat[1], splat[0], float(splat[3]) / 1000000)
+
+
 class Markers:
-    """Todo: Build in cacheing so it saves us reading the same file more than once"""
+    """The markers of a group, loaded through a cached MarkerTable. The
+    marker dicts are only built when `markers` is first used."""
 
     def __init__(self, name):
-        json_data_fh = open(locate(name + ".json", 'genotype/json'))
-
-        markers = []
-        with open("%s/%s_snps.txt" % (flat_files('genotype/bimbam'), name), 'r') as bimbam_fh:
-            if len(bimbam_fh.readline().split(", ")) > 2:
-                delimiter = ", "
-            elif len(bimbam_fh.readline().split(",")) > 2:
-                delimiter = ","
-            elif len(bimbam_fh.readline().split("\t")) > 2:
-                delimiter = "\t"
-            else:
-                delimiter = " "
-            for line in bimbam_fh:
-                marker = {}
-                marker['name'] = line.split(delimiter)[0].rstrip()
-                marker['Mb'] = float(line.split(delimiter)[
-                                     1].rstrip()) / 1000000
-                marker['chr'] = line.split(delimiter)[2].rstrip()
-                markers.append(marker)
-
-        for marker in markers:
-            if (marker['chr'] != "X") and (marker['chr'] != "Y") and (marker['chr'] != "M"):
-                marker['chr'] = int(marker['chr'])
-            marker['Mb'] = float(marker['Mb'])
-
-        self.markers = markers
+        locate(name + ".json", 'genotype/json')
+        self.table = load_marker_table(
+            "%s/%s_snps.txt" % (flat_files('genotype/bimbam'), name),
+            parse_bimbam_snps, cache_dirs=(webqtlConfig.CACHEDIR,))
+        self.rows = np.arange(len(self.table))
+        self._markers = None
+
+    @property
+    def markers(self):
+        if self._markers is None:
+            self._markers = self.table.marker_dicts(self.rows)
+        return self._markers
+
+    @markers.setter
+    def markers(self, markers):
+        self._markers = markers
+        self.rows = None
+
+    def __positions__(self, names):
+        """The positions in `markers` of the markers called `names`"""
+        if self.rows is not None:
+            positions = index_positions(self.rows, self.table.rows(names))
+            return positions[positions >= 0]
+        names = set(names)
+        return np.array([idx for (idx, marker) in enumerate(self.markers)
+                         if marker['name'] in names], dtype=np.intp)
+
+    @staticmethod
+    def __scores__(p_values):
+        """Return the lod scores and LRS values for `p_values`, along with a
+        mask of the p-values the scores were computed for; NaN and
+        non-positive p-values score 0"""
+        p_values = np.asarray(p_values, dtype=np.float64)
+        valid = p_values > 0
+        lod_scores = np.zeros_like(p_values)
+        lod_scores[valid] = -np.log10(p_values[valid])
+        # Using -log(p) for the LRS; need to ask Rob how he wants to get LRS from p-values
+        return (lod_scores, lod_scores * 4.61, valid)
 
     def add_pvalues(self, p_values):
         if isinstance(p_values, list):
@@ -41,56 +191,44 @@ class Markers:
             # if len(self.markers) > len(p_values):
             #    self.markers = self.markers[:len(p_values)]
 
-            for marker, p_value in zip(self.markers, p_values):
-                if not p_value:
-                    continue
-                marker['p_value'] = float(p_value)
-                if math.isnan(marker['p_value']) or marker['p_value'] <= 0:
-                    marker['lod_score'] = 0
-                    marker['lrs_value'] = 0
-                else:
-                    marker['lod_score'] = -math.log10(marker['p_value'])
-                    # Using -log(p) for the LRS; need to ask Rob how he wants to get LRS from p-values
-                    marker['lrs_value'] = -math.log10(marker['p_value']) * 4.61
+            markers = self.markers
+            positions = [idx for (idx, p_value) in enumerate(
+                p_values[:len(markers)]) if p_value]
+            values = [float(p_values[idx]) for idx in positions]
         elif isinstance(p_values, dict):
-            filtered_markers = []
-            for marker in self.markers:
-                if marker['name'] in p_values:
-                    marker['p_value'] = p_values[marker['name']]
-                    if math.isnan(marker['p_value']) or (marker['p_value'] <= 0):
-                        marker['lod_score'] = 0
-                        marker['lrs_value'] = 0
-                    else:
-                        marker['lod_score'] = -math.log10(marker['p_value'])
-                        # Using -log(p) for the LRS; need to ask Rob how he wants to get LRS from p-values
-                        marker['lrs_value'] = - \
-                            math.log10(marker['p_value']) * 4.61
-                    filtered_markers.append(marker)
-            self.markers = filtered_markers
+            positions = self.__positions__(list(p_values)).tolist()
+            rows = None if self.rows is None else self.rows[positions]
+            markers = self.markers
+            values = [p_values[markers[idx]['name']] for idx in positions]
+        else:
+            return
+
+        (lod_scores, lrs_values, valid) = self.__scores__(values)
+        for (idx, p_value, lod_score, lrs_value, is_valid) in zip(
+                positions, values, lod_scores.tolist(), lrs_values.tolist(),
+                valid.tolist()):
+            marker = markers[idx]
+            marker['p_value'] = p_value
+            marker['lod_score'] = lod_score if is_valid else 0
+            marker['lrs_value'] = lrs_value if is_valid else 0
+
+        if isinstance(p_values, dict):
+            self.markers = [markers[idx] for idx in positions]
+            self.rows = rows
 
 
 class HumanMarkers(Markers):
     "Markers for humans ..."
 
     def __init__(self, name, specified_markers=[]):
-        marker_data_fh = open(flat_files('mapping') + '/' + name + '.bim')
-        self.markers = []
-        for line in marker_data_fh:
-            splat = line.strip().split()
-            if len(specified_markers) > 0:
-                if splat[1] in specified_markers:
-                    marker = {}
-                    marker['chr'] = int(splat[0])
-                    marker['name'] = splat[1]
-                    marker['Mb'] = float(splat[3]) / 1000000
-                else:
-                    continue
-            else:
-                marker = {}
-                marker['chr'] = int(splat[0])
-                marker['name'] = splat[1]
-                marker['Mb'] = float(splat[3]) / 1000000
-            self.markers.append(marker)
+        self.table = load_marker_table(
+            flat_files('mapping') + '/' + name + '.bim',
+            parse_plink_bim, cache_dirs=(webqtlConfig.CACHEDIR,))
+        if len(specified_markers) > 0:
+            self.rows = self.table.rows(specified_markers)
+        else:
+            self.rows = np.arange(len(self.table))
+        self._markers = None
 
     def add_pvalues(self, p_values):
         super(HumanMarkers, self).add_pvalues(p_values)
@@ -168,6 +168,26 @@ ProbeFreeze.Id = ProbeSetFreeze.ProbeFreezeId AND ProbeSetFreeze.Name = %s"""
             )
             return cursor.fetchall()
 
+    def sample_data_bulk_query(self, trait_names):
+        return (
+            "SELECT ProbeSet.Name, Strain.Name, ProbeSetData.value, "
+            "ProbeSetSE.error, NStrain.count, "
+            "Strain.Name2 FROM (ProbeSetData, "
+            "ProbeSetFreeze, Strain, ProbeSet, "
+            "ProbeSetXRef) LEFT JOIN ProbeSetSE ON "
+            "(ProbeSetSE.DataId = ProbeSetData.Id AND "
+            "ProbeSetSE.StrainId = ProbeSetData.StrainId) "
+            "LEFT JOIN NStrain ON "
+            "(NStrain.DataId = ProbeSetData.Id AND "
+            "NStrain.StrainId = ProbeSetData.StrainId) "
+            f"WHERE ProbeSet.Name IN ({', '.join(['%s'] * len(trait_names))}) "
+            "AND ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+            "AND ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
+            "AND ProbeSetFreeze.Name = %s AND "
+            "ProbeSetXRef.DataId = ProbeSetData.Id "
+            "AND ProbeSetData.StrainId = Strain.Id",
+            (*trait_names, self.name))
+
     def retrieve_genes(self, column_name):
         with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
             cursor.execute(
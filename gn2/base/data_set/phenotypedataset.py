@@ -132,3 +132,22 @@ SELECT InbredSet.Name, InbredSet.Id, InbredSet.GeneticType, InbredSet.InbredSetC
                 "AND PublishData.StrainId = Strain.Id "
                 "ORDER BY Strain.Name", (trait, self.id))
             return cursor.fetchall()
+
+    def sample_data_bulk_query(self, trait_names):
+        return (
+            "SELECT PublishXRef.Id, Strain.Name, PublishData.value, "
+            "PublishSE.error, NStrain.count, "
+            "Strain.Name2 FROM (PublishData, Strain, "
+            "PublishXRef, PublishFreeze) LEFT JOIN "
+            "PublishSE ON "
+            "(PublishSE.DataId = PublishData.Id "
+            "AND PublishSE.StrainId = PublishData.StrainId) "
+            "LEFT JOIN NStrain ON "
+            "(NStrain.DataId = PublishData.Id AND "
+            "NStrain.StrainId = PublishData.StrainId) "
+            "WHERE PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+            "AND PublishData.Id = PublishXRef.DataId AND "
+            f"PublishXRef.Id IN ({', '.join(['%s'] * len(trait_names))}) "
+            "AND PublishFreeze.Id = %s "
+            "AND PublishData.StrainId = Strain.Id",
+            (*trait_names, self.id))
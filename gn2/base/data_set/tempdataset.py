@@ -1,7 +1,10 @@
 "TempDataSet class ..."
 
+from gn2.utility.redis_tools import get_redis_conn
 from .dataset import DataSet
 
+Redis = get_redis_conn()
+
 class TempDataSet(DataSet):
     """Temporary user-generated data set"""
 
@@ -21,3 +24,16 @@ class TempDataSet(DataSet):
         self.id = 1
         self.fullname = 'Temporary Storage'
         self.shortname = 'Temp'
+
+    def retrieve_sample_data(self, trait):
+        """The `(sample, value, error, count, name2)` rows of the temporary
+        trait `trait`, whose values are kept in Redis in the order of the
+        group's samples"""
+        rows = []
+        values = Redis.get(trait).split()
+        for (sample, value) in zip(self.group.all_samples_ordered(), values):
+            try:
+                rows.append((sample, float(value), None, None, None))
+            except ValueError:
+                continue
+        return rows
@@ -1,16 +1,41 @@
 "data_set package utilities"
 
-import datetime
 import os
-import json
+import copy
+import time
+import pickle
 import hashlib
+import collections
 from typing import List
 
+import numpy as np
 
-from gn2.utility.tools import get_setting, SQL_URI
+from gn2.utility.tools import get_setting, get_setting_int, SQL_URI
+from gn2.utility.redis_tools import get_redis_conn, DATASETS_GENERATION
+from gn2.utility.file_cache import mark_used, evict_least_recently_used
 from gn2.base.webqtlConfig import TMPDIR
 from gn2.wqflask.database import parse_db_url, database_connection
 
+DATASET_CACHE_DIR = os.path.join(TMPDIR, "dataset_cache")
+# hits, misses and evictions of the dataset results cache in this process
+DATASET_CACHE_STATS = collections.Counter()
+# dataset type -> (UPDATE_TIME of its data table, datasets generation,
+# expiry time)
+TABLE_TIMESTAMPS = {}
+# (dataset type, dataset name) -> (metadata of the dataset, datasets
+# generation, expiry time)
+DATASET_METADATA = {}
+
+Redis = get_redis_conn()
+
+
+def datasets_generation():
+    """The generation of the datasets, moved on by
+    `gn2.utility.redis_tools.datasets_changed` whenever datasets are edited in
+    any process. Memoized values from other generations are not used."""
+    return Redis.get(DATASETS_GENERATION)
+
+
 def geno_mrna_confidentiality(ob):
     with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
         cursor.execute(
@@ -23,7 +48,18 @@ def geno_mrna_confidentiality(ob):
             return True
 
 def query_table_timestamp(dataset_type: str):
-    """function to query the update timestamp of a given dataset_type"""
+    """function to query the update timestamp of a given dataset_type
+
+    Returns None when the server does not know when the table was last
+    updated: UPDATE_TIME is NULL for InnoDB tables until they are written to
+    after a restart. The timestamps are memoized in-process for
+    `TABLE_TIMESTAMP_TTL` seconds, or until datasets are edited, since this
+    is queried on every dataset cache lookup."""
+    generation = datasets_generation()
+    (timestamp, cached_generation, expires) = TABLE_TIMESTAMPS.get(
+        dataset_type, (None, None, 0))
+    if cached_generation == generation and time.monotonic() < expires:
+        return timestamp
 
     # computation data and actions
     with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
@@ -34,47 +70,93 @@ def query_table_timestamp(dataset_type: str):
             f"WHERE TABLE_SCHEMA = '{fetch_db_name[3]}' "
             f"AND TABLE_NAME = '{dataset_type}Data'")
         date_time_obj = cursor.fetchone()[0]
-        if not date_time_obj:
-            date_time_obj = datetime.datetime.now()
-        return date_time_obj.strftime("%Y-%m-%d %H:%M:%S")
-
-
-def generate_hash_file(dataset_name: str, dataset_type: str, dataset_timestamp: str, samplelist: str):
-    """given the trait_name generate a unique name for this"""
-    string_unicode = f"{dataset_name}{dataset_timestamp}{samplelist}".encode()
-    md5hash = hashlib.md5(string_unicode)
-    return md5hash.hexdigest()
-
-
-def cache_dataset_results(dataset_name: str, dataset_type: str, samplelist: List, query_results: List):
+        timestamp = (date_time_obj.strftime("%Y-%m-%d %H:%M:%S")
+                     if date_time_obj else None)
+
+    TABLE_TIMESTAMPS[dataset_type] = (
+        timestamp, generation,
+        time.monotonic() + get_setting_int("TABLE_TIMESTAMP_TTL"))
+    return timestamp
+
+
+def fetch_dataset_metadata(dataset_type: str, dataset_name: str):
+    """The metadata memoized by `cache_dataset_metadata` for the dataset, or
+    None if there is none, it is older than `DATASET_METADATA_TTL` seconds or
+    datasets were edited since. Each call returns a fresh copy, which the
+    caller is free to modify."""
+    (metadata, generation, expires) = DATASET_METADATA.get(
+        (dataset_type, dataset_name), (None, None, 0))
+    if generation == datasets_generation() and time.monotonic() < expires:
+        return copy.deepcopy(metadata)
+    return None
+
+
+def cache_dataset_metadata(dataset_type: str, dataset_name: str, metadata):
+    """Memoize the metadata of a dataset in-process, so that datasets are
+    not looked up in the database each time they are created"""
+    DATASET_METADATA[(dataset_type, dataset_name)] = (
+        copy.deepcopy(metadata), datasets_generation(),
+        time.monotonic() + get_setting_int("DATASET_METADATA_TTL"))
+
+
+def dataset_cache_path(dataset_name: str, dataset_timestamp: str, samplelist: List):
+    """Path of the cached results for the dataset at the given timestamp,
+    restricted to the given samples. Results cached while the timestamp is
+    unknown (None) share one entry, which is replaced once the table has a
+    timestamp again or evicted when it is least recently used."""
+    samplelist_hash = hashlib.md5(",".join(samplelist).encode()).hexdigest()
+    key = hashlib.md5(
+        f"{dataset_name}:{dataset_timestamp or 'unknown'}:"
+        f"{samplelist_hash}".encode())
+    return os.path.join(DATASET_CACHE_DIR, f"{key.hexdigest()}.pkl")
+
+
+def evict_dataset_cache(max_bytes: int):
+    """Delete the least recently used cached results until the cache holds at
+    most `max_bytes`"""
+    with os.scandir(DATASET_CACHE_DIR) as cache_dir:
+        entries = [[entry.path] for entry in cache_dir
+                   if entry.name.endswith(".pkl")]
+    evicted = evict_least_recently_used(entries, max_bytes)
+    if evicted:
+        DATASET_CACHE_STATS["evictions"] += evicted
+
+
+def cache_dataset_results(dataset_name: str, dataset_type: str,
+                          samplelist: List, trait_names: List, trait_matrix):
     """function to cache dataset query results to file
-    input dataset_name and type query_results(already processed in default dict format)
+    input dataset_name and type, and the trait names and traits x samples
+    matrix of values fetched for the samples in samplelist
     """
-    # data computations actions
-    # store the file path on redis
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    file_path = dataset_cache_path(
+        dataset_name, query_table_timestamp(dataset_type), samplelist)
 
-    table_timestamp = query_table_timestamp(dataset_type)
-    samplelist_as_str = ",".join(samplelist)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file_handler:
+        pickle.dump((list(trait_names), np.asarray(trait_matrix, dtype=float)),
+                    file_handler, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, file_path)
 
-    file_name = generate_hash_file(dataset_name, dataset_type, table_timestamp, samplelist_as_str)
-    file_path = os.path.join(TMPDIR, f"{file_name}.json")
-
-    with open(file_path, "w") as file_handler:
-        json.dump(query_results, file_handler)
+    evict_dataset_cache(get_setting_int("DATASET_CACHE_MAX_BYTES"))
 
 
 def fetch_cached_results(dataset_name: str, dataset_type: str, samplelist: List):
-    """function to fetch the cached results"""
-
-    table_timestamp = query_table_timestamp(dataset_type)
-    samplelist_as_str = ",".join(samplelist)
-
-    file_name = generate_hash_file(dataset_name, dataset_type, table_timestamp, samplelist_as_str)
-    file_path = os.path.join(TMPDIR, f"{file_name}.json")
+    """function to fetch the cached results: the trait names and the matrix
+    of values, or None if nothing is cached"""
+    file_path = dataset_cache_path(
+        dataset_name, query_table_timestamp(dataset_type), samplelist)
     try:
-        with open(file_path, "r") as file_handler:
-
-            return json.load(file_handler)
-
-    except Exception:
-        pass
+        with open(file_path, "rb") as file_handler:
+            results = pickle.load(file_handler)
+    except FileNotFoundError:
+        DATASET_CACHE_STATS["misses"] += 1
+        return None
+    except (pickle.UnpicklingError, EOFError, ValueError):
+        DATASET_CACHE_STATS["misses"] += 1
+        os.unlink(file_path)
+        return None
+
+    DATASET_CACHE_STATS["hits"] += 1
+    mark_used(file_path)
+    return results
@@ -0,0 +1,135 @@
+"""Reference data: the species, their chromosomes and strains, and the groups
+(InbredSets), memoized in-process
+
+These tables are small and rarely change, but are looked up over and over:
+chromosome lengths for every mapping and heatmap, strain ids whenever a
+dataset's values are fetched. They are all loaded at once, the first time any
+of them is needed, and kept for the life of the process. The tables'
+UPDATE_TIMEs are the version stamp of the data: they are checked at most every
+`REFERENCE_DATA_TTL` seconds, and the data is reloaded when they change."""
+
+import time
+import threading
+from typing import Optional
+
+from gn2.utility.tools import get_setting, get_setting_int
+from gn2.wqflask.database import database_connection
+
+REFERENCE_TABLES = ("Species", "Chr_Length", "Strain", "InbredSet")
+
+# The loaded `ReferenceData` and when its stamp is next checked
+REFERENCE_DATA = {}
+__reload_lock__ = threading.Lock()
+
+
+class ReferenceData:
+    """The reference tables, as loaded at version `stamp`"""
+
+    def __init__(self, stamp, species, chromosomes, strains, inbred_sets):
+        self.stamp = stamp
+        # (Id, SpeciesId, Name) by lower-cased species name
+        self.species = species
+        # [(Name, Length)] in OrderId order, by Chr_Length.SpeciesId
+        self.chromosomes = chromosomes
+        # {Name: Id} by Strain.SpeciesId
+        self.strains = strains
+        # The InbredSet row, as a dict, by lower-cased group name
+        self.inbred_sets = inbred_sets
+
+
+def reference_stamp(cursor, tables=REFERENCE_TABLES):
+    """The version stamp of `tables` (by default, the reference tables):
+    their UPDATE_TIMEs"""
+    cursor.execute(
+        "SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.tables "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN "
+        f"({', '.join(['%s'] * len(tables))})", tuple(tables))
+    return tuple(sorted((name, str(update_time))
+                        for (name, update_time) in cursor.fetchall()))
+
+
+def load_reference_data(cursor, stamp) -> ReferenceData:
+    """Load all of the reference tables"""
+    cursor.execute("SELECT Id, SpeciesId, Name FROM Species")
+    species = {name.lower(): (species_id, chr_species_id, name)
+               for (species_id, chr_species_id, name) in cursor.fetchall()}
+
+    cursor.execute("SELECT SpeciesId, Name, Length FROM Chr_Length "
+                   "ORDER BY SpeciesId, OrderId")
+    chromosomes = {}
+    for (species_id, name, length) in cursor.fetchall():
+        chromosomes.setdefault(species_id, []).append((name, length))
+
+    cursor.execute("SELECT SpeciesId, Name, Id FROM Strain")
+    strains = {}
+    for (species_id, name, strain_id) in cursor.fetchall():
+        strains.setdefault(species_id, {})[name] = strain_id
+
+    cursor.execute("SELECT Name, Id, SpeciesId, GeneticType, InbredSetCode "
+                   "FROM InbredSet")
+    inbred_sets = {
+        row[0].lower(): dict(zip(
+            ("Name", "Id", "SpeciesId", "GeneticType", "InbredSetCode"), row))
+        for row in cursor.fetchall()}
+
+    return ReferenceData(stamp, species, chromosomes, strains, inbred_sets)
+
+
+def reference_data() -> ReferenceData:
+    """The reference data, loaded on first use and reloaded once the tables
+    have changed"""
+    (data, next_check) = REFERENCE_DATA.get("current", (None, 0))
+    if data is not None and time.monotonic() < next_check:
+        return data
+
+    with __reload_lock__:
+        (data, next_check) = REFERENCE_DATA.get("current", (None, 0))
+        if data is not None and time.monotonic() < next_check:
+            return data
+        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
+            stamp = reference_stamp(cursor)
+            if data is None or data.stamp != stamp:
+                data = load_reference_data(cursor, stamp)
+        REFERENCE_DATA["current"] = (
+            data, time.monotonic() + get_setting_int("REFERENCE_DATA_TTL"))
+    return data
+
+
+def clear_reference_data():
+    """Forget the reference data, e.g. after editing the tables"""
+    REFERENCE_DATA.clear()
+
+
+def inbred_set(group: str) -> Optional[dict]:
+    """The InbredSet row of the group called `group`, or None"""
+    return reference_data().inbred_sets.get(str(group).lower())
+
+
+def species_chromosomes(species: Optional[str] = None,
+                        group: Optional[str] = None) -> list:
+    """The `(name, length)` of the chromosomes of `species`, or of the species
+    of `group`, in order"""
+    data = reference_data()
+    if species is not None:
+        species_id = data.species.get(species.lower(), (None, None))[1]
+    else:
+        species_id = (inbred_set(group) or {}).get("SpeciesId")
+    return data.chromosomes.get(species_id, [])
+
+
+def group_species(group: str) -> Optional[str]:
+    """The name of the species of the group called `group`"""
+    species_id = (inbred_set(group) or {}).get("SpeciesId")
+    for (this_id, _chr_species_id, name) in reference_data().species.values():
+        if this_id == species_id:
+            return name
+    return None
+
+
+def strain_ids(species: str, names) -> dict:
+    """The ids of the strains of `species` called `names`, by name. Names that
+    are not strains of the species are left out."""
+    data = reference_data()
+    species_id = data.species.get(str(species).lower(), (None,))[0]
+    strains = data.strains.get(species_id, {})
+    return {name: strains[name] for name in names if name in strains}
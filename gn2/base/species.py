@@ -2,6 +2,8 @@ from dataclasses import dataclass
 from typing import Optional, Union
 from collections import OrderedDict
 
+from gn2.base.reference_data import species_chromosomes
+
 
 class TheSpecies:
     """Data related to species."""
@@ -36,24 +38,13 @@ class Chromosomes:
         if species is None:
             self.dataset = dataset
 
-    def chromosomes(self, db_cursor) -> OrderedDict:
-        """Lazily fetch the chromosomes"""
-        chromosomes = OrderedDict()
+    def chromosomes(self, db_cursor=None) -> OrderedDict:
+        """The chromosomes, from the memoized reference data. `db_cursor` is
+        no longer used."""
         if self.species is not None:
-            db_cursor.execute(
-                "SELECT Chr_Length.Name, Chr_Length.OrderId, Length "
-                "FROM Chr_Length, Species WHERE "
-                "Chr_Length.SpeciesId = Species.SpeciesId AND "
-                "Species.Name = %s "
-                "ORDER BY OrderId", (self.species.capitalize(),))
+            chromosomes = species_chromosomes(species=self.species)
         else:
-            db_cursor.execute(
-                "SELECT Chr_Length.Name, Chr_Length.OrderId, "
-                "Length FROM Chr_Length, InbredSet WHERE "
-                "Chr_Length.SpeciesId = InbredSet.SpeciesId AND "
-                "InbredSet.Name = "
-                "%s ORDER BY OrderId", (self.dataset.group.name,))
-        for name, _, length in db_cursor.fetchall():
-            chromosomes[name] = IndChromosome(
-                name=name, length=length)
-        return chromosomes
+            chromosomes = species_chromosomes(group=self.dataset.group.name)
+        return OrderedDict(
+            (name, IndChromosome(name=name, length=length))
+            for (name, length) in chromosomes)
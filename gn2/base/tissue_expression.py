@@ -0,0 +1,166 @@
+"""The tissue expression of every gene symbol, as one matrix kept on disk
+
+Tissue correlations compare genes by their expression across the tissues of
+the tissue dataset (TissueProbeSetFreezeId 1), taking for each symbol the
+probe set with the highest mean, as `MrnaAssayTissueData` does. Rather than
+query the expression of each correlation's symbols, the whole table is built
+once into a symbols x tissues matrix in `TISSUE_MATRIX_DIR`, which every
+process memory-maps, with an index of the lower-cased symbols.
+
+The tables' UPDATE_TIMEs are the version stamp of the matrix: they are
+checked at most every `TISSUE_MATRIX_TTL` seconds, and the matrix is rebuilt
+when they change."""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+
+import numpy as np
+
+from gn2.base.webqtlConfig import TMPDIR
+from gn2.base.reference_data import reference_stamp
+from gn2.utility.tools import get_setting, get_setting_int
+from gn2.wqflask.database import database_connection
+
+TISSUE_MATRIX_DIR = os.path.join(TMPDIR, "tissue_matrix")
+TISSUE_TABLES = ("TissueProbeSetXRef", "TissueProbeSetData")
+
+# The loaded `TissueMatrix` and when its stamp is next checked
+TISSUE_MATRIX = {}
+__reload_lock__ = threading.Lock()
+
+
+class TissueMatrix:
+    """The tissue expression values of each symbol, as of version `stamp`"""
+
+    def __init__(self, stamp, symbols, values):
+        self.stamp = stamp
+        # The lower-cased symbols, in the order of the rows of `values`
+        self.symbols = symbols
+        # symbols x tissues, NaN where a symbol has fewer values
+        self.values = values
+        self.rows = {symbol: row for (row, symbol) in enumerate(symbols)}
+
+    def positions(self, symbols):
+        """The rows of `symbols` (in any case), -1 for the symbols with no
+        tissue expression"""
+        return np.array([self.rows.get(str(symbol).lower(), -1)
+                         if symbol else -1 for symbol in symbols], dtype=int)
+
+    def values_for(self, symbol) -> Optional[np.ndarray]:
+        """The tissue expression values of `symbol`, or None"""
+        row = self.rows.get(str(symbol).lower(), -1) if symbol else -1
+        return None if row < 0 else self.values[row]
+
+
+def tissue_matrix_paths(stamp):
+    """The paths of the matrix and the symbols of version `stamp`"""
+    key = hashlib.md5(json.dumps(stamp).encode()).hexdigest()
+    return (os.path.join(TISSUE_MATRIX_DIR, f"{key}.npy"),
+            os.path.join(TISSUE_MATRIX_DIR, f"{key}.symbols.json"))
+
+
+def query_tissue_values(cursor):
+    """The tissue expression values of each lower-cased symbol, from the probe
+    set of the symbol with the highest mean"""
+    cursor.execute(
+        "SELECT t.Symbol, t.DataId, TissueProbeSetData.value FROM "
+        "(SELECT Symbol, max(Mean) AS maxmean "
+        "FROM TissueProbeSetXRef WHERE "
+        "TissueProbeSetFreezeId=1 AND "
+        "Symbol != '' AND Symbol IS NOT "
+        "Null GROUP BY Symbol) "
+        "AS x INNER JOIN "
+        "TissueProbeSetXRef AS t ON "
+        "t.Symbol = x.Symbol "
+        "AND t.Mean = x.maxmean "
+        "INNER JOIN TissueProbeSetData ON "
+        "TissueProbeSetData.Id = t.DataId "
+        "ORDER BY t.Symbol, t.DataId, TissueProbeSetData.TissueID")
+    symbol_values = {}
+    symbol_data_ids = {}
+    for (symbol, data_id, value) in cursor.fetchall():
+        symbol = symbol.lower()
+        # Where probe sets tie for the highest mean, keep the first
+        if symbol_data_ids.setdefault(symbol, data_id) == data_id:
+            symbol_values.setdefault(symbol, []).append(value)
+    return symbol_values
+
+
+def build_tissue_matrix(cursor, stamp) -> TissueMatrix:
+    """Build the matrix of version `stamp` from the database, and write it to
+    `TISSUE_MATRIX_DIR` in place of any older version"""
+    symbol_values = query_tissue_values(cursor)
+    symbols = list(symbol_values)
+    values = np.full(
+        (len(symbols),
+         max((len(vals) for vals in symbol_values.values()), default=0)),
+        np.nan)
+    for (row, symbol) in enumerate(symbols):
+        vals = symbol_values[symbol]
+        values[row, :len(vals)] = [
+            np.nan if value is None else value for value in vals]
+
+    os.makedirs(TISSUE_MATRIX_DIR, exist_ok=True)
+    (matrix_path, symbols_path) = tissue_matrix_paths(stamp)
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(symbols_path + tmp_suffix, "w") as symbols_file:
+        json.dump(symbols, symbols_file)
+    os.replace(symbols_path + tmp_suffix, symbols_path)
+    with open(matrix_path + tmp_suffix, "wb") as matrix_file:
+        np.save(matrix_file, values)
+    os.replace(matrix_path + tmp_suffix, matrix_path)
+
+    with os.scandir(TISSUE_MATRIX_DIR) as matrix_dir:
+        for entry in matrix_dir:
+            if (entry.path not in (matrix_path, symbols_path)
+                    and not entry.name.endswith(".tmp")):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+    return TissueMatrix(stamp, symbols, np.load(matrix_path, mmap_mode="r"))
+
+
+def read_tissue_matrix(stamp) -> Optional[TissueMatrix]:
+    """The matrix of version `stamp` written by `build_tissue_matrix`, mapped
+    into memory, or None if there is none"""
+    (matrix_path, symbols_path) = tissue_matrix_paths(stamp)
+    try:
+        with open(symbols_path) as symbols_file:
+            symbols = json.load(symbols_file)
+        values = np.load(matrix_path, mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        return None
+    if values.shape[0] != len(symbols):
+        return None
+    return TissueMatrix(stamp, symbols, values)
+
+
+def tissue_matrix() -> TissueMatrix:
+    """The tissue expression matrix, built on first use and rebuilt once the
+    tissue tables have changed"""
+    (matrix, next_check) = TISSUE_MATRIX.get("current", (None, 0))
+    if matrix is not None and time.monotonic() < next_check:
+        return matrix
+
+    with __reload_lock__:
+        (matrix, next_check) = TISSUE_MATRIX.get("current", (None, 0))
+        if matrix is not None and time.monotonic() < next_check:
+            return matrix
+        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
+            stamp = reference_stamp(cursor, TISSUE_TABLES)
+            if matrix is None or matrix.stamp != stamp:
+                matrix = (read_tissue_matrix(stamp)
+                          or build_tissue_matrix(cursor, stamp))
+        TISSUE_MATRIX["current"] = (
+            matrix, time.monotonic() + get_setting_int("TISSUE_MATRIX_TTL"))
+    return matrix
+
+
+def clear_tissue_matrix():
+    """Forget the loaded matrix, e.g. after editing the tissue tables"""
+    TISSUE_MATRIX.clear()
@@ -1,21 +1,45 @@
 import requests
+import numpy as np
 import simplejson as json
 from gn2.wqflask import app
 
 import gn2.utility.hmac as hmac
 from gn2.base import webqtlConfig
-from gn2.base.webqtlCaseData import webqtlCaseData
+from gn2.base.trait_sample_data import TraitSampleData
 from gn2.base.data_set import create_dataset
 from gn2.utility.authentication_tools import check_resource_availability
+from gn2.utility.authentication_tools import check_traits_availability
 from gn2.utility.tools import get_setting, GN2_BASE_URL
-from gn2.utility.redis_tools import get_redis_conn, get_resource_id
+from gn2.utility.redis_tools import get_resource_id
 
 from flask import g, request, url_for
 
 from gn2.wqflask.database import database_connection
 
 
-Redis = get_redis_conn()
+# Number of traits looked up per query by `retrieve_traits_info`
+TRAIT_QUERY_CHUNK = 1000
+
+# The columns of `PhenotypeDataSet.display_fields`
+PUBLISH_INFO_COLUMNS = (
+    "PublishXRef.Id, InbredSet.InbredSetCode, "
+    "Publication.PubMed_ID, "
+    "CAST(Phenotype.Pre_publication_description AS BINARY), "
+    "CAST(Phenotype.Post_publication_description AS BINARY), "
+    "CAST(Phenotype.Original_description AS BINARY), "
+    "CAST(Phenotype.Pre_publication_abbreviation AS BINARY), "
+    "CAST(Phenotype.Post_publication_abbreviation AS BINARY), "
+    "PublishXRef.mean, Phenotype.Lab_code, "
+    "Phenotype.Submitter, Phenotype.Owner, "
+    "Phenotype.Authorized_Users, "
+    "CAST(Publication.Authors AS BINARY), "
+    "CAST(Publication.Title AS BINARY), "
+    "CAST(Publication.Abstract AS BINARY), "
+    "CAST(Publication.Journal AS BINARY), "
+    "Publication.Volume, Publication.Pages, "
+    "Publication.Month, Publication.Year, "
+    "PublishXRef.Sequence, Phenotype.Units, "
+    "PublishXRef.comments")
 
 
 def create_trait(**kw):
@@ -63,6 +87,35 @@ def create_trait(**kw):
         return None
 
 
+def create_traits(dataset, names, get_qtl_info=False, get_sample_info=False):
+    """Create the traits called `names` in `dataset`, like `create_trait` but
+    in bulk: the user's access is checked in one batch, and the info (and, with
+    `get_qtl_info`, the QTL info) of all the traits is fetched with a few
+    set-based queries. Sample data is only retrieved with `get_sample_info`,
+    for all the traits at once with `retrieve_sample_data_bulk`.
+
+    Returns a dict of the traits by name, leaving out the traits the user
+    cannot access and those that are not in the database."""
+    permissions = check_traits_availability(
+        dataset, g.user_session.user_id, names)
+    names = [name for name in names
+             if permissions[name]['data'] != "no-access"]
+    sample_data = (dataset.retrieve_sample_data_bulk(names)
+                   if get_sample_info else None)
+    traits = {}
+    for name in names:
+        traits[str(name)] = GeneralTrait(
+            dataset=dataset, name=name, get_sample_info=get_sample_info,
+            sample_data=(None if sample_data is None
+                         else sample_data.rows(name)))
+    if dataset.type == "Temp":
+        return traits
+    found = {id(trait) for trait in retrieve_traits_info(
+        traits.values(), dataset, get_qtl_info=get_qtl_info)}
+    return {name: trait for (name, trait) in traits.items()
+            if id(trait) in found}
+
+
 class GeneralTrait:
     """
     Trait class defines a trait in webqtl, can be either Microarray,
@@ -82,7 +135,7 @@ class GeneralTrait:
         self.haveinfo = kw.get('haveinfo', False)
         # Blat sequence, available for ProbeSet
         self.sequence = kw.get('sequence')
-        self.data = kw.get('data', {})
+        self.data = TraitSampleData(kw.get('data', {}))
         self.view = True
 
         # Sets defaults
@@ -113,7 +166,10 @@ class GeneralTrait:
         # perhaps not all of the time So we could add a simple if
         # statement to short-circuit this if necessary
         if get_sample_info is not False:
-            self = retrieve_sample_data(self, self.dataset)
+            # `sample_data` holds rows already fetched for the trait, as
+            # returned by `retrieve_sample_data_bulk`
+            self = retrieve_sample_data(
+                self, self.dataset, results=kw.get("sample_data"))
 
     def export_informative(self, include_variance=0):
         """
@@ -121,17 +177,17 @@ class GeneralTrait:
         mostly used in qtl regression
 
         """
-        samples = []
-        vals = []
-        the_vars = []
-        sample_aliases = []
-        for sample_name, sample_data in list(self.data.items()):
-            if sample_data.value is not None:
-                if not include_variance or sample_data.variance is not None:
-                    samples.append(sample_name)
-                    vals.append(sample_data.value)
-                    the_vars.append(sample_data.variance)
-                    sample_aliases.append(sample_data.name2)
+        values = self.data.values_for()
+        variances = self.data.variances_for()
+        informative = ~np.isnan(values)
+        if include_variance:
+            informative &= ~np.isnan(variances)
+        positions = np.flatnonzero(informative)
+        samples = [self.data.samples[position] for position in positions]
+        vals = values[positions].tolist()
+        the_vars = [None if np.isnan(variance) else variance
+                    for variance in variances[positions].tolist()]
+        sample_aliases = [self.data.names2[position] for position in positions]
         return samples, vals, the_vars, sample_aliases
 
     @property
@@ -225,32 +281,20 @@ class GeneralTrait:
         return fmt
 
 
-def retrieve_sample_data(trait, dataset, samplelist=None):
+def retrieve_sample_data(trait, dataset, samplelist=None, results=None):
     if samplelist is None:
         samplelist = []
 
-    if dataset.type == "Temp":
-        results = Redis.get(trait.name).split()
-    else:
+    if results is None:
         results = dataset.retrieve_sample_data(trait.name)
-    # Todo: is this necessary? If not remove
-    trait.data.clear()
-
+    rows = []
     if results:
-        if dataset.type == "Temp":
-            all_samples_ordered = dataset.group.all_samples_ordered()
-            for i, item in enumerate(results):
-                try:
-                    trait.data[all_samples_ordered[i]] = webqtlCaseData(
-                        all_samples_ordered[i], float(item))
-                except:
-                    pass
-        else:
-            for item in results:
-                name, value, variance, num_cases, name2 = item
-                if not samplelist or (samplelist and name in samplelist):
-                    # name, value, variance, num_cases)
-                    trait.data[name] = webqtlCaseData(*item)
+        for item in results:
+            name, value, variance, num_cases, name2 = item
+            if not samplelist or (samplelist and name in samplelist):
+                # name, value, variance, num_cases)
+                rows.append(item)
+    trait.data = TraitSampleData.from_rows(rows)
     return trait
 
 
@@ -398,24 +442,7 @@ def retrieve_trait_info(trait, dataset, get_qtl_info=False):
         trait_info = ()
         if dataset.type == 'Publish':
             cursor.execute(
-                "SELECT PublishXRef.Id, InbredSet.InbredSetCode, "
-                "Publication.PubMed_ID, "
-                "CAST(Phenotype.Pre_publication_description AS BINARY), "
-                "CAST(Phenotype.Post_publication_description AS BINARY), "
-                "CAST(Phenotype.Original_description AS BINARY), "
-                "CAST(Phenotype.Pre_publication_abbreviation AS BINARY), "
-                "CAST(Phenotype.Post_publication_abbreviation AS BINARY), "
-                "PublishXRef.mean, Phenotype.Lab_code, "
-                "Phenotype.Submitter, Phenotype.Owner, "
-                "Phenotype.Authorized_Users, "
-                "CAST(Publication.Authors AS BINARY), "
-                "CAST(Publication.Title AS BINARY), "
-                "CAST(Publication.Abstract AS BINARY), "
-                "CAST(Publication.Journal AS BINARY), "
-                "Publication.Volume, Publication.Pages, "
-                "Publication.Month, Publication.Year, "
-                "PublishXRef.Sequence, Phenotype.Units, "
-                "PublishXRef.comments FROM PublishXRef, Publication, "
+                f"SELECT {PUBLISH_INFO_COLUMNS} FROM PublishXRef, Publication, "
                 "Phenotype, PublishFreeze, InbredSet WHERE "
                 "PublishXRef.Id = %s AND "
                 "Phenotype.Id = PublishXRef.PhenotypeId "
@@ -465,153 +492,262 @@ def retrieve_trait_info(trait, dataset, get_qtl_info=False):
             )
             trait_info = cursor.fetchone()
 
-        if trait_info:
-            trait.haveinfo = True
-            for i, field in enumerate(dataset.display_fields):
-                holder = trait_info[i]
-                if isinstance(holder, bytes):
-                    holder = holder.decode("utf-8", errors="ignore")
-                setattr(trait, field, holder)
-
-            if dataset.type == 'Publish':
-                if trait.group_code:
-                    trait.display_name = trait.group_code + "_" + str(trait.name)
-
-                trait.confidential = 0
-                if trait.pre_publication_description and not trait.pubmed_id:
-                    trait.confidential = 1
-
-                description = trait.post_publication_description
-
-                # If the dataset is confidential and the user has access to confidential
-                # phenotype traits, then display the pre-publication description instead
-                # of the post-publication description
-                trait.description_display = "N/A"
-                trait.abbreviation = "N/A"
-                if not trait.pubmed_id:
-                    if trait.pre_publication_abbreviation:
-                        trait.abbreviation = trait.pre_publication_abbreviation
-                    if trait.pre_publication_description:
-                        trait.description_display = trait.pre_publication_description
-                else:
-                    if trait.post_publication_abbreviation:
-                        trait.abbreviation = trait.post_publication_abbreviation
-                    if description:
-                        trait.description_display = description.strip()
-
-                if not trait.year.isdigit():
-                    trait.pubmed_text = "N/A"
-                else:
-                    trait.pubmed_text = trait.year
-
-                if trait.pubmed_id:
-                    trait.pubmed_link = webqtlConfig.PUBMEDLINK_URL % trait.pubmed_id
-
-            if dataset.type == 'ProbeSet' and dataset.group:
-                description_string = trait.description
-                target_string = trait.probe_target_description
-
-                if str(description_string or "") != "" and description_string != 'None':
-                    description_display = description_string
-                else:
-                    description_display = trait.symbol
-
-                if (str(description_display or "") != ""
-                    and description_display != 'N/A'
-                        and str(target_string or "") != "" and target_string != 'None'):
-                    description_display = description_display + '; ' + target_string.strip()
-
-                # Save it for the jinja2 template
-                trait.description_display = description_display
-
-                trait.location_repr = 'N/A'
-                if trait.chr and trait.mb:
-                    trait.location_repr = 'Chr%s: %.6f' % (
-                        trait.chr, float(trait.mb))
-
-            elif dataset.type == "Geno":
-                trait.location_repr = 'N/A'
-                if trait.chr and trait.mb:
-                    trait.location_repr = 'Chr%s: %.6f' % (
-                        trait.chr, float(trait.mb))
-
-            if get_qtl_info:
-                # LRS and its location
-                trait.LRS_score_repr = "N/A"
-                trait.LRS_location_repr = "N/A"
-                trait.locus = trait.locus_chr = trait.locus_mb = trait.lrs = trait.pvalue = trait.additive = ""
-                if dataset.type == 'ProbeSet' and not trait.cellid:
-                    trait.mean = ""
-                    cursor.execute(
-                        "SELECT ProbeSetXRef.Locus, ProbeSetXRef.LRS, "
-                        "ProbeSetXRef.pValue, ProbeSetXRef.mean, "
-                        "ProbeSetXRef.additive FROM ProbeSetXRef, "
-                        "ProbeSet WHERE "
-                        "ProbeSetXRef.ProbeSetId = ProbeSet.Id "
-                        "AND ProbeSet.Name = %s AND "
-                        "ProbeSetXRef.ProbeSetFreezeId = %s",
-                        (trait.name, dataset.id,)
-                    )
-                    trait_qtl = cursor.fetchone()
-                    if any(trait_qtl):
-                        trait.locus, trait.lrs, trait.pvalue, trait.mean, trait.additive = trait_qtl
-                        if trait.locus:
-                            cursor.execute(
-                                "SELECT Geno.Chr, Geno.Mb FROM "
-                                "Geno, Species WHERE "
-                                "Species.Name = %s AND "
-                                "Geno.Name = %s AND "
-                                "Geno.SpeciesId = Species.Id",
-                                (dataset.group.species, trait.locus,)
-                            )
-                            if result := cursor.fetchone() :
-                                trait.locus_chr = result[0]
-                                trait.locus_mb = result[1]
-                            else:
-                                trait.locus_chr = trait.locus_mb = ""
-                        else:
-                            trait.locus = trait.locus_chr = trait.locus_mb = trait.additive = ""
-
-                if dataset.type == 'Publish':
-                    cursor.execute(
-                        "SELECT PublishXRef.Locus, PublishXRef.LRS, "
-                        "PublishXRef.additive FROM "
-                        "PublishXRef, PublishFreeze WHERE "
-                        "PublishXRef.Id = %s AND "
-                        "PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
-                        "AND PublishFreeze.Id = %s", (trait.name, dataset.id,)
-                    )
-                    if trait_qtl := cursor.fetchone():
-                        trait.locus, trait.lrs, trait.additive = trait_qtl
-                        if trait.locus:
-                            cursor.execute(
-                                "SELECT Geno.Chr, Geno.Mb FROM Geno, "
-                                "Species WHERE Species.Name = %s "
-                                "AND Geno.Name = %s AND "
-                                "Geno.SpeciesId = Species.Id",
-                                (dataset.group.species, trait.locus,)
-                            )
-                            if result := cursor.fetchone():
-                                trait.locus_chr = result[0]
-                                trait.locus_mb = result[1]
-                            else:
-                                trait.locus = trait.locus_chr = trait.locus_mb = trait.additive = ""
-                        else:
-                            trait.locus = trait.locus_chr = trait.locus_mb = trait.additive = ""
-                    else:
-                        trait.locus = trait.lrs = trait.additive = ""
-                if (dataset.type == 'Publish' or dataset.type == "ProbeSet"):
-                    if str(trait.locus_chr or "") != "" and str(trait.locus_mb or "") != "":
-                        trait.LRS_location_repr = LRS_location_repr = 'Chr%s: %.6f' % (
-                            trait.locus_chr, float(trait.locus_mb))
-                    if str(trait.lrs or "") != "":
-                        trait.LRS_score_repr = LRS_score_repr = '%3.1f' % trait.lrs
-        else:
+        if not trait_info:
             raise KeyError(
                 f"{repr(trait.name)} information is not found in the database "
                 f"for dataset '{dataset.name}' with id '{dataset.id}'.")
+        __set_trait_info__(trait, dataset, trait_info)
+
+        if get_qtl_info:
+            trait_qtl = None
+            locus_positions = {}
+            if dataset.type == 'ProbeSet' and not trait.cellid:
+                cursor.execute(
+                    "SELECT ProbeSetXRef.Locus, ProbeSetXRef.LRS, "
+                    "ProbeSetXRef.pValue, ProbeSetXRef.mean, "
+                    "ProbeSetXRef.additive FROM ProbeSetXRef, "
+                    "ProbeSet WHERE "
+                    "ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+                    "AND ProbeSet.Name = %s AND "
+                    "ProbeSetXRef.ProbeSetFreezeId = %s",
+                    (trait.name, dataset.id,)
+                )
+                trait_qtl = cursor.fetchone()
+            elif dataset.type == 'Publish':
+                cursor.execute(
+                    "SELECT PublishXRef.Locus, PublishXRef.LRS, "
+                    "PublishXRef.additive FROM "
+                    "PublishXRef, PublishFreeze WHERE "
+                    "PublishXRef.Id = %s AND "
+                    "PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+                    "AND PublishFreeze.Id = %s", (trait.name, dataset.id,)
+                )
+                trait_qtl = cursor.fetchone()
+            if trait_qtl and trait_qtl[0]:
+                cursor.execute(
+                    "SELECT Geno.Chr, Geno.Mb FROM Geno, "
+                    "Species WHERE Species.Name = %s "
+                    "AND Geno.Name = %s AND "
+                    "Geno.SpeciesId = Species.Id",
+                    (dataset.group.species, trait_qtl[0],)
+                )
+                if result := cursor.fetchone():
+                    locus_positions[trait_qtl[0]] = result
+            __set_trait_qtl__(trait, dataset, trait_qtl, locus_positions)
         return trait
 
+
+def __chunks__(items):
+    for start in range(0, len(items), TRAIT_QUERY_CHUNK):
+        yield items[start:start + TRAIT_QUERY_CHUNK]
+
+
+def __placeholders__(items):
+    return ", ".join(["%s"] * len(items))
+
+
+def retrieve_traits_info(traits, dataset, get_qtl_info=False):
+    """Set the info of each of `traits` in `dataset`, as `retrieve_trait_info`
+    does for a single trait, with a few queries for every `TRAIT_QUERY_CHUNK`
+    traits. Returns the traits that were found in the database."""
+    if not dataset:
+        raise ValueError("Dataset doesn't exist")
+
+    traits_by_name = {str(trait.name): trait for trait in traits}
+    found = {}
+    with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
+        for names in __chunks__(list(traits_by_name)):
+            if dataset.type == 'Publish':
+                cursor.execute(
+                    f"SELECT {PUBLISH_INFO_COLUMNS} FROM PublishXRef, "
+                    "Publication, Phenotype, PublishFreeze, InbredSet WHERE "
+                    f"PublishXRef.Id IN ({__placeholders__(names)}) AND "
+                    "Phenotype.Id = PublishXRef.PhenotypeId "
+                    "AND Publication.Id = PublishXRef.PublicationId "
+                    "AND PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+                    "AND PublishXRef.InbredSetId = InbredSet.Id AND "
+                    "PublishFreeze.Id = %s",
+                    (*names, dataset.id))
+            elif dataset.type in ('ProbeSet', 'Geno'):
+                display_fields_string = ", ".join(
+                    f"{dataset.type}.{field}" for field in dataset.display_fields)
+                cursor.execute(
+                    "SELECT {1} FROM {0}, {0}Freeze, {0}XRef WHERE "
+                    "{0}XRef.{0}FreezeId = {0}Freeze.Id "
+                    "AND {0}XRef.{0}Id = {0}.Id AND {0}Freeze.Name = %s "
+                    "AND {0}.Name IN ({2})".format(
+                        dataset.type, display_fields_string,
+                        __placeholders__(names)),
+                    (dataset.name, *names))
+            else:  # Temp type
+                cursor.execute(
+                    f"SELECT {','.join(dataset.display_fields)} "
+                    f"FROM {dataset.type} WHERE Name IN "
+                    f"({__placeholders__(names)})",
+                    names)
+            # The first column is the trait's name (or PublishXRef.Id)
+            for trait_info in cursor.fetchall():
+                name = str(trait_info[0])
+                if name in traits_by_name and name not in found:
+                    __set_trait_info__(traits_by_name[name], dataset, trait_info)
+                    found[name] = traits_by_name[name]
+
+        if get_qtl_info:
+            trait_qtls = {}
+            if dataset.type == 'ProbeSet':
+                qtl_names = [name for (name, trait) in found.items()
+                             if not trait.cellid]
+                qtl_query = (
+                    "SELECT ProbeSet.Name, ProbeSetXRef.Locus, "
+                    "ProbeSetXRef.LRS, ProbeSetXRef.pValue, "
+                    "ProbeSetXRef.mean, ProbeSetXRef.additive "
+                    "FROM ProbeSetXRef, ProbeSet WHERE "
+                    "ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+                    "AND ProbeSet.Name IN ({}) AND "
+                    "ProbeSetXRef.ProbeSetFreezeId = %s")
+            elif dataset.type == 'Publish':
+                qtl_names = list(found)
+                qtl_query = (
+                    "SELECT PublishXRef.Id, PublishXRef.Locus, "
+                    "PublishXRef.LRS, PublishXRef.additive FROM "
+                    "PublishXRef, PublishFreeze WHERE "
+                    "PublishXRef.Id IN ({}) AND "
+                    "PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+                    "AND PublishFreeze.Id = %s")
+            else:
+                qtl_names = []
+            for names in __chunks__(qtl_names):
+                cursor.execute(qtl_query.format(__placeholders__(names)),
+                               (*names, dataset.id))
+                for (name, *trait_qtl) in cursor.fetchall():
+                    trait_qtls.setdefault(str(name), tuple(trait_qtl))
+
+            locus_positions = {}
+            loci = sorted({trait_qtl[0] for trait_qtl in trait_qtls.values()
+                           if trait_qtl[0]})
+            for names in __chunks__(loci):
+                cursor.execute(
+                    "SELECT Geno.Name, Geno.Chr, Geno.Mb FROM Geno, Species "
+                    "WHERE Species.Name = %s AND "
+                    f"Geno.Name IN ({__placeholders__(names)}) AND "
+                    "Geno.SpeciesId = Species.Id",
+                    (dataset.group.species, *names))
+                for (locus, chr_name, mb) in cursor.fetchall():
+                    locus_positions.setdefault(locus, (chr_name, mb))
+
+            for (name, trait) in found.items():
+                __set_trait_qtl__(
+                    trait, dataset, trait_qtls.get(name), locus_positions)
+    return list(found.values())
+
+
+def __set_trait_info__(trait, dataset, trait_info):
+    """Set the attributes of `trait` from its row of info, with the
+    columns of `dataset.display_fields`"""
+    trait.haveinfo = True
+    for i, field in enumerate(dataset.display_fields):
+        holder = trait_info[i]
+        if isinstance(holder, bytes):
+            holder = holder.decode("utf-8", errors="ignore")
+        setattr(trait, field, holder)
+
+    if dataset.type == 'Publish':
+        if trait.group_code:
+            trait.display_name = trait.group_code + "_" + str(trait.name)
+
+        trait.confidential = 0
+        if trait.pre_publication_description and not trait.pubmed_id:
+            trait.confidential = 1
+
+        description = trait.post_publication_description
+
+        # If the dataset is confidential and the user has access to confidential
+        # phenotype traits, then display the pre-publication description instead
+        # of the post-publication description
+        trait.description_display = "N/A"
+        trait.abbreviation = "N/A"
+        if not trait.pubmed_id:
+            if trait.pre_publication_abbreviation:
+                trait.abbreviation = trait.pre_publication_abbreviation
+            if trait.pre_publication_description:
+                trait.description_display = trait.pre_publication_description
+        else:
+            if trait.post_publication_abbreviation:
+                trait.abbreviation = trait.post_publication_abbreviation
+            if description:
+                trait.description_display = description.strip()
+
+        if not trait.year.isdigit():
+            trait.pubmed_text = "N/A"
+        else:
+            trait.pubmed_text = trait.year
+
+        if trait.pubmed_id:
+            trait.pubmed_link = webqtlConfig.PUBMEDLINK_URL % trait.pubmed_id
+
+    if dataset.type == 'ProbeSet' and dataset.group:
+        description_string = trait.description
+        target_string = trait.probe_target_description
+
+        if str(description_string or "") != "" and description_string != 'None':
+            description_display = description_string
+        else:
+            description_display = trait.symbol
+
+        if (str(description_display or "") != ""
+            and description_display != 'N/A'
+                and str(target_string or "") != "" and target_string != 'None'):
+            description_display = description_display + '; ' + target_string.strip()
+
+        # Save it for the jinja2 template
+        trait.description_display = description_display
+
+        trait.location_repr = 'N/A'
+        if trait.chr and trait.mb:
+            trait.location_repr = 'Chr%s: %.6f' % (
+                trait.chr, float(trait.mb))
+
+    elif dataset.type == "Geno":
+        trait.location_repr = 'N/A'
+        if trait.chr and trait.mb:
+            trait.location_repr = 'Chr%s: %.6f' % (
+                trait.chr, float(trait.mb))
+
+
+def __set_trait_qtl__(trait, dataset, trait_qtl, locus_positions):
+    """Set the LRS, its location and the other QTL attributes of `trait` from
+    its row of QTL info (None if it has none); `locus_positions` maps marker
+    names to their `(Chr, Mb)`"""
+    trait.LRS_score_repr = "N/A"
+    trait.LRS_location_repr = "N/A"
+    trait.locus = trait.locus_chr = trait.locus_mb = trait.lrs = trait.pvalue = trait.additive = ""
+    if dataset.type == 'ProbeSet' and not trait.cellid:
+        trait.mean = ""
+        if trait_qtl and any(trait_qtl):
+            trait.locus, trait.lrs, trait.pvalue, trait.mean, trait.additive = trait_qtl
+            if trait.locus:
+                (trait.locus_chr, trait.locus_mb) = locus_positions.get(
+                    trait.locus, ("", ""))
+            else:
+                trait.locus = trait.locus_chr = trait.locus_mb = trait.additive = ""
+
+    if dataset.type == 'Publish':
+        if trait_qtl:
+            trait.locus, trait.lrs, trait.additive = trait_qtl
+            if trait.locus in locus_positions:
+                (trait.locus_chr, trait.locus_mb) = locus_positions[trait.locus]
+            else:
+                trait.locus = trait.locus_chr = trait.locus_mb = trait.additive = ""
+        else:
+            trait.locus = trait.lrs = trait.additive = ""
+    if (dataset.type == 'Publish' or dataset.type == "ProbeSet"):
+        if str(trait.locus_chr or "") != "" and str(trait.locus_mb or "") != "":
+            trait.LRS_location_repr = 'Chr%s: %.6f' % (
+                trait.locus_chr, float(trait.locus_mb))
+        if str(trait.lrs or "") != "":
+            trait.LRS_score_repr = '%3.1f' % trait.lrs
+
+
 def fetch_symbols(trait_db_list):
     """
     Fetch list of trait symbols
@@ -0,0 +1,162 @@
+"""The sample data of a trait, held in parallel NumPy arrays
+
+`TraitSampleData` is what `GeneralTrait.data` holds. It is a mapping of
+sample names to `webqtlCaseData`, as the trait data has always been, for the
+templates and the code that looks at one sample at a time. The case objects
+are only created when they are looked up. Analyses that need the values of
+many samples should use `values_for` and `variances_for`, which read the
+arrays directly."""
+
+from collections.abc import Mapping, MutableMapping
+
+import numpy as np
+
+from gn2.base.webqtlCaseData import webqtlCaseData
+
+
+def __float_array__(items):
+    """`items` as a float array, with NaN in place of `None`"""
+    return np.array([np.nan if item is None else item for item in items],
+                    dtype=float)
+
+
+def __item__(array, position):
+    """Element `position` of `array`, or None if it is NaN"""
+    value = array[position]
+    return None if np.isnan(value) else value.item()
+
+
+class TraitSampleData(MutableMapping):
+    """The value, variance and number of cases of each sample of a trait, in
+    arrays ordered as the samples (NaN where there are none), with the samples'
+    other names in `names2`.
+
+    Setting or deleting a sample through the mapping updates the arrays. The
+    case objects handed out keep any attributes set on them (as the show trait
+    page does), but their values should not be changed; set a new case
+    instead."""
+
+    def __init__(self, cases=()):
+        """Build the arrays from `cases`, `webqtlCaseData` objects or a
+        mapping of them by sample name"""
+        if isinstance(cases, Mapping):
+            cases = cases.values()
+        cases = list(cases)
+        self.__set_arrays__(
+            [case.name for case in cases],
+            __float_array__([case.value for case in cases]),
+            __float_array__([case.variance for case in cases]),
+            __float_array__([case.num_cases for case in cases]),
+            [case.name2 for case in cases])
+        self.__cases__ = {case.name: case for case in cases}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """The sample data in `rows` of `(name, value, variance, num_cases,
+        name2)`, as the datasets' `retrieve_sample_data` returns them. A
+        sample that appears twice keeps its last row."""
+        positions = {}
+        for (position, row) in enumerate(rows):
+            positions[row[0]] = position
+        rows = [rows[position] for position in positions.values()]
+        sample_data = cls()
+        sample_data.__set_arrays__(
+            [row[0] for row in rows],
+            __float_array__([row[1] for row in rows]),
+            __float_array__([row[2] for row in rows]),
+            __float_array__([row[3] for row in rows]),
+            [row[4] for row in rows])
+        return sample_data
+
+    def __set_arrays__(self, samples, values, variances, num_cases, names2):
+        self.samples = samples
+        self.values = values
+        self.variances = variances
+        self.num_cases = num_cases
+        self.names2 = names2
+        self.__positions__ = {
+            sample: position for (position, sample) in enumerate(samples)}
+        self.__cases__ = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        return iter(self.samples)
+
+    def __contains__(self, sample):
+        return sample in self.__positions__
+
+    def __getitem__(self, sample):
+        case = self.__cases__.get(sample)
+        if case is None:
+            position = self.__positions__[sample]
+            num_cases = __item__(self.num_cases, position)
+            case = webqtlCaseData(
+                sample, __item__(self.values, position),
+                __item__(self.variances, position),
+                None if num_cases is None else int(num_cases),
+                self.names2[position])
+            self.__cases__[sample] = case
+        return case
+
+    def __setitem__(self, sample, case):
+        position = self.__positions__.get(sample)
+        if position is None:
+            cases = self.__cases__
+            self.__set_arrays__(
+                self.samples + [sample],
+                np.append(self.values, np.nan),
+                np.append(self.variances, np.nan),
+                np.append(self.num_cases, np.nan),
+                self.names2 + [None])
+            self.__cases__ = cases
+            position = len(self.samples) - 1
+        (self.values[position], self.variances[position],
+         self.num_cases[position]) = __float_array__(
+             [case.value, case.variance, case.num_cases])
+        self.names2[position] = case.name2
+        self.__cases__[sample] = case
+
+    def __delitem__(self, sample):
+        position = self.__positions__[sample]
+        cases = self.__cases__
+        self.__set_arrays__(
+            self.samples[:position] + self.samples[position + 1:],
+            np.delete(self.values, position),
+            np.delete(self.variances, position),
+            np.delete(self.num_cases, position),
+            self.names2[:position] + self.names2[position + 1:])
+        cases.pop(sample, None)
+        self.__cases__ = cases
+
+    def clear(self):
+        self.__set_arrays__([], np.empty(0), np.empty(0), np.empty(0), [])
+
+    def positions(self, samples):
+        """The positions of `samples` in the arrays, -1 for the samples the
+        trait has no data for"""
+        return np.array([self.__positions__.get(sample, -1)
+                         for sample in samples], dtype=int)
+
+    def __gather__(self, array, samples):
+        if samples is None or list(samples) == self.samples:
+            # The arrays themselves, not a copy
+            view = array.view()
+            view.flags.writeable = False
+            return view
+        positions = self.positions(samples)
+        if len(array) == 0:
+            return np.full(len(positions), np.nan)
+        return np.where(positions >= 0, array[positions], np.nan)
+
+    def values_for(self, samples=None):
+        """The values of `samples` (by default, of every sample of the trait,
+        in order) as a float array, with NaN for the samples with no value.
+        Asking for the trait's own samples returns a read-only view of the
+        array instead of a copy."""
+        return self.__gather__(self.values, samples)
+
+    def variances_for(self, samples=None):
+        """The variances of `samples`, as `values_for` gives their values"""
+        return self.__gather__(self.variances, samples)
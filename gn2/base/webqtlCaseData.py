@@ -28,6 +28,11 @@ gn2.utility.tools.show_settings()
 
 class webqtlCaseData:
     """one case data in one trait"""
+    # Traits have a case for each of their samples, so keep them small. The
+    # show trait page adds `extra_info` and `first_attr_col`.
+    __slots__ = ("name", "name2", "value", "variance", "num_cases",
+                 "extra_attributes", "this_id", "outlier", "extra_info",
+                 "first_attr_col")
 
     def __init__(self, name, value=None, variance=None, num_cases=None, name2=None):
         self.name = name
@@ -41,6 +46,12 @@ class webqtlCaseData:
         self.this_id = None
         self.outlier = None   # Not set to True/False until later
 
+    def to_dict(self):
+        """The attributes that are set, as `__dict__` would have them without
+        the slots; used to serialize the case to JSON"""
+        return {attribute: getattr(self, attribute)
+                for attribute in self.__slots__ if hasattr(self, attribute)}
+
     def __repr__(self):
         case_data_string = "<webqtlCaseData> "
         if self.value is not None:
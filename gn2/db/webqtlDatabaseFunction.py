@@ -20,26 +20,15 @@
 #
 # This module is used by GeneNetwork project (www.genenetwork.org)
 
-from gn2.wqflask.database import database_connection
-
-from gn2.utility.tools import get_setting
+from gn2.base.reference_data import inbred_set, group_species
 
 
 def retrieve_species(group):
     """Get the species of a group (e.g. returns string "mouse" on "BXD"
 
     """
-    with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-        cursor.execute(
-            "SELECT Species.Name FROM Species, InbredSet WHERE InbredSet.Name = %s AND InbredSet.SpeciesId = Species.Id",
-            (group,))
-        results = cursor.fetchone()
-        if results and results[0]:
-            return results[0]
+    return group_species(group)
 
 
 def retrieve_species_id(group):
-    with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-        cursor.execute("SELECT SpeciesId FROM InbredSet WHERE Name = %s",
-                       (group,))
-        return cursor.fetchone()[0]
+    return inbred_set(group)["SpeciesId"]
@@ -10,6 +10,7 @@ from redis import Redis
 from pymonad.maybe import Maybe
 
 JOBS_NAMESPACE="gn2:jobs" # The namespace where jobs are kept
+CORRELATION_QUEUE="correlations" # The queue served by `gn2.scripts.corr_worker`
 
 class NoSuchJob(Exception):
     """Raised if a given job does not exist"""
@@ -63,6 +64,34 @@ def run(job_id: UUID, redis_uri: str):
     print(f"COMMAND: {shlex.join(command)}")
     subprocess.Popen(command)
 
+def queue_key(queue_name: str):
+    return f"{JOBS_NAMESPACE}:queue:{queue_name}"
+
+def workers_key(queue_name: str):
+    return f"{JOBS_NAMESPACE}:workers:{queue_name}"
+
+def workers_heartbeat(redis_conn: Redis, queue_name: str, ttl: int):
+    """Record that workers are serving `queue_name`, for the next `ttl`
+    seconds."""
+    redis_conn.set(workers_key(queue_name), "alive", ex=ttl)
+
+def submit(redis_conn: Redis, queue_name: str, job_id: UUID, redis_uri: str):
+    """Hand the job to the workers serving `queue_name`, or run it in an
+    external process if there are none."""
+    if redis_conn.exists(workers_key(queue_name)):
+        redis_conn.rpush(queue_key(queue_name), str(job_id))
+        return
+    run(job_id, redis_uri)
+
+def run_orphaned(redis_conn: Redis, queue_name: str, redis_uri: str):
+    """Run the jobs left in `queue_name` in external processes if no workers
+    serve it any longer, e.g. after they were stopped with jobs still
+    queued."""
+    if redis_conn.exists(workers_key(queue_name)):
+        return
+    while job_id := redis_conn.lpop(queue_key(queue_name)):
+        run(UUID(job_id), redis_uri)
+
 def completed_successfully(job):
     return (
         job.get("status") == "completed" and
@@ -0,0 +1,164 @@
+"""Run external tools (GEMMA, PLINK, qtlreaper, ...) as tracked jobs
+
+Every run is recorded as a job in Redis (see `gn2.jobs.jobs`), with its
+status, exit code and output, so it can be inspected at `/debug/<job_id>`.
+
+Runs are throttled across all the processes sharing a Redis instance: each
+tool may only have `<TOOL>_MAX_JOBS` runs going at once, and all the tools
+together at most `MAPPING_CPU_BUDGET` (0 for one per CPU). A run holds its
+slots on a lease that it keeps renewing, so the slots of a process that dies
+are freed once the lease runs out."""
+
+import os
+import time
+import subprocess
+from uuid import UUID
+from typing import Optional
+from datetime import datetime
+from tempfile import TemporaryFile
+
+from redis import Redis
+from flask import has_request_context
+
+import gn2.jobs.jobs as jobs
+from gn2.utility.tools import REDIS_URL, get_setting_int
+
+SLOTS_NAMESPACE = f"{jobs.JOBS_NAMESPACE}:slots"
+SLOT_LEASE = 30  # seconds
+POLL_INTERVAL = 0.5  # seconds
+JOB_TTL = 7 * 24 * 60 * 60  # seconds the record of a run is kept
+OUTPUT_LIMIT = 64 * 1024  # bytes of stdout/stderr kept for a run
+
+# Claim a slot in every one of KEYS, or none of them.
+# ARGV: now, lease expiry, job id, then the limit for each key
+__ACQUIRE_SLOTS__ = """
+for idx, key in ipairs(KEYS) do
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", ARGV[1])
+    if redis.call("ZCARD", key) >= tonumber(ARGV[3 + idx]) then
+        return 0
+    end
+end
+for idx, key in ipairs(KEYS) do
+    redis.call("ZADD", key, ARGV[2], ARGV[3])
+end
+return 1
+"""
+
+
+class ToolTimeout(Exception):
+    """Raised if a tool could not get a slot in time"""
+
+    def __init__(self, tool: str, timeout: float):
+        """Initialise the exception object."""
+        super().__init__(
+            f"Could not start '{tool}' within {timeout} seconds: too many "
+            "runs in progress.")
+
+
+class ToolError(Exception):
+    """Raised if a tool exits with an error"""
+
+    def __init__(self, tool: str, returncode: int):
+        """Initialise the exception object."""
+        self.tool = tool
+        self.returncode = returncode
+        super().__init__(
+            f"'{tool}' failed with exit code {returncode}; its output is kept "
+            "in the record of its run.")
+
+
+def cpu_budget() -> int:
+    """The number of tool runs allowed at once, over all tools"""
+    return get_setting_int("MAPPING_CPU_BUDGET") or os.cpu_count() or 1
+
+
+def tool_limits(tool: str) -> dict:
+    """The slot sets a run of `tool` needs a place in, with their limits"""
+    return {f"{SLOTS_NAMESPACE}:{tool}": get_setting_int(
+                f"{tool.upper()}_MAX_JOBS"),
+            f"{SLOTS_NAMESPACE}:cpu": cpu_budget()}
+
+
+def acquire_slots(redis_conn: Redis, job_id: UUID, limits: dict) -> bool:
+    """Try to take a slot in each of `limits` for `job_id`"""
+    now = time.time()
+    return bool(redis_conn.eval(
+        __ACQUIRE_SLOTS__, len(limits), *limits.keys(),
+        now, now + SLOT_LEASE, str(job_id), *limits.values()))
+
+
+def renew_slots(redis_conn: Redis, job_id: UUID, limits: dict):
+    """Extend the lease on the slots held by `job_id`"""
+    for key in limits:
+        redis_conn.zadd(key, {str(job_id): time.time() + SLOT_LEASE}, xx=True)
+
+
+def release_slots(redis_conn: Redis, job_id: UUID, limits: dict):
+    """Give up the slots held by `job_id`"""
+    for key in limits:
+        redis_conn.zrem(key, str(job_id))
+
+
+def __tail__(output_file) -> str:
+    output_file.seek(max(output_file.seek(0, os.SEEK_END) - OUTPUT_LIMIT, 0))
+    return output_file.read().decode("utf-8", errors="replace")
+
+
+def slot_timeout() -> int:
+    """The seconds a run waits for a free slot: web requests give up soon, so
+    they do not hold on to the web workers"""
+    return get_setting_int("REQUEST_TOOL_SLOT_TIMEOUT" if has_request_context()
+                           else "TOOL_SLOT_TIMEOUT")
+
+
+def run_tool(tool: str, command: str, timeout: Optional[float] = None) -> int:
+    """Run the shell `command` for `tool` once a slot is free, and wait for it
+    to finish. Returns the exit code, like `os.system`.
+
+    Raises `ToolTimeout` if no slot is free within `timeout` seconds, by
+    default `slot_timeout()`."""
+    if timeout is None:
+        timeout = slot_timeout()
+    with Redis.from_url(REDIS_URL, decode_responses=True) as redis_conn:
+        job_id = jobs.queue(redis_conn, {
+            "command": ["/bin/sh", "-c", command],
+            "tool": tool,
+            "request_received_time": datetime.utcnow().isoformat(),
+            "status": "queued"})
+        job_key = jobs.job_namespace(job_id)
+        redis_conn.expire(job_key, JOB_TTL)
+
+        limits = tool_limits(tool)
+        deadline = time.monotonic() + timeout
+        while not acquire_slots(redis_conn, job_id, limits):
+            if time.monotonic() > deadline:
+                redis_conn.hset(job_key, mapping={
+                    "status": "completed", "completion-status": "error",
+                    "stderr": "Timed out waiting for a free slot"})
+                raise ToolTimeout(tool, timeout)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            with TemporaryFile() as stdout, TemporaryFile() as stderr:
+                redis_conn.hset(job_key, "status", "running")
+                with subprocess.Popen(command, shell=True, stdout=stdout,
+                                      stderr=stderr) as process:
+                    renewed = time.monotonic()
+                    while process.poll() is None:
+                        if time.monotonic() - renewed > SLOT_LEASE / 3:
+                            renew_slots(redis_conn, job_id, limits)
+                            renewed = time.monotonic()
+                        time.sleep(POLL_INTERVAL)
+
+                redis_conn.hset(job_key, mapping={
+                    "status": "completed",
+                    "completion-status": (
+                        "success" if process.returncode == 0 else "error"),
+                    "return-code": process.returncode,
+                    "stdout": __tail__(stdout),
+                    "stderr": __tail__(stderr)})
+        finally:
+            release_slots(redis_conn, job_id, limits)
+
+    return process.returncode
+
@@ -0,0 +1,132 @@
+"""
+Compute correlations in long-lived worker processes.
+
+While the workers run, `/corr_compute` queues its jobs for them instead of
+starting new processes for each one. The workers load the application once
+and keep their caches of datasets and matrices from one job to the next. They
+record the results in the jobs the same way the external processes do.
+
+Example:
+    python -m gn2.scripts.corr_worker --redis-uri=redis://localhost:6379/0
+"""
+
+import sys
+import json
+import time
+import pickle
+import argparse
+import traceback
+import multiprocessing
+from uuid import UUID
+
+from flask import g
+from redis import Redis
+
+import gn2.jobs.jobs as jobs
+from gn2.wqflask import app
+from gn2.utility.tools import REDIS_URL, get_setting_int
+from gn2.scripts.corr_compute import compute, UserSessionSimulator
+
+HEARTBEAT_TTL = 10  # seconds the workers count as alive after a heartbeat
+POP_TIMEOUT = 5  # seconds a worker waits for a job before checking again
+
+
+def record_results(redis_conn: Redis, job_id: UUID, stdout: str,
+                   stderr: str, return_code: int):
+    """Complete the job, as `gn2.scripts.run_external` would"""
+    redis_conn.hset(jobs.job_namespace(job_id), mapping={
+        "status": "completed",
+        "stdout": stdout,
+        "stderr": stderr,
+        "completion-status": "success" if return_code == 0 else "error",
+        "return-code": return_code})
+
+
+def run_correlation_job(redis_conn: Redis, job_id: UUID):
+    """Compute the correlations for the job `job_id`, in this process"""
+    the_job = jobs.job(redis_conn, job_id).maybe({}, lambda val: val)
+    if not the_job:
+        return
+
+    redis_conn.hset(jobs.job_namespace(job_id), "status", "running")
+    try:
+        with open(the_job["inputs-file"], "rb") as pfile:
+            form = pickle.Unpickler(pfile).load()
+        with app.app_context():
+            g.user_session = UserSessionSimulator(the_job["user-id"])
+            results = compute(form)
+    except Exception:  # pylint: disable=[broad-except]
+        record_results(redis_conn, job_id, "", traceback.format_exc(), 1)
+        return
+
+    if "error-type" in results:
+        record_results(
+            redis_conn, job_id, json.dumps(results),
+            f"{results['error-type']}: {results['error-message']}", 3)
+        return
+    record_results(redis_conn, job_id, json.dumps(results), "", 0)
+
+
+def work(redis_uri: str, max_jobs: int, current_job):
+    """Run queued correlation jobs, until `max_jobs` are done (0 for no
+    limit). The id of the job being run is kept in `current_job`."""
+    with Redis.from_url(redis_uri, decode_responses=True) as conn:
+        done = 0
+        while max_jobs == 0 or done < max_jobs:
+            popped = conn.blpop(
+                jobs.queue_key(jobs.CORRELATION_QUEUE), timeout=POP_TIMEOUT)
+            if popped is None:
+                continue
+            current_job.value = popped[1].encode()
+            run_correlation_job(conn, UUID(popped[1]))
+            current_job.value = b""
+            done += 1
+
+
+def serve(redis_uri: str, workers: int, max_jobs: int):
+    """Keep `workers` worker processes running, replacing those that exit.
+    The jobs of workers that die are completed with an error."""
+    context = multiprocessing.get_context("fork")
+    running = []
+    with Redis.from_url(redis_uri, decode_responses=True) as conn:
+        while True:
+            for (process, current_job) in running:
+                if not process.is_alive() and current_job.value:
+                    record_results(
+                        conn, UUID(current_job.value.decode()), "",
+                        f"The correlation worker exited with code "
+                        f"{process.exitcode}", 1)
+            running = [(process, current_job)
+                       for (process, current_job) in running
+                       if process.is_alive()]
+            while len(running) < workers:
+                current_job = context.Array("c", 36)
+                process = context.Process(
+                    target=work, args=(redis_uri, max_jobs, current_job),
+                    daemon=True)
+                process.start()
+                running.append((process, current_job))
+
+            jobs.workers_heartbeat(conn, jobs.CORRELATION_QUEUE, HEARTBEAT_TTL)
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute correlations in long-lived worker processes.")
+    parser.add_argument(
+        "--redis-uri", default=REDIS_URL,
+        help="The Redis instance the jobs are kept in.")
+    parser.add_argument(
+        "--workers", type=int, default=get_setting_int("CORRELATION_WORKERS"),
+        help="The number of jobs to compute at once.")
+    parser.add_argument(
+        "--max-jobs", type=int,
+        default=get_setting_int("CORRELATION_WORKER_MAX_JOBS"),
+        help="Jobs a worker runs before it is replaced; 0 for no limit.")
+    args = parser.parse_args()
+
+    try:
+        serve(args.redis_uri, args.workers, args.max_jobs)
+    except KeyboardInterrupt:
+        sys.exit(0)
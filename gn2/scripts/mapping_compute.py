@@ -0,0 +1,66 @@
+"""Run a mapping and save the values the results page is rendered from."""
+
+import sys
+import json
+import pickle
+import pathlib
+import datetime
+
+from flask import g
+
+from gn2.wqflask import app
+from gn2.scripts.corr_compute import UserSessionSimulator
+from gn2.wqflask.marker_regression.run_mapping import RunMapping
+from gn2.wqflask.marker_regression.exceptions import (
+    NoMappingResultsError, NO_RESULTS_EXIT_CODE)
+
+
+def e_time():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def compute(start_vars, temp_uuid):
+    """Run the mapping, returning the values for the results templates"""
+    template_vars = RunMapping(start_vars, temp_uuid)
+    if template_vars.no_results:
+        raise NoMappingResultsError(
+            start_vars["trait_id"], start_vars["dataset"], start_vars["method"])
+    return template_vars.__dict__
+
+
+if __name__ == "__main__":
+    ARGS_COUNT = 4
+    if len(sys.argv) < ARGS_COUNT:
+        print(f"{e_time()}: You need to pass the file with the pickled inputs, "
+              "the results file and the user id", file=sys.stderr)
+        sys.exit(1)
+
+    if len(sys.argv) > ARGS_COUNT:
+        print(f"{e_time()}: Unknown arguments {sys.argv[ARGS_COUNT:]}",
+              file=sys.stderr)
+        sys.exit(1)
+
+    filepath = pathlib.Path(sys.argv[1])
+    if not filepath.exists():
+        print(f"File not found '{filepath}'", file=sys.stderr)
+        sys.exit(2)
+
+    with open(filepath, "rb") as pfile:
+        (start_vars, temp_uuid) = pickle.Unpickler(pfile).load()
+
+    with app.app_context():
+        g.user_session = UserSessionSimulator(sys.argv[3])
+        try:
+            results = compute(start_vars, temp_uuid)
+        except NoMappingResultsError as no_results:
+            print(f"{e_time()}: {no_results.message}", file=sys.stderr)
+            sys.exit(NO_RESULTS_EXIT_CODE)
+
+    results_path = pathlib.Path(sys.argv[2])
+    tmp_path = results_path.with_name(f".{results_path.name}.tmp")
+    with open(tmp_path, "wb") as results_file:
+        pickle.dump(results, results_file, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(results_path)
+
+    print(json.dumps({"results-file": str(results_path)}), file=sys.stdout)
+    sys.exit(0)
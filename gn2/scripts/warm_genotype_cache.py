@@ -0,0 +1,68 @@
+"""
+Pre-build the parsed-genotype sidecar files for every .geno file in a
+genotype directory, so that no mapping request has to parse a .geno file.
+
+Example:
+    python -m gn2.scripts.warm_genotype_cache $GENENETWORK_FILES/genotype
+"""
+
+import os
+import sys
+import argparse
+
+from gn2.utility.gen_geno_ob import GenotypeMatrix
+from gn2.utility.gen_geno_ob import sidecar_paths
+from gn2.utility.gen_geno_ob import read_genotype_sidecar
+from gn2.utility.gen_geno_ob import write_genotype_sidecar
+
+
+def warm_sidecars(geno_dir, cache_dirs=(), force=False):
+    """Build the missing or stale sidecars for the .geno files in `geno_dir`.
+    Yields a `(filename, status)` pair for each file."""
+    for filename in sorted(os.listdir(geno_dir)):
+        if not filename.endswith(".geno"):
+            continue
+        filename = os.path.join(geno_dir, filename)
+        paths = sidecar_paths(filename, cache_dirs)
+        if not force and any(read_genotype_sidecar(filename, path) is not None
+                             for path in paths):
+            yield (filename, "fresh")
+            continue
+
+        try:
+            geno_ob = GenotypeMatrix(filename)
+        except Exception as exc:  # pylint: disable=[broad-except]
+            yield (filename, f"unreadable: {exc}")
+            continue
+
+        for path in paths:
+            try:
+                write_genotype_sidecar(geno_ob, filename, path)
+                yield (filename, f"built {path}")
+                break
+            except OSError:
+                continue
+        else:
+            yield (filename, "no writable sidecar location")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pre-build the parsed-genotype sidecar files.")
+    parser.add_argument(
+        "geno_dir", help="The directory holding the .geno files.")
+    parser.add_argument(
+        "--cache-dir", action="append", default=[],
+        help=("Where to write the sidecars when the genotype directory is "
+              "not writable. Can be given more than once."))
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Rebuild the sidecars even when they are fresh.")
+    args = parser.parse_args()
+
+    failed = False
+    for (filename, status) in warm_sidecars(
+            args.geno_dir, tuple(args.cache_dir), args.force):
+        print(f"{filename}: {status}")
+        failed = failed or not status.startswith(("fresh", "built"))
+    sys.exit(1 if failed else 0)
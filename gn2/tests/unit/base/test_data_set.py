@@ -3,11 +3,16 @@
 import unittest
 from unittest import mock
 from dataclasses import dataclass
+
+import numpy
 from gn3.monads import MonadicDict
 
 from gn2.wqflask import app
 from gn2.base.data_set import DatasetType
 from gn2.base.data_set.dataset import DataSet
+from gn2.base.data_set.mrnaassaydataset import MrnaAssayDataSet
+from gn2.base.data_set.tempdataset import TempDataSet
+from gn2.base.data_set.utils import DATASET_METADATA
 
 GEN_MENU_JSON = """
 {
@@ -137,6 +142,9 @@ class MockPhenotypeDataset(DataSet):
 class MockGroup:
     name = "Group"
 
+    def metadata(self):
+        return {"name": self.name}
+
 class TestDataSetTypes(unittest.TestCase):
     """Tests for the DataSetType class"""
 
@@ -204,6 +212,13 @@ class TestDataSetTypes(unittest.TestCase):
 class TestDatasetAccessionId(unittest.TestCase):
     """Tests for the DataSetType class"""
 
+    def setUp(self):
+        DATASET_METADATA.clear()
+        generation = mock.patch(
+            "gn2.base.data_set.utils.datasets_generation", return_value=None)
+        generation.start()
+        self.addCleanup(generation.stop)
+
     @mock.patch("gn2.base.data_set.dataset.database_connection")
     @mock.patch("gn2.base.data_set.dataset.DatasetGroup")
     def test_get_accession_id(self, mock_dataset_group, conn):
@@ -238,3 +253,168 @@ class TestDatasetAccessionId(unittest.TestCase):
         sample_dataset\
             .accession_id\
             .bind(lambda x: self.assertNone(x))
+
+
+class TestDatasetMetadata(unittest.TestCase):
+    """Tests for the memoized dataset metadata"""
+
+    def setUp(self):
+        DATASET_METADATA.clear()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        DATASET_METADATA.clear()
+        self.app_context.pop()
+
+    @mock.patch("gn2.base.data_set.utils.datasets_generation",
+                return_value=b"1")
+    @mock.patch("gn2.base.data_set.dataset.query_sql", return_value=None)
+    @mock.patch("gn2.base.data_set.dataset.species.TheSpecies")
+    @mock.patch("gn2.base.data_set.datasetgroup.webqtlDatabaseFunction")
+    @mock.patch("gn2.base.data_set.datasetgroup.database_connection")
+    @mock.patch("gn2.base.data_set.dataset.database_connection")
+    def test_metadata_is_reused(self, dataset_conn, group_conn, db_functions,
+                                _species, _query_sql, generation):
+        """Test that a dataset is only looked up once until datasets are
+        edited, and that changes to one dataset object do not leak into the
+        next"""
+        cursor = (group_conn.return_value.__enter__.return_value
+                  .cursor.return_value.__enter__.return_value)
+        cursor.fetchone.side_effect = [("BXD", 1, "riset", "BXD"), ("1",)]
+        db_functions.retrieve_species.return_value = "mouse"
+        dataset_conn.return_value.__enter__.return_value = mock.MagicMock()
+
+        first = MockPhenotypeDataset(name="BXDPublish", get_samplelist=False)
+        first.group.parlist.append("BXD1")
+        first.group.genofile = "BXD.8.json"
+        second = MockPhenotypeDataset(name="BXDPublish", get_samplelist=False)
+
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertEqual(second.group.name, "BXD")
+        self.assertEqual(second.group.species, "mouse")
+        self.assertEqual(second.group.mapping_names,
+                         ["GEMMA", "QTLReaper", "R/qtl"])
+        self.assertEqual(second.group.parlist, ["C57BL/6J", "DBA/2J"])
+        self.assertIsNone(second.group.genofile)
+
+        # Datasets were edited, in this or another process
+        generation.return_value = b"2"
+        cursor.fetchone.side_effect = [("BXD", 1, "riset", "BXD"), ("1",)]
+        MockPhenotypeDataset(name="BXDPublish", get_samplelist=False)
+        self.assertEqual(cursor.execute.call_count, 4)
+
+
+class TestRetrieveSampleDataBulk(unittest.TestCase):
+    """Tests for fetching the sample data of many traits at once"""
+
+    @mock.patch("gn2.base.data_set.dataset.SAMPLE_DATA_QUERY_CHUNK", 2)
+    @mock.patch("gn2.base.data_set.dataset.database_connection")
+    def test_retrieve_sample_data_bulk(self, mock_db):
+        """Test that the rows of every trait are streamed into arrays, and
+        given back as `retrieve_sample_data` returns them"""
+        cursor = (mock_db.return_value.__enter__.return_value
+                  .cursor.return_value.__enter__.return_value)
+        cursor.fetchmany.side_effect = [
+            [("t1", "BXD2", 8.5, 0.25, 3, "B2"),
+             ("t2", "BXD1", 7.0, None, None, "B1")],
+            [("t1", "BXD1", 9.0, None, 2, "B1")],
+            [],
+            [("t3", "bxd3", 1.5, None, None, "B3")],
+            []]
+        dataset = MrnaAssayDataSet.__new__(MrnaAssayDataSet)
+        dataset.name = "HC_M2_0606_P"
+
+        bulk = dataset.retrieve_sample_data_bulk(["t1", "t2", "t3", "t4"])
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertEqual(cursor.execute.call_args_list[0][0][1],
+                         ("t1", "t2", "HC_M2_0606_P"))
+        self.assertEqual(bulk.samples, ["BXD1", "BXD2", "bxd3"])
+        self.assertEqual(bulk.values.shape, (4, 3))
+        self.assertEqual(bulk.rows("t1"), [("BXD1", 9.0, None, 2, "B1"),
+                                           ("BXD2", 8.5, 0.25, 3, "B2")])
+        self.assertEqual(bulk.rows("t2"), [("BXD1", 7.0, None, None, "B1")])
+        self.assertEqual(bulk.rows("t3"), [("bxd3", 1.5, None, None, "B3")])
+        self.assertEqual(bulk.rows("t4"), [])
+        self.assertEqual(bulk.rows("t5"), [])
+
+    @mock.patch("gn2.base.data_set.dataset.database_connection")
+    @mock.patch("gn2.base.data_set.tempdataset.Redis")
+    def test_per_trait_fallback(self, mock_redis, mock_db):
+        """Test that the sample data of datasets with no bulk query is
+        retrieved a trait at a time"""
+        mock_redis.get.side_effect = {"T1": b"1.5 x 2.0",
+                                      "T2": b"x 3.0 x"}.get
+        dataset = TempDataSet.__new__(TempDataSet)
+        dataset.group = mock.Mock()
+        dataset.group.all_samples_ordered.return_value = [
+            "BXD2", "BXD1", "BXD5"]
+
+        bulk = dataset.retrieve_sample_data_bulk(["T1", "T2"])
+        mock_db.assert_not_called()
+        self.assertEqual(bulk.rows("T1"), [("BXD2", 1.5, None, None, None),
+                                           ("BXD5", 2.0, None, None, None)])
+        self.assertEqual(bulk.rows("T2"), [("BXD1", 3.0, None, None, None)])
+
+
+class FakeCursor:
+    """A cursor serving `rows` to `fetchall`, or `fetchmany` in chunks"""
+
+    def __init__(self, rows, chunk_size=2):
+        self.rows = rows
+        self.chunk_size = chunk_size
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        return False
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, _size):
+        (chunk, self.rows) = (self.rows[:self.chunk_size],
+                              self.rows[self.chunk_size:])
+        return chunk
+
+
+class TestFetchTraitMatrix(unittest.TestCase):
+    """Tests for fetching the values of every trait of a dataset"""
+
+    def test_fetch_trait_matrix(self):
+        """Test that the unordered rows land in their trait's row and their
+        sample's column, and missing values and samples are NaN"""
+        traits = FakeCursor([(11, "T1"), (12, "T2"), (13, "T3"), (11, "T1b")])
+        values = FakeCursor([(13, 5, 3.5), (11, 2, 1.0), (12, 5, 2.5),
+                             (11, 5, 1.5), (99, 2, 9.0)])
+        conn = mock.Mock()
+        conn.cursor.side_effect = [traits, values]
+        dataset = MrnaAssayDataSet.__new__(MrnaAssayDataSet)
+        (dataset.type, dataset.name) = ("ProbeSet", "HC_M2_0606_P")
+
+        (trait_names, matrix) = dataset.fetch_trait_matrix(conn, [5, 7, 2, 5])
+        self.assertEqual(trait_names, ["T1", "T2", "T3", "T1b"])
+        self.assertEqual(values.executed[0][1],
+                         ("HC_M2_0606_P", 2, 5, 7))
+        numpy.testing.assert_array_equal(matrix, [
+            [1.5, numpy.nan, 1.0, 1.5],
+            [2.5, numpy.nan, numpy.nan, 2.5],
+            [3.5, numpy.nan, numpy.nan, 3.5],
+            [1.5, numpy.nan, 1.0, 1.5]])
+
+    def test_no_traits_or_samples(self):
+        """Test that datasets with no traits, or no samples asked for, give
+        an empty matrix without querying the values"""
+        conn = mock.Mock()
+        conn.cursor.side_effect = [FakeCursor([(11, "T1")])]
+        dataset = MrnaAssayDataSet.__new__(MrnaAssayDataSet)
+        (dataset.type, dataset.name) = ("ProbeSet", "HC_M2_0606_P")
+        (trait_names, matrix) = dataset.fetch_trait_matrix(conn, [])
+        self.assertEqual(trait_names, ["T1"])
+        self.assertEqual(matrix.shape, (1, 0))
+        self.assertEqual(conn.cursor.call_count, 1)
@@ -0,0 +1,101 @@
+"""Tests for the dataset results cache in gn2/base/data_set/utils.py"""
+import os
+
+import numpy as np
+import pytest
+
+from gn2.base.data_set import utils
+
+
+@pytest.fixture
+def cache_dir(mocker, tmp_path):
+    """Point the dataset cache at an empty directory"""
+    mocker.patch("gn2.base.data_set.utils.DATASET_CACHE_DIR", str(tmp_path))
+    mocker.patch("gn2.base.data_set.utils.query_table_timestamp",
+                 return_value="2023-01-01 00:00:00")
+    mocker.patch("gn2.base.data_set.utils.get_setting_int",
+                 return_value=10**6)
+    utils.DATASET_CACHE_STATS.clear()
+    return tmp_path
+
+
+def test_cache_round_trip(cache_dir):
+    """Test that cached results are read back for the same samples only"""
+    matrix = np.array([[1.0, np.nan], [2.5, 3.0]])
+    utils.cache_dataset_results(
+        "HC_M2_0606_P", "ProbeSet", ["BXD1", "BXD2"], ["t1", "t2"], matrix)
+
+    (trait_names, cached) = utils.fetch_cached_results(
+        "HC_M2_0606_P", "ProbeSet", ["BXD1", "BXD2"])
+    assert trait_names == ["t1", "t2"]
+    np.testing.assert_array_equal(cached, matrix)
+    assert utils.fetch_cached_results(
+        "HC_M2_0606_P", "ProbeSet", ["BXD1"]) is None
+    assert utils.DATASET_CACHE_STATS == {"hits": 1, "misses": 1}
+
+
+def test_evict_least_recently_used(cache_dir):
+    """Test that eviction removes the least recently used results first"""
+    for (idx, samples) in enumerate((["BXD1"], ["BXD2"], ["BXD5"])):
+        utils.cache_dataset_results(
+            "BXDPublish", "Publish", samples, [1], np.ones((1, 100)))
+        os.utime(utils.dataset_cache_path(
+            "BXDPublish", "2023-01-01 00:00:00", samples), (idx, idx))
+    size = os.path.getsize(utils.dataset_cache_path(
+        "BXDPublish", "2023-01-01 00:00:00", ["BXD1"]))
+
+    utils.evict_dataset_cache(2 * size)
+    assert utils.fetch_cached_results("BXDPublish", "Publish", ["BXD1"]) is None
+    assert utils.fetch_cached_results(
+        "BXDPublish", "Publish", ["BXD5"]) is not None
+    assert utils.DATASET_CACHE_STATS["evictions"] == 1
+
+
+def test_table_timestamp_is_memoized(mocker):
+    """Test that table timestamps are only queried once within the TTL,
+    until datasets are edited"""
+    mocker.patch("gn2.base.data_set.utils.get_setting_int", return_value=60)
+    db_mock = mocker.patch("gn2.base.data_set.utils.database_connection")
+    cursor = (db_mock.return_value.__enter__.return_value
+              .cursor.return_value.__enter__.return_value)
+    cursor.fetchone.return_value = (None,)
+    generation = mocker.patch(
+        "gn2.base.data_set.utils.datasets_generation", return_value=b"1")
+    utils.TABLE_TIMESTAMPS.clear()
+
+    first = utils.query_table_timestamp("Geno")
+    assert utils.query_table_timestamp("Geno") == first
+    assert cursor.execute.call_count == 1
+
+    # Datasets were edited, in this or another process
+    generation.return_value = b"2"
+    utils.query_table_timestamp("Geno")
+    assert cursor.execute.call_count == 2
+    utils.TABLE_TIMESTAMPS.clear()
+
+
+def test_null_update_time_is_unknown(mocker):
+    """Test that a NULL UPDATE_TIME gives no timestamp, not the current time"""
+    mocker.patch("gn2.base.data_set.utils.get_setting_int", return_value=60)
+    db_mock = mocker.patch("gn2.base.data_set.utils.database_connection")
+    cursor = (db_mock.return_value.__enter__.return_value
+              .cursor.return_value.__enter__.return_value)
+    cursor.fetchone.return_value = (None,)
+    mocker.patch("gn2.base.data_set.utils.datasets_generation",
+                 return_value=None)
+    utils.TABLE_TIMESTAMPS.clear()
+
+    assert utils.query_table_timestamp("Publish") is None
+    utils.TABLE_TIMESTAMPS.clear()
+
+
+def test_cache_with_unknown_timestamp(mocker, cache_dir):
+    """Test that results cached while the table timestamp is unknown keep
+    being reused"""
+    mocker.patch("gn2.base.data_set.utils.query_table_timestamp",
+                 return_value=None)
+    utils.cache_dataset_results(
+        "BXDPublish", "Publish", ["BXD1"], [1], np.ones((1, 3)))
+    assert utils.fetch_cached_results(
+        "BXDPublish", "Publish", ["BXD1"]) is not None
+    assert len(os.listdir(cache_dir)) == 1
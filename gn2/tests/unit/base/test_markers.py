@@ -0,0 +1,70 @@
+"""Tests for the marker tables in gn2/base/data_set/markers.py"""
+import os
+
+import numpy as np
+import pytest
+
+from gn2.base.data_set.markers import HumanMarkers
+from gn2.base.data_set.markers import MARKER_TABLE_EXT
+from gn2.base.data_set.markers import Markers
+
+SNPS_FILE = ("rs31443144, 3010274, 1\n"
+             "rs6269442, 3492195, 1\n"
+             "rs32285189, 3511204, X\n")
+
+BIM_FILE = ("1\trs3094315\t0\t752566\tG\tA\n"
+            "1\trs12562034\t0\t768448\tA\tG\n"
+            "2\trs3934834\t0\t1005806\tT\tC\n")
+
+
+@pytest.fixture
+def marker_files(mocker, tmp_path):
+    """Write marker files for the BXD group to a temporary directory"""
+    (tmp_path / "BXD_snps.txt").write_text(SNPS_FILE)
+    (tmp_path / "HLC.bim").write_text(BIM_FILE)
+    mocker.patch("gn2.base.data_set.markers.locate")
+    mocker.patch("gn2.base.data_set.markers.flat_files",
+                 return_value=str(tmp_path))
+    return tmp_path
+
+
+def test_markers(marker_files):
+    """Test that every marker in the SNP file is read and the table cached"""
+    markers = Markers("BXD")
+    assert markers.markers == [
+        {"name": "rs31443144", "Mb": 3.010274, "chr": 1},
+        {"name": "rs6269442", "Mb": 3.492195, "chr": 1},
+        {"name": "rs32285189", "Mb": 3.511204, "chr": "X"}]
+    assert os.path.exists(marker_files / ("BXD_snps.txt" + MARKER_TABLE_EXT))
+    cached = Markers("BXD")
+    assert isinstance(cached.table.names, np.memmap)
+    assert cached.markers == markers.markers
+
+
+def test_human_specified_markers(marker_files):
+    """Test that only the specified markers are loaded, in file order"""
+    markers = HumanMarkers("HLC", ["rs3934834", "rs3094315", "rs0"])
+    assert [marker["name"] for marker in markers.markers] == [
+        "rs3094315", "rs3934834"]
+    assert markers.markers[1]["Mb"] == 1.005806
+
+
+def test_add_pvalues_list(marker_files):
+    """Test that p-values are matched to markers by position"""
+    markers = Markers("BXD")
+    markers.add_pvalues([0.01, None, float("nan")])
+    assert markers.markers[0]["lod_score"] == pytest.approx(2)
+    assert markers.markers[0]["lrs_value"] == pytest.approx(9.22)
+    assert "p_value" not in markers.markers[1]
+    assert markers.markers[2]["lod_score"] == 0
+
+
+def test_add_pvalues_dict(marker_files):
+    """Test that markers without a p-value are dropped"""
+    markers = HumanMarkers("HLC")
+    markers.add_pvalues({"rs3934834": 0.001, "rs3094315": 0})
+    assert [(marker["name"], marker["lod_score"])
+            for marker in markers.markers] == [("rs3094315", 0),
+                                               ("rs3934834", pytest.approx(3))]
+    markers.add_pvalues({"rs3934834": 0.1})
+    assert len(markers.markers) == 1
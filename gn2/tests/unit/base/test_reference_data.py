@@ -0,0 +1,67 @@
+"""Tests for wqflask/base/reference_data.py"""
+import unittest
+from unittest import mock
+
+from gn2.base import reference_data
+from gn2.base.reference_data import clear_reference_data
+
+
+class TestReferenceData(unittest.TestCase):
+    """Tests for the memoized reference tables"""
+
+    def setUp(self):
+        clear_reference_data()
+        self.addCleanup(clear_reference_data)
+        patcher = mock.patch("gn2.base.reference_data.database_connection")
+        mock_db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = (mock_db.return_value.__enter__.return_value
+                       .cursor.return_value.__enter__.return_value)
+        self.stamp = [("Strain", "2024-01-01 00:00:00")]
+        self.cursor.fetchall.side_effect = self.__fetchall__
+
+    def __fetchall__(self):
+        query = self.cursor.execute.call_args[0][0]
+        if "information_schema" in query:
+            return self.stamp
+        if "FROM Species" in query:
+            return [(1, 1, "mouse"), (2, 2, "rat")]
+        if "FROM Chr_Length" in query:
+            return [(1, "1", 195), (1, "X", 171), (2, "1", 282)]
+        if "FROM Strain" in query:
+            return [(1, "BXD1", 11), (1, "BXD2", 12), (2, "BXD1", 21)]
+        return [("BXD", 1, 1, "riset", "BXD"), ("HSNIH-Palmer", 2, 2,
+                                                 "outbred", "HSNIH")]
+
+    def test_lookups(self):
+        """Test the lookups from the loaded tables"""
+        self.assertEqual(reference_data.species_chromosomes(species="Mouse"),
+                         [("1", 195), ("X", 171)])
+        self.assertEqual(reference_data.species_chromosomes(group="HSNIH-Palmer"),
+                         [("1", 282)])
+        self.assertEqual(reference_data.species_chromosomes(group="Unknown"), [])
+        self.assertEqual(
+            reference_data.strain_ids("mouse", ["BXD2", "BXD1", "BXD3"]),
+            {"BXD2": 12, "BXD1": 11})
+        self.assertEqual(reference_data.group_species("bxd"), "mouse")
+        self.assertEqual(reference_data.inbred_set("BXD")["InbredSetCode"],
+                         "BXD")
+        self.assertIsNone(reference_data.inbred_set("Unknown"))
+
+    @mock.patch("gn2.base.reference_data.get_setting_int", return_value=0)
+    def test_reloaded_when_stamp_changes(self, _ttl):
+        """Test that the tables are only loaded again once they change"""
+        reference_data.strain_ids("mouse", ["BXD1"])
+        reference_data.strain_ids("mouse", ["BXD1"])
+        self.assertEqual(self.cursor.execute.call_count, 6)
+
+        self.stamp = [("Strain", "2024-02-01 00:00:00")]
+        reference_data.strain_ids("mouse", ["BXD1"])
+        self.assertEqual(self.cursor.execute.call_count, 11)
+
+    @mock.patch("gn2.base.reference_data.get_setting_int", return_value=300)
+    def test_stamp_is_not_checked_every_time(self, _ttl):
+        """Test that within the TTL, lookups do not touch the database"""
+        reference_data.strain_ids("mouse", ["BXD1"])
+        reference_data.species_chromosomes(species="mouse")
+        self.assertEqual(self.cursor.execute.call_count, 5)
@@ -53,28 +53,15 @@ def test_create_ind_chromosome(name, length, mb_length):
 
 @pytest.mark.parametrize(
     ("species", "dataset", "expected_call"),
-    (("bxd", MockDataset(MockGroup("Random")),
-      ("SELECT Chr_Length.Name, Chr_Length.OrderId, Length "
-       "FROM Chr_Length, Species WHERE "
-       "Chr_Length.SpeciesId = Species.SpeciesId AND "
-       "Species.Name = %s "
-       "ORDER BY OrderId", ("Bxd",))),
-     (None, MockDataset(MockGroup("Random")),
-      ("SELECT Chr_Length.Name, Chr_Length.OrderId, "
-       "Length FROM Chr_Length, InbredSet WHERE "
-       "Chr_Length.SpeciesId = InbredSet.SpeciesId AND "
-       "InbredSet.Name = "
-       "%s ORDER BY OrderId", ("Random",)))))
+    (("bxd", MockDataset(MockGroup("Random")), {"species": "bxd"}),
+     (None, MockDataset(MockGroup("Random")), {"group": "Random"})))
 def test_create_chromosomes(mocker, species, dataset, expected_call):
-    mock_conn = mocker.MagicMock()
-    with mock_conn.cursor() as cursor:
-        cursor.fetchall.return_value = (("1", 2, 10,),
-                                        ("2", 3, 11,),
-                                        ("4", 5, 15,),)
-        _c = Chromosomes(dataset=dataset, species=species)
-        assert _c.chromosomes(cursor) == OrderedDict([
-            ("1", IndChromosome("1", 10)),
-            ("2", IndChromosome("2", 11)),
-            ("4", IndChromosome("4", 15)),
-        ])
-        cursor.execute.assert_called_with(*expected_call)
+    _reference = mocker.patch("gn2.base.species.species_chromosomes",
+                              return_value=[("1", 10), ("2", 11), ("4", 15)])
+    _c = Chromosomes(dataset=dataset, species=species)
+    assert _c.chromosomes() == OrderedDict([
+        ("1", IndChromosome("1", 10)),
+        ("2", IndChromosome("2", 11)),
+        ("4", IndChromosome("4", 15)),
+    ])
+    _reference.assert_called_with(**expected_call)
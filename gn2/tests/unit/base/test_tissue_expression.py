@@ -0,0 +1,73 @@
+"""Tests for wqflask/base/tissue_expression.py"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from gn2.base import tissue_expression
+from gn2.base.tissue_expression import clear_tissue_matrix, tissue_matrix
+
+
+class TestTissueMatrix(unittest.TestCase):
+    """Tests for the tissue expression matrix"""
+
+    def setUp(self):
+        clear_tissue_matrix()
+        self.addCleanup(clear_tissue_matrix)
+        self.matrix_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.matrix_dir.cleanup)
+        for patcher in (
+                mock.patch.object(tissue_expression, "TISSUE_MATRIX_DIR",
+                                  self.matrix_dir.name),
+                mock.patch("gn2.base.tissue_expression.get_setting_int",
+                           return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch("gn2.base.tissue_expression.database_connection")
+        mock_db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = (mock_db.return_value.__enter__.return_value
+                       .cursor.return_value.__enter__.return_value)
+        self.stamp = [("TissueProbeSetData", "2024-01-01 00:00:00")]
+        self.cursor.fetchall.side_effect = self.__fetchall__
+
+    def __fetchall__(self):
+        query = self.cursor.execute.call_args[0][0]
+        if "information_schema" in query:
+            return self.stamp
+        return [("Shh", 11, 9.5), ("Shh", 11, 8.0), ("Shh", 12, 1.0),
+                ("Brca2", 21, 7.5), ("Brca2", 21, None)]
+
+    def test_lookups(self):
+        """Test that the values of each symbol are looked up in any case"""
+        matrix = tissue_matrix()
+        np.testing.assert_array_equal(matrix.values_for("SHH"), [9.5, 8.0])
+        np.testing.assert_array_equal(
+            matrix.values_for("brca2"), [7.5, np.nan])
+        self.assertIsNone(matrix.values_for("Unknown"))
+        self.assertIsNone(matrix.values_for(None))
+        self.assertEqual(
+            list(matrix.positions(["brca2", None, "Shh", "Unknown"])),
+            [1, -1, 0, -1])
+
+    def test_matrix_is_reused_until_the_tables_change(self):
+        """Test that the matrix is read from disk, and only rebuilt once the
+        tables change"""
+        tissue_matrix()
+        clear_tissue_matrix()
+        matrix = tissue_matrix()
+        self.assertIsInstance(matrix.values, np.memmap)
+        queries = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(
+            len([query for query in queries if "TissueProbeSetData.value" in query]),
+            1)
+
+        self.stamp = [("TissueProbeSetData", "2024-02-01 00:00:00")]
+        tissue_matrix()
+        queries = [call[0][0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(
+            len([query for query in queries if "TissueProbeSetData.value" in query]),
+            2)
+        self.assertEqual(len(os.listdir(self.matrix_dir.name)), 2)
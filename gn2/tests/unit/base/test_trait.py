@@ -3,8 +3,13 @@
 import unittest
 from unittest import mock
 
+import numpy as np
+
+from gn2.base.data_set.dataset import BulkSampleData
 from gn2.base.trait import GeneralTrait
+from gn2.base.trait import create_traits
 from gn2.base.trait import retrieve_trait_info
+from gn2.base.trait import retrieve_traits_info
 
 
 class TestResponse:
@@ -260,3 +265,82 @@ class TestRetrieveTraitInfo(unittest.TestCase):
                          "N/A")
         self.assertEqual(test_trait.LRS_location_repr,
                          "N/A")
+
+
+class TestRetrieveTraitsInfo(unittest.TestCase):
+    """Tests for 'retrieve_traits_info' and 'create_traits'"""
+
+    def setUp(self):
+        self.dataset = mock.MagicMock()
+        self.dataset.type = "ProbeSet"
+        self.dataset.id = 7
+        self.dataset.display_fields = [
+            "name", "symbol", "description", "probe_target_description",
+            "chr", "mb"]
+
+    @mock.patch('gn2.base.trait.database_connection')
+    def test_retrieve_traits_info(self, mock_db):
+        """Test that info and QTL info are set for all traits in one query
+        each, leaving out the traits that are not found"""
+        cursor = (mock_db.return_value.__enter__.return_value
+                  .cursor.return_value.__enter__.return_value)
+        cursor.fetchall.side_effect = [
+            [("t1", "Shh", "sonic", None, "1", 10.5),
+             ("t2", "Ihh", None, None, "2", 20.25)],
+            [("t1", "rs1", 12.0, 0.01, 8.5, 0.2)],
+            [("rs1", "1", 3.5)]]
+        traits = [MockTrait(dataset=self.dataset, name=name,
+                            get_sample_info=False)
+                  for name in ("t1", "t2", "t3")]
+
+        found = retrieve_traits_info(traits, self.dataset, get_qtl_info=True)
+        self.assertEqual([trait.name for trait in found], ["t1", "t2"])
+        self.assertEqual(cursor.execute.call_count, 3)
+        (first, second) = found
+        self.assertEqual(first.description_display, "sonic")
+        self.assertEqual(first.location_repr, "Chr1: 10.500000")
+        self.assertEqual(first.LRS_score_repr, "12.0")
+        self.assertEqual(first.LRS_location_repr, "Chr1: 3.500000")
+        self.assertEqual(first.mean, 8.5)
+        self.assertEqual(second.description_display, "Ihh")
+        self.assertEqual(second.LRS_score_repr, "N/A")
+        self.assertEqual(second.LRS_location_repr, "N/A")
+
+    @mock.patch('gn2.base.trait.retrieve_traits_info')
+    @mock.patch('gn2.base.trait.check_traits_availability')
+    @mock.patch('gn2.base.trait.g', mock.Mock())
+    def test_create_traits_skips_inaccessible_traits(
+            self, availability_mock, retrieve_mock):
+        """Test that traits the user cannot access are not created"""
+        availability_mock.return_value = {
+            "t1": {"data": "no-access"}, "t2": {"data": "view"}}
+        retrieve_mock.side_effect = lambda traits, *args, **kwargs: list(traits)
+
+        traits = create_traits(self.dataset, ["t1", "t2"])
+        self.assertEqual(list(traits), ["t2"])
+
+
+    @mock.patch('gn2.base.trait.retrieve_traits_info')
+    @mock.patch('gn2.base.trait.check_traits_availability')
+    @mock.patch('gn2.base.trait.g', mock.Mock())
+    def test_create_traits_fetches_sample_data_in_bulk(
+            self, availability_mock, retrieve_mock):
+        """Test that the sample data of all the traits is fetched at once,
+        and not again for each trait"""
+        availability_mock.return_value = {
+            "t1": {"data": "view"}, "t2": {"data": "view"}}
+        retrieve_mock.side_effect = lambda traits, *args, **kwargs: list(traits)
+        self.dataset.retrieve_sample_data_bulk.return_value = BulkSampleData(
+            ["t1", "t2"], ["BXD1", "BXD2"], ["B1", "B2"],
+            np.array([[1.0, 2.0], [3.0, np.nan]]), np.full((2, 2), np.nan),
+            np.full((2, 2), np.nan), np.array([[True, True], [True, False]]))
+
+        traits = create_traits(self.dataset, ["t1", "t2"],
+                               get_sample_info=True)
+        self.dataset.retrieve_sample_data_bulk.assert_called_once_with(
+            ["t1", "t2"])
+        self.dataset.retrieve_sample_data.assert_not_called()
+        self.assertEqual(
+            {name: trait.value for (name, trait) in traits["t1"].data.items()},
+            {"BXD1": 1.0, "BXD2": 2.0})
+        self.assertEqual(list(traits["t2"].data), ["BXD1"])
@@ -0,0 +1,68 @@
+"""Tests for wqflask/base/trait_sample_data.py"""
+import unittest
+
+import numpy as np
+
+from gn2.wqflask import app  # Required because of utility.tools in webqtlCaseData.py
+from gn2.base.webqtlCaseData import webqtlCaseData
+from gn2.base.trait_sample_data import TraitSampleData
+
+
+class TestTraitSampleData(unittest.TestCase):
+    """Tests for the TraitSampleData class"""
+
+    def setUp(self):
+        self.data = TraitSampleData.from_rows([
+            ("BXD1", 9.5, 0.25, 3, "B1"),
+            ("BXD2", None, None, None, "B2"),
+            ("BXD5", 8.0, None, 2, "B5")])
+
+    def test_mapping_of_cases(self):
+        """Test that the samples are looked up as webqtlCaseData"""
+        self.assertEqual(list(self.data), ["BXD1", "BXD2", "BXD5"])
+        self.assertIn("BXD2", self.data)
+        self.assertNotIn("BXD3", self.data)
+        case = self.data["BXD1"]
+        self.assertEqual((case.name, case.value, case.variance,
+                          case.num_cases, case.name2),
+                         ("BXD1", 9.5, 0.25, 3, "B1"))
+        self.assertIsNone(self.data["BXD2"].value)
+        with self.assertRaises(KeyError):
+            self.data["BXD3"]
+
+    def test_cases_keep_their_attributes(self):
+        """Test that a sample is looked up as the same case object"""
+        self.data["BXD1"].outlier = True
+        self.assertIs(self.data["BXD1"], self.data["BXD1"])
+        self.assertTrue(self.data["BXD1"].outlier)
+
+    def test_values_for(self):
+        """Test that values are read from the arrays, in the order asked"""
+        np.testing.assert_array_equal(
+            self.data.values_for(["BXD5", "BXD3", "BXD1", "BXD2"]),
+            [8.0, np.nan, 9.5, np.nan])
+        np.testing.assert_array_equal(
+            self.data.variances_for(["BXD1", "BXD5"]), [0.25, np.nan])
+        own_values = self.data.values_for(["BXD1", "BXD2", "BXD5"])
+        self.assertTrue(np.shares_memory(own_values, self.data.values))
+        self.assertFalse(own_values.flags.writeable)
+        np.testing.assert_array_equal(
+            TraitSampleData().values_for(["BXD1"]), [np.nan])
+
+    def test_set_and_delete_samples(self):
+        """Test that changes through the mapping update the arrays"""
+        self.data["BXD2"] = webqtlCaseData("BXD2", 7.0)
+        self.data["BXD6"] = webqtlCaseData("BXD6", 6.5, 0.5, None, "B6")
+        del self.data["BXD1"]
+        self.assertEqual(list(self.data), ["BXD2", "BXD5", "BXD6"])
+        np.testing.assert_array_equal(self.data.values_for(), [7.0, 8.0, 6.5])
+        self.assertEqual(self.data.names2, [None, "B5", "B6"])
+        self.data.clear()
+        self.assertEqual(len(self.data), 0)
+
+    def test_from_cases(self):
+        """Test that the data can be built from a dict of cases"""
+        case = webqtlCaseData("BXD1", 1.5)
+        data = TraitSampleData({"BXD1": case})
+        self.assertIs(data["BXD1"], case)
+        np.testing.assert_array_equal(data.values_for(), [1.5])
@@ -38,3 +38,11 @@ class TestWebqtlCaseData(unittest.TestCase):
         self.assertEqual(self.w.display_num_cases, "10")
         self.w.num_cases = None
         self.assertEqual(self.w.display_num_cases, "x")
+
+    def test_to_dict(self):
+        """Test that the attributes set on the case are serialized"""
+        self.w.extra_info = "Sex: M"
+        self.assertEqual(self.w.to_dict(), {
+            "name": "Test", "name2": "Test2", "value": 0, "variance": 0.0,
+            "num_cases": 10, "extra_attributes": None, "this_id": None,
+            "outlier": None, "extra_info": "Sex: M"})
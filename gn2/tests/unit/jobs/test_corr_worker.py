@@ -0,0 +1,45 @@
+"""Tests for computing correlations in worker processes"""
+import json
+import pickle
+from uuid import uuid4
+
+import pytest
+
+from gn2.scripts import corr_worker
+
+
+@pytest.fixture
+def correlation_job(mocker, tmp_path):
+    """A queued correlation job, with its form in a file"""
+    inputs_file = tmp_path / "form"
+    inputs_file.write_bytes(pickle.dumps({"corr_type": "sample"}))
+    conn = mocker.MagicMock()
+    conn.hgetall.return_value = {
+        "inputs-file": str(inputs_file), "user-id": "a-user",
+        "status": "queued"}
+    return conn
+
+
+def __completion__(conn):
+    return conn.hset.call_args.kwargs["mapping"]
+
+
+def test_run_correlation_job(mocker, correlation_job):
+    """Test that the results are recorded as the job's output"""
+    compute = mocker.patch("gn2.scripts.corr_worker.compute",
+                           return_value={"target_dataset": "BXDPublish"})
+    corr_worker.run_correlation_job(correlation_job, uuid4())
+    compute.assert_called_once_with({"corr_type": "sample"})
+    completion = __completion__(correlation_job)
+    assert completion["completion-status"] == "success"
+    assert json.loads(completion["stdout"]) == {"target_dataset": "BXDPublish"}
+
+
+def test_correlation_job_errors(mocker, correlation_job):
+    """Test that failed computations complete the job with an error"""
+    mocker.patch("gn2.scripts.corr_worker.compute",
+                 side_effect=KeyError("MemoryError"))
+    corr_worker.run_correlation_job(correlation_job, uuid4())
+    completion = __completion__(correlation_job)
+    assert completion["completion-status"] == "error"
+    assert "KeyError" in completion["stderr"]
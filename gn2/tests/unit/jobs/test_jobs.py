@@ -0,0 +1,53 @@
+"""Tests for queueing jobs for workers"""
+from uuid import uuid4
+
+from gn2.jobs import jobs
+
+
+def test_submit_to_workers(mocker):
+    """Test that jobs are queued for the workers while they are alive"""
+    conn = mocker.MagicMock()
+    conn.exists.return_value = 1
+    run = mocker.patch("gn2.jobs.jobs.run")
+    job_id = uuid4()
+    jobs.submit(conn, jobs.CORRELATION_QUEUE, job_id, "redis://localhost")
+    conn.rpush.assert_called_once_with(
+        "gn2:jobs:queue:correlations", str(job_id))
+    run.assert_not_called()
+
+
+def test_submit_without_workers(mocker):
+    """Test that jobs are run in an external process if no workers are
+    alive"""
+    conn = mocker.MagicMock()
+    conn.exists.return_value = 0
+    run = mocker.patch("gn2.jobs.jobs.run")
+    job_id = uuid4()
+    jobs.submit(conn, jobs.CORRELATION_QUEUE, job_id, "redis://localhost")
+    conn.rpush.assert_not_called()
+    run.assert_called_once_with(job_id, "redis://localhost")
+
+
+def test_run_orphaned_jobs(mocker):
+    """Test that the jobs left queued once the workers are gone are run in
+    external processes"""
+    conn = mocker.MagicMock()
+    conn.exists.return_value = 0
+    (first, second) = (uuid4(), uuid4())
+    conn.lpop.side_effect = [str(first), str(second), None]
+    run = mocker.patch("gn2.jobs.jobs.run")
+    jobs.run_orphaned(conn, jobs.CORRELATION_QUEUE, "redis://localhost")
+    conn.lpop.assert_called_with("gn2:jobs:queue:correlations")
+    assert run.call_args_list == [
+        mocker.call(first, "redis://localhost"),
+        mocker.call(second, "redis://localhost")]
+
+
+def test_queued_jobs_are_left_to_workers(mocker):
+    """Test that queued jobs are left to the workers while they are alive"""
+    conn = mocker.MagicMock()
+    conn.exists.return_value = 1
+    run = mocker.patch("gn2.jobs.jobs.run")
+    jobs.run_orphaned(conn, jobs.CORRELATION_QUEUE, "redis://localhost")
+    conn.lpop.assert_not_called()
+    run.assert_not_called()
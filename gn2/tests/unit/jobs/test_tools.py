@@ -0,0 +1,56 @@
+"""Tests for running external tools as tracked jobs"""
+import pytest
+
+from gn2.jobs import tools
+
+
+@pytest.fixture
+def redis_conn(mocker):
+    """A mock Redis connection, with every slot free"""
+    redis_mock = mocker.patch("gn2.jobs.tools.Redis")
+    conn = redis_mock.from_url.return_value.__enter__.return_value
+    conn.eval.return_value = 1
+    mocker.patch("gn2.jobs.tools.get_setting_int", return_value=2)
+    mocker.patch("gn2.jobs.tools.POLL_INTERVAL", 0.01)
+    return conn
+
+
+def __job_updates__(conn):
+    return [call.kwargs.get("mapping", {}) for call in conn.hset.call_args_list]
+
+
+def test_run_tool(redis_conn):
+    """Test that the output and exit code of a run are recorded"""
+    assert tools.run_tool("gemma", "echo mapped; echo oops >&2; exit 3") == 3
+    (job_record, *_rest, result) = __job_updates__(redis_conn)
+    assert job_record["tool"] == "gemma"
+    assert result["completion-status"] == "error"
+    assert result["return-code"] == 3
+    assert (result["stdout"], result["stderr"]) == ("mapped\n", "oops\n")
+    redis_conn.zrem.assert_called()
+
+
+def test_run_tool_waits_for_a_slot(redis_conn):
+    """Test that a tool is only started once slots are free"""
+    redis_conn.eval.side_effect = [0, 0, 1]
+    assert tools.run_tool("plink", "true") == 0
+    assert redis_conn.eval.call_count == 3
+    ((_script, n_keys, *keys_and_args), _kwargs) = redis_conn.eval.call_args
+    assert keys_and_args[:n_keys] == ["gn2:jobs:slots:plink", "gn2:jobs:slots:cpu"]
+
+
+def test_run_tool_timeout(redis_conn):
+    """Test that a tool that never gets a slot is not run"""
+    redis_conn.eval.return_value = 0
+    with pytest.raises(tools.ToolTimeout):
+        tools.run_tool("reaper", "true", timeout=0.05)
+
+
+def test_slot_timeout(mocker):
+    """Test that web requests wait less for a slot than background jobs"""
+    settings = {"TOOL_SLOT_TIMEOUT": 3600, "REQUEST_TOOL_SLOT_TIMEOUT": 30}
+    mocker.patch("gn2.jobs.tools.get_setting_int", side_effect=settings.get)
+    mocker.patch("gn2.jobs.tools.has_request_context", return_value=False)
+    assert tools.slot_timeout() == 3600
+    mocker.patch("gn2.jobs.tools.has_request_context", return_value=True)
+    assert tools.slot_timeout() == 30
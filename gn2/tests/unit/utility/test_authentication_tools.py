@@ -4,6 +4,8 @@ from unittest import mock
 
 from gn2.utility.authentication_tools import check_resource_availability
 from gn2.utility.authentication_tools import add_new_resource
+from gn2.utility.authentication_tools import check_traits_availability
+from gn2.utility.authentication_tools import clear_privileges_cache
 
 
 class TestResponse:
@@ -38,6 +40,10 @@ def mock_add_resource(resource_ob, update=False):
 
 class TestCheckResourceAvailability(unittest.TestCase):
     """Test methods related to checking the resource availability"""
+
+    def setUp(self):
+        clear_privileges_cache()
+
     @mock.patch('gn2.utility.authentication_tools.add_new_resource')
     @mock.patch('gn2.utility.authentication_tools.Redis')
     @mock.patch('gn2.utility.authentication_tools.g', TestUserSession())
@@ -117,6 +123,54 @@ class TestCheckResourceAvailability(unittest.TestCase):
                          "John Doe")
 
 
+class TestCheckTraitsAvailability(unittest.TestCase):
+    """Test cases for the batched, cached availability checks"""
+
+    def setUp(self):
+        clear_privileges_cache()
+        self.dataset = mock.MagicMock()
+        self.dataset.type = "Publish"
+        self.dataset.id = 10
+
+    @mock.patch('gn2.utility.authentication_tools.requests.get')
+    @mock.patch('gn2.utility.authentication_tools.Redis')
+    def test_privileges_are_cached(self, redis_mock, requests_mock):
+        """Test that each resource is only asked for once, and again once the
+        permissions have changed"""
+        redis_mock.hmget.side_effect = lambda _key, ids: [
+            '{"default_mask": {"data": "no-access"}}'] * len(ids)
+        redis_mock.smembers.return_value = []
+        redis_mock.get.return_value = b"1"
+        requests_mock.return_value = TestResponse()
+
+        self.assertEqual(
+            check_traits_availability(self.dataset, user_id, ["1", "2"]),
+            {"1": ["foo"], "2": ["foo"]})
+        check_traits_availability(self.dataset, user_id, ["1", "2", "3"])
+        self.assertEqual(requests_mock.call_count, 3)
+
+        redis_mock.get.return_value = b"2"
+        check_traits_availability(self.dataset, user_id, ["1"])
+        self.assertEqual(requests_mock.call_count, 4)
+
+    @mock.patch('gn2.utility.authentication_tools.requests.get')
+    @mock.patch('gn2.utility.authentication_tools.Redis')
+    def test_default_mask_is_not_cached(self, redis_mock, requests_mock):
+        """Test that the default mask is used, but not cached, when the proxy
+        does not answer"""
+        redis_mock.hmget.return_value = [
+            '{"default_mask": {"data": "no-access"}}']
+        redis_mock.smembers.return_value = []
+        redis_mock.get.return_value = b"1"
+        requests_mock.side_effect = ConnectionError
+
+        for _ in range(2):
+            self.assertEqual(
+                check_traits_availability(self.dataset, user_id, ["1"]),
+                {"1": {"data": "no-access"}})
+        self.assertEqual(requests_mock.call_count, 2)
+
+
 class TestAddNewResource(unittest.TestCase):
     """Test cases for add_new_resource method"""
     @mock.patch('gn2.utility.authentication_tools.webqtlConfig.DEFAULT_PRIVILEGES',
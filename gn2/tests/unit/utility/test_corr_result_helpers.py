@@ -1,7 +1,13 @@
 """ Test correlation helper methods """
 
 import unittest
-from gn2.utility.corr_result_helpers import normalize_values, common_keys, normalize_values_with_samples
+
+import numpy as np
+from scipy import stats
+
+from gn2.utility.corr_result_helpers import (
+    normalize_values, common_keys, normalize_values_with_samples,
+    correlations_with_vector, largest_indices)
 
 
 class TestCorrelationHelpers(unittest.TestCase):
@@ -30,3 +36,32 @@ class TestCorrelationHelpers(unittest.TestCase):
                 dict(BXD1=9.723, BXD3=9.825, BXD14=9.124, BXD16=9.300)),
             (({'BXD1': 9.113, 'BXD14': 8.985}, {'BXD1': 9.723, 'BXD14': 9.124}, 2))
         )
+
+    def test_correlations_with_vector(self):
+        """Test that each row is correlated over the samples both have values
+        for, as scipy would"""
+        vector = np.array([1.0, 2.5, np.nan, 4.0, 3.0, 6.5, 5.0])
+        rows = np.array([
+            [2.0, 3.0, 1.0, 5.5, 4.0, 7.0, np.nan],
+            [7.0, 1.0, 2.0, 3.0, np.nan, 2.0, 9.0],
+            [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]])
+        for (method, scipy_corr) in (("pearson", stats.pearsonr),
+                                     ("spearman", stats.spearmanr)):
+            (corrs, p_values, counts) = correlations_with_vector(
+                vector, rows, method)
+            self.assertEqual(list(counts), [5, 5, 6])
+            for row in range(2):
+                shared = ~np.isnan(vector) & ~np.isnan(rows[row])
+                (expected_r, expected_p) = scipy_corr(
+                    vector[shared], rows[row][shared])
+                self.assertAlmostEqual(corrs[row], expected_r)
+                self.assertAlmostEqual(p_values[row], expected_p)
+            self.assertTrue(np.isnan(corrs[2]))
+
+    def test_largest_indices(self):
+        """Test that the positions of the largest scores come largest first"""
+        self.assertEqual(
+            list(largest_indices(np.array([0.2, 0.9, 0.1, 0.5, 0.7]), 3)),
+            [1, 4, 3])
+        self.assertEqual(list(largest_indices(np.array([0.2, 0.9]), 5)), [1, 0])
+        self.assertEqual(list(largest_indices(np.array([0.2, 0.9]), 0)), [])
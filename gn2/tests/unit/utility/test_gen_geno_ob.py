@@ -0,0 +1,94 @@
+"""Test the genotype objects in gen_geno_ob"""
+import os
+
+import numpy as np
+import pytest
+
+from gn2.utility.gen_geno_ob import genotype
+from gn2.utility.gen_geno_ob import GenotypeMatrix
+from gn2.utility.gen_geno_ob import UNKNOWN_GENOTYPE
+from gn2.utility.gen_geno_ob import load_genotype
+from gn2.utility.gen_geno_ob import sidecar_paths
+
+GENO_FILE = """# A test genotype file
+@name:BXD
+@type:riset
+@mat:B
+@pat:D
+@het:H
+@unk:U
+Chr\tLocus\tcM\tMb\tBXD1\tBXD2\tBXD5
+1\trs31443144\t1.50\t3.010274\tB\tD\tH
+1\trs6269442\t\t3.492195\tU\tB\tX
+2\trs32285189\t2.84\t3.511204\tD\tD\tB
+"""
+
+
+@pytest.fixture
+def geno_file(tmp_path):
+    file_path = tmp_path / "BXD.geno"
+    file_path.write_text(GENO_FILE)
+    return str(file_path)
+
+
+def test_genotype_matrix_arrays(geno_file):
+    """Test that the markers are read into parallel arrays"""
+    geno_ob = GenotypeMatrix(geno_file)
+    assert (geno_ob.group, geno_ob.mat, geno_ob.pat) == ("BXD", "B", "D")
+    assert geno_ob.prgy == ["BXD1", "BXD2", "BXD5"]
+    assert geno_ob.genotypes.tolist() == [
+        [-1, 1, 0],
+        [UNKNOWN_GENOTYPE, -1, UNKNOWN_GENOTYPE],
+        [1, 1, -1]]
+    assert geno_ob.names.tolist() == ["rs31443144", "rs6269442", "rs32285189"]
+
+
+def test_genotype_matrix_views(geno_file):
+    """Test that the Chr/Locus views match the object-based genotype"""
+    geno_ob = GenotypeMatrix(geno_file)
+    old_geno_ob = genotype(geno_file)
+    assert [_chr.name for _chr in geno_ob] == ["1", "2"]
+    assert len(geno_ob[0]) == 2
+    for (old_chr, new_chr) in zip(old_geno_ob, geno_ob):
+        for (old_locus, new_locus) in zip(old_chr, new_chr):
+            assert (new_locus.chr, new_locus.name, new_locus.cM,
+                    new_locus.Mb) == (old_locus.chr, old_locus.name,
+                                      old_locus.cM, old_locus.Mb)
+            # `genotype` keeps the line ending on the last allele, which then
+            # reads as unknown
+            assert new_locus.genotype[:-1] == old_locus.genotype[:-1]
+    assert geno_ob[0][-1].cM == 3.492195
+    assert geno_ob[0][1].genotype == ["U", -1, "U"]
+
+
+def test_read_rdata_output(geno_file):
+    """Test that R/qtl results replace the markers"""
+    geno_ob = GenotypeMatrix(geno_file).read_rdata_output([
+        {"chr": 1, "name": "m1", "cM": 0.5, "Mb": 3.1},
+        {"chr": 20, "name": "m2", "cM": 1.5, "Mb": 4.2}])
+    assert [_chr.name for _chr in geno_ob] == ["1", "X"]
+    assert geno_ob[1][0].name == "m2"
+    assert geno_ob[1][0].genotype == []
+
+
+def test_load_genotype_sidecar(geno_file):
+    """Test that parsed genotypes are cached in a sidecar next to the file"""
+    (sidecar_path,) = sidecar_paths(geno_file)
+    parsed = load_genotype(geno_file)
+    cached = load_genotype(geno_file)
+    assert os.path.exists(sidecar_path)
+    assert isinstance(cached.genotypes, np.memmap)
+    assert cached.genotypes.tolist() == parsed.genotypes.tolist()
+    assert cached.prgy == parsed.prgy
+    assert [locus.name for locus in cached[0]] == ["rs31443144", "rs6269442"]
+
+
+def test_stale_sidecar_is_rebuilt(geno_file):
+    """Test that a sidecar is ignored once its .geno file changes"""
+    load_genotype(geno_file)
+    with open(geno_file, "a") as file_handler:
+        file_handler.write("2\trs1\t3.0\t4.0\tB\tB\tB\n")
+    geno_ob = load_genotype(geno_file)
+    assert len(geno_ob[1]) == 2
+    assert not isinstance(geno_ob.genotypes, np.memmap)
+
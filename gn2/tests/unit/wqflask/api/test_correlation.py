@@ -7,6 +7,10 @@ from gn2.wqflask.api.correlation import convert_to_mouse_gene_id
 from gn2.wqflask.api.correlation import do_literature_correlation_for_all_traits
 from gn2.wqflask.api.correlation import get_sample_r_and_p_values
 from gn2.wqflask.api.correlation import calculate_results
+from gn2.base.trait_sample_data import TraitSampleData
+
+import numpy as np
+from scipy import stats
 
 
 class AttributeSetter:
@@ -173,3 +177,41 @@ class TestCorrelations(unittest.TestCase):
 
         self.assertTrue(isinstance(sorted_results, OrderedDict))
         self.assertEqual(dict(sorted_results), expected_results)
+
+    def test_calculate_results_for_samples(self):
+        """Test that the sample correlations are computed from the target
+        dataset's trait matrix, strongest first"""
+        samples = ["BXD1", "BXD2", "BXD3", "BXD4", "BXD5", "BXD6", "BXD7"]
+        this_values = [1.0, 2.5, 3.5, 4.0, 3.0, 6.5, None]
+        this_trait = AttributeSetter({"data": TraitSampleData.from_rows(
+            [(sample, value, None, None, None)
+             for (sample, value) in zip(samples, this_values)])})
+        trait_matrix = np.array([
+            [2.0, 3.0, 1.0, 5.5, 4.0, 7.0, 2.0],
+            [7.0, 1.0, 6.0, 3.0, 5.0, 2.0, 9.0],
+            [1.0, np.nan, 2.0, 3.0, np.nan, 5.0, 6.0],
+            [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]])
+        target_dataset = MockDataset({
+            "group": AttributeSetter({"samplelist": samples}),
+            "trait_names": ["T1", "T2", "T3", "T4"],
+            "trait_matrix": trait_matrix})
+
+        results = calculate_results(
+            this_trait=this_trait, this_dataset=None,
+            target_dataset=target_dataset,
+            corr_params={"type": "sample", "method": "pearson",
+                         "return_count": 2})
+
+        # T3 shares only 4 samples with the trait, so it is left out
+        expected = {}
+        for (name, row) in (("T1", 0), ("T2", 1), ("T4", 3)):
+            (corr, p_value) = stats.pearsonr(
+                this_values[:6], trait_matrix[row][:6])
+            expected[name] = (corr, p_value)
+        strongest = sorted(expected, key=lambda name: -abs(expected[name][0]))
+        self.assertEqual(list(results), strongest[:2])
+        for name in strongest[:2]:
+            (corr, p_value, num_overlap) = results[name]
+            self.assertAlmostEqual(corr, expected[name][0])
+            self.assertAlmostEqual(p_value, expected[name][1])
+            self.assertEqual(num_overlap, 6)
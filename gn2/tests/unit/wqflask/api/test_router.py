@@ -0,0 +1,95 @@
+"""Tests for wqflask/api/router.py"""
+import tempfile
+import collections
+import unittest
+from unittest import mock
+
+from flask import g
+
+from gn2.wqflask import app
+# Registers the page the users without access are sent to
+from gn2.wqflask import views  # pylint: disable=unused-import
+from gn2.wqflask.api.router import (
+    sample_data_rows, geno_file_rows, db_pool_metrics,
+    get_dataset_trait_ids, dataset_cache_metrics)
+
+
+class TestRouter(unittest.TestCase):
+    """Tests for the helpers of the bulk endpoints"""
+
+    def test_sample_data_rows(self):
+        """Test that each sample gets one row with its value for each trait"""
+        results = [("BXD1", 2, 9.5), ("BXD1", 1, 8.0), ("BXD1", 7, 1.0),
+                   ("BXD2", 1, 7.5), ("BXD9", 1, 6.0), ("BXD5", 2, 5.5)]
+        self.assertEqual(
+            list(sample_data_rows(iter(results), [1, 2],
+                                  ["BXD1", "BXD2", "BXD3", "BXD5"])),
+            [["BXD1", 8.0, 9.5], ["BXD2", 7.5, "x"], ["BXD5", "x", 5.5],
+             ["BXD3", "x", "x"]])
+
+    def test_geno_file_rows(self):
+        """Test that the header lines are kept and the markers limited"""
+        with tempfile.NamedTemporaryFile("w", suffix=".geno") as genofile:
+            genofile.write("#comment\n@type:riset\nChr\tLocus\tBXD1\n"
+                           "1\trs1\tB\n1\trs2\tD\n")
+            genofile.flush()
+            self.assertEqual(
+                list(geno_file_rows(genofile.name, 2)),
+                [["#comment"], ["@type:riset"], ["Chr", "Locus", "BXD1"],
+                 ["1", "rs1", "B"]])
+
+
+class TestGetDatasetTraitIds(unittest.TestCase):
+    """Tests for fetching the trait ids of a dataset"""
+
+    @mock.patch("gn2.wqflask.api.router.database_connection")
+    def test_limit_is_a_parameter(self, mock_db):
+        """Test that only numeric limits are used, and as query parameters"""
+        cursor = mock_db.return_value.__enter__.return_value.cursor\
+            .return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(1, "rs1", 3)]
+        self.assertEqual(
+            get_dataset_trait_ids("BXDGeno", {"limit_to": "10"}),
+            ([1], ["rs1"], "Geno", 3))
+        query, params = cursor.execute.call_args[0]
+        self.assertTrue(query.endswith("LIMIT %s"))
+        self.assertEqual(params, ("BXDGeno", 10))
+
+        get_dataset_trait_ids("BXDGeno", {"limit_to": "1; DROP TABLE Geno"})
+        query, params = cursor.execute.call_args[0]
+        self.assertNotIn("LIMIT", query)
+        self.assertNotIn("DROP", query)
+        self.assertEqual(params, ("BXDGeno",))
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for the super-users' metrics endpoints"""
+
+    @mock.patch("gn2.wqflask.api.router.pool_metrics")
+    @mock.patch("gn2.utility.authentication_tools.is_super_user")
+    def test_super_users_only(self, mock_is_super_user, mock_pool_metrics):
+        """Test that only the super-users get the pool metrics"""
+        mock_pool_metrics.return_value = {"db_webqtl": {"size": 5}}
+        with app.test_request_context("/api/v_pre1/db_pool_metrics"):
+            g.user_session = mock.Mock(user_id="a-user")
+            mock_is_super_user.return_value = False
+            response = db_pool_metrics()
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response.location.endswith("/authentication_needed"))
+            mock_pool_metrics.assert_not_called()
+
+            mock_is_super_user.return_value = True
+            self.assertEqual(db_pool_metrics().get_json(),
+                             {"db_webqtl": {"size": 5}})
+        mock_is_super_user.assert_called_with("a-user")
+
+    @mock.patch("gn2.wqflask.api.router.DATASET_CACHE_STATS",
+                collections.Counter(hits=3, misses=1))
+    @mock.patch("gn2.utility.authentication_tools.is_super_user",
+                return_value=True)
+    def test_dataset_cache_metrics(self, _is_super_user):
+        """Test that the super-users get the dataset cache statistics"""
+        with app.test_request_context("/api/v_pre1/dataset_cache_metrics"):
+            g.user_session = mock.Mock(user_id="a-user")
+            self.assertEqual(dataset_cache_metrics().get_json(),
+                             {"hits": 3, "misses": 1})
@@ -0,0 +1,62 @@
+"""Tests for wqflask/api/streaming.py"""
+import gzip
+import json
+import unittest
+from unittest import mock
+from decimal import Decimal
+
+from gn2.wqflask import app
+from gn2.wqflask.api import streaming
+
+
+class TestStreaming(unittest.TestCase):
+    """Tests for the streamed response helpers"""
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @mock.patch("gn2.wqflask.api.streaming.BATCH_SIZE", 2)
+    @mock.patch("gn2.wqflask.api.streaming.database_connection")
+    def test_query_rows(self, mock_db):
+        """Test that the rows are fetched from the cursor in batches"""
+        cursor = (mock_db.return_value.__enter__.return_value
+                  .cursor.return_value.__enter__.return_value)
+        cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+        self.assertEqual(list(streaming.query_rows("SELECT 1", (4,))),
+                         [(1,), (2,), (3,)])
+        cursor.execute.assert_called_once_with("SELECT 1", (4,))
+        cursor.fetchmany.assert_called_with(2)
+
+    @mock.patch("gn2.wqflask.api.streaming.BATCH_SIZE", 2)
+    def test_csv_and_json_chunks(self):
+        """Test that the rows are written a batch at a time"""
+        rows = [["a", 1], ["b", None], ["c", 2.5]]
+        self.assertEqual(list(streaming.csv_chunks(iter(rows))),
+                         ["a,1\r\nb,\r\n", "c,2.5\r\n"])
+        chunks = list(streaming.json_array_chunks(
+            {"name": name, "mean": Decimal("1.5")} for (name, _value) in rows))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(json.loads("".join(chunks)),
+                         [{"name": name, "mean": "1.5"} for (name, _value) in rows])
+        self.assertEqual("".join(streaming.json_array_chunks([])), "[]")
+
+    def test_streamed_response(self):
+        """Test that the response is gzipped only if the client accepts it"""
+        with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+            response = streaming.streamed_response(
+                iter(["id,value\r\n", "x,1\r\n"]), "text/csv", "data.csv")
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(response.headers["Content-Disposition"],
+                             "attachment; filename=data.csv")
+            self.assertEqual(gzip.decompress(b"".join(response.response)),
+                             b"id,value\r\nx,1\r\n")
+
+        with app.test_request_context():
+            response = streaming.streamed_response(
+                iter(["[", "]"]), "application/json")
+            self.assertNotIn("Content-Encoding", response.headers)
+            self.assertEqual(response.get_data(), b"[]")
@@ -3,7 +3,12 @@
 import unittest
 from unittest import mock
 
+import numpy as np
+from scipy import stats
+
+from gn2.base.tissue_expression import TissueMatrix
 from gn2.wqflask.correlation.correlation_functions import get_trait_symbol_and_tissue_values
+from gn2.wqflask.correlation.correlation_functions import tissue_correlations
 from gn2.wqflask.correlation.correlation_functions import cal_zero_order_corr_for_tiss
 
 
@@ -19,3 +24,29 @@ def test_tissue_corr_computation(mocker):
         primary_values=primary_values, target_values=target_values,
         corr_method="pearson")
     assert len(results) == 3
+
+
+def test_tissue_correlations(mocker):
+    """Test that the traits are correlated on their symbols' tissue
+    expression, strongest first"""
+    matrix = TissueMatrix(
+        (), ["shh", "brca2", "actb", "flat"],
+        np.array([[9.3, 9.3, 9.0, 9.7, 8.2],
+                  [9.6, 8.5, 9.4, 8.8, 8.8],
+                  [1.0, 2.0, 0.5, 3.0, 0.1],
+                  [1.0, 1.0, 1.0, 1.0, 1.0]]))
+    mocker.patch(
+        "gn2.wqflask.correlation.correlation_functions.tissue_matrix",
+        return_value=matrix)
+    results = tissue_correlations(
+        "Shh", {"T1": "Brca2", "T2": "Unknown", "T3": "ACTB", "T4": "Flat",
+                "T5": None})
+    assert list(results) == ["T3", "T1"]
+    for (trait, row) in (("T1", 1), ("T3", 2)):
+        (corr, num_tissues, p_value) = results[trait]
+        (expected_corr, expected_p) = stats.pearsonr(
+            matrix.values[0], matrix.values[row])
+        assert abs(corr - expected_corr) < 1e-9
+        assert abs(p_value - expected_p) < 1e-9
+        assert num_tissues == 5
+    assert tissue_correlations("Unknown", {"T1": "Brca2"}) is None
@@ -0,0 +1,82 @@
+"""module contains tests for the staleness checks of the trait matrices"""
+from unittest import mock
+
+import pytest
+
+from gn2.wqflask.correlation import pre_computes
+
+
+@pytest.fixture
+def matrix_file(mocker, tmp_path):
+    """A matrix file, its manifest, and a dataset of 10 rows"""
+    mocker.patch("gn2.wqflask.correlation.pre_computes.get_setting_int",
+                 return_value=60)
+    pre_computes.DATASET_ROW_COUNTS.clear()
+    file_path = tmp_path / "ProbeSetFreezeId_1_test.tmat"
+    file_path.write_bytes(b"")
+    conn = mock.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (10,)
+    yield ({"file_path": str(file_path), "row_count": 10,
+            "timestamp": "2024-01-01 00:00:00"}, conn, cursor)
+    pre_computes.DATASET_ROW_COUNTS.clear()
+
+
+@pytest.mark.parametrize(
+    "timestamp,stale",
+    (("2024-01-01 00:00:00", False),
+     ("2024-02-01 00:00:00", True),
+     (None, False)))
+def test_text_file_is_stale(mocker, matrix_file, timestamp, stale):
+    """Test that the matrix is stale once the table is updated, but not while
+    the table's update time is unknown"""
+    (manifest, conn, _cursor) = matrix_file
+    mocker.patch("gn2.wqflask.correlation.pre_computes.query_table_timestamp",
+                 return_value=timestamp)
+    assert pre_computes.text_file_is_stale(manifest, conn, 1) is stale
+
+
+def test_stale_on_row_count_or_missing_file(mocker, matrix_file):
+    """Test that a matrix with another number of rows, or no file, is stale"""
+    (manifest, conn, cursor) = matrix_file
+    mocker.patch("gn2.wqflask.correlation.pre_computes.query_table_timestamp",
+                 return_value=None)
+    cursor.fetchone.return_value = (11,)
+    assert pre_computes.text_file_is_stale(manifest, conn, 1)
+    assert pre_computes.text_file_is_stale(
+        {**manifest, "file_path": "/does/not/exist"}, conn, 1)
+    assert pre_computes.text_file_is_stale({}, conn, 1)
+
+
+def test_row_count_is_memoized(mocker, matrix_file):
+    """Test that the rows are only counted once within the TTL"""
+    (manifest, conn, cursor) = matrix_file
+    mocker.patch("gn2.wqflask.correlation.pre_computes.query_table_timestamp",
+                 return_value=None)
+    for _ in range(3):
+        assert not pre_computes.text_file_is_stale(manifest, conn, 1)
+    assert cursor.execute.call_count == 1
+
+
+def test_fetch_text_file_rebuilds_stale_matrix(mocker, matrix_file, tmp_path):
+    """Test that a stale matrix is rebuilt in the background and still
+    served meanwhile, and a current one is left alone"""
+    (manifest, conn, cursor) = matrix_file
+    cursor.fetchone.return_value = (1, "Test Dataset")
+    mocker.patch("gn2.wqflask.correlation.pre_computes.read_matrix_manifest",
+                 return_value=manifest)
+    stale = mocker.patch(
+        "gn2.wqflask.correlation.pre_computes.text_file_is_stale",
+        return_value=True)
+    rebuild = mocker.patch(
+        "gn2.wqflask.correlation.pre_computes.rebuild_text_file_in_background")
+
+    assert pre_computes.fetch_text_file("Test", conn, str(tmp_path)) == \
+        manifest["file_path"]
+    rebuild.assert_called_once_with("Test", str(tmp_path))
+
+    rebuild.reset_mock()
+    stale.return_value = False
+    assert pre_computes.fetch_text_file("Test", conn, str(tmp_path)) == \
+        manifest["file_path"]
+    rebuild.assert_not_called()
@@ -0,0 +1,53 @@
+"""module contains tests for the binary trait matrix"""
+import math
+
+import pytest
+
+from gn2.wqflask.correlation.trait_matrix import TraitMatrix
+from gn2.wqflask.correlation.trait_matrix import build_trait_matrix
+from gn2.wqflask.correlation.trait_matrix import write_trait_matrix
+
+
+ROWS = (("trait_a", "BXD1", 7.5), ("trait_b", "BXD1", 8.25),
+        ("trait_a", "BXD2", 9.0), ("trait_b", "BXD2", None),
+        ("trait_a", "BXD5", 6.5), ("trait_b", "BXD5", 7.0))
+
+
+def test_build_trait_matrix():
+    """Test that long-format rows are pivoted into a traits x strains array"""
+    (traits, strains, values) = build_trait_matrix(ROWS)
+    assert traits == ["trait_a", "trait_b"]
+    assert strains == ["BXD1", "BXD2", "BXD5"]
+    assert values.shape == (2, 3)
+    assert values[0].tolist() == [7.5, 9.0, 6.5]
+    assert math.isnan(values[1, 1])
+
+
+def test_trait_matrix_round_trip(tmp_path):
+    """Test that a written matrix is read back with its indexes"""
+    file_path = write_trait_matrix(
+        str(tmp_path / "ProbeSetFreezeId_1_test.tmat"),
+        *build_trait_matrix(ROWS))
+    matrix = TraitMatrix(file_path)
+    assert matrix.traits == ["trait_a", "trait_b"]
+    assert matrix.strain_index == {"BXD1": 0, "BXD2": 1, "BXD5": 2}
+    assert matrix.values.shape == (3, 2)
+    assert list(tmp_path.iterdir()) == [tmp_path / "ProbeSetFreezeId_1_test.tmat"]
+
+
+def test_sample_rows(tmp_path):
+    """Test that only the selected samples are returned, in matrix order"""
+    file_path = write_trait_matrix(
+        str(tmp_path / "matrix.tmat"), *build_trait_matrix(ROWS))
+    (sample_vals, rows) = TraitMatrix(file_path).sample_rows(
+        {"BXD5": "1.2", "BXD2": "3.4", "BXD100": "5.6"})
+    assert sample_vals == ["3.4", "1.2"]
+    assert rows == [["trait_a", 9.0, 6.5], ["trait_b", None, 7.0]]
+
+
+def test_invalid_matrix_file(tmp_path):
+    """Test that a file without the matrix header is rejected"""
+    file_path = tmp_path / "not_a_matrix.tmat"
+    file_path.write_text("ID,BXD1\ntrait_a,7.5\n")
+    with pytest.raises(ValueError):
+        TraitMatrix(str(file_path))
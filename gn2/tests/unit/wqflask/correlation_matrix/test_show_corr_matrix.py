@@ -0,0 +1,58 @@
+"""Tests for the correlation matrix computations"""
+import unittest
+
+import numpy as np
+import scipy.stats
+
+from gn2.wqflask.correlation_matrix.show_corr_matrix import pearson_correlations
+from gn2.wqflask.correlation_matrix.show_corr_matrix import spearman_correlations
+
+
+class TestCorrelations(unittest.TestCase):
+    """Test that the pairwise correlations match scipy's, pair by pair"""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.values = np.round(rng.normal(10, 2, (12, 20)), 1)
+        self.values[rng.random(self.values.shape) < 0.2] = np.nan
+        self.values[4] = 3.0  # constant
+        self.values[5, 2:] = np.nan  # too few samples
+        self.target_masks = np.ones(self.values.shape, dtype=bool)
+        self.target_masks[7, :5] = False
+
+    def __pair__(self, row, col):
+        shared = (~np.isnan(self.values[row]) & ~np.isnan(self.values[col])
+                  & self.target_masks[col])
+        return self.values[row][shared], self.values[col][shared]
+
+    def test_pearson_correlations(self):
+        """Test Pearson coefficients, p-values and sample counts"""
+        (coefficients, p_values, counts) = pearson_correlations(
+            self.values, self.target_masks)
+        for row in range(len(self.values)):
+            for col in range(len(self.values)):
+                (x_vals, y_vals) = self.__pair__(row, col)
+                self.assertEqual(counts[row, col], len(x_vals))
+                if len(x_vals) < 2 or 4 in (row, col):
+                    self.assertTrue(np.isnan(coefficients[row, col]))
+                    continue
+                (expected_r, expected_p) = scipy.stats.pearsonr(x_vals, y_vals)
+                self.assertAlmostEqual(coefficients[row, col], expected_r)
+                self.assertAlmostEqual(p_values[row, col], expected_p)
+
+    def test_spearman_correlations(self):
+        """Test Spearman coefficients of the chosen pairs, with ties"""
+        pairs = np.triu(np.ones((12, 12), dtype=bool), 1)
+        (coefficients, p_values) = spearman_correlations(
+            self.values, self.target_masks, pairs, chunk_size=5)
+        for row in range(len(self.values)):
+            for col in range(len(self.values)):
+                (x_vals, y_vals) = self.__pair__(row, col)
+                if (not pairs[row, col] or len(x_vals) < 2
+                        or 4 in (row, col)):
+                    self.assertTrue(np.isnan(coefficients[row, col]))
+                    continue
+                (expected_r, expected_p) = scipy.stats.spearmanr(
+                    x_vals, y_vals)
+                self.assertAlmostEqual(coefficients[row, col], expected_r)
+                self.assertAlmostEqual(p_values[row, col], expected_p)
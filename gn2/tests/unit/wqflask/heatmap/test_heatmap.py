@@ -0,0 +1,183 @@
+"""Tests for wqflask/heatmap/heatmap.py"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gn2.wqflask import app
+from gn2.jobs.tools import ToolError
+from gn2.wqflask.heatmap.heatmap import Heatmap, scan_trait
+
+
+class AttributeSetter:
+    def __init__(self, obj):
+        for key, value in obj.items():
+            setattr(self, key, value)
+
+
+def make_trait(name, samples, values):
+    return AttributeSetter({
+        "name": name,
+        "export_informative": lambda: (samples, values, [None] * len(values),
+                                       [None] * len(values))})
+
+
+class TestHeatmap(unittest.TestCase):
+    """Tests for the QTL scans of the heatmap"""
+
+    def setUp(self):
+        self.dataset = AttributeSetter({
+            "name": "BXDPublish",
+            "group": AttributeSetter({
+                "name": "BXD", "genofile": None,
+                "samplelist": ["BXD1", "BXD2", "BXD5"]})})
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.flat_files",
+                return_value="/genotype_files")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.file_stamp")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.mapping_cache")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.parse_reaper_output")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.run_tool")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.gen_pheno_txt_file")
+    def test_scan_trait(self, mock_pheno, mock_run, mock_parse, mock_cache,
+                        mock_file_stamp, _flat_files):
+        """Test that a trait is scanned on its group's samples only, unless
+        the scan is cached"""
+        markers = [{"name": "rs1", "lrs_value": 3.0, "additive": 0.5}]
+        mock_cache.fetch_mapping_results.return_value = None
+        mock_parse.return_value = markers
+        mock_file_stamp.return_value = {"mtime_ns": 1, "size": 10}
+        mock_run.return_value = 0
+        trait = make_trait("10001", ["BXD1", "BXD3", "BXD5"], [1.5, 2.0, 3.5])
+
+        self.assertEqual(
+            scan_trait(trait, self.dataset, "BXD", {"BXD1", "BXD2", "BXD5"}),
+            markers)
+        (samples, values, trait_filename) = mock_pheno.call_args[0]
+        self.assertEqual((samples, values), (["BXD1", "BXD5"], [1.5, 3.5]))
+        self.assertTrue(trait_filename.startswith("10001_BXDPublish_pheno_"))
+        self.assertIn("-n 1000", mock_run.call_args[0][1])
+        mock_file_stamp.assert_called_once_with("/genotype_files/BXD.geno")
+        self.assertEqual(
+            mock_cache.mapping_cache_key.call_args[0][0]["genofile_stamp"],
+            {"mtime_ns": 1, "size": 10})
+        mock_cache.cache_mapping_results.assert_called_once_with(
+            mock_cache.mapping_cache_key.return_value, markers, {})
+
+        mock_run.reset_mock()
+        mock_cache.fetch_mapping_results.return_value = (markers, {})
+        self.assertEqual(
+            scan_trait(trait, self.dataset, "BXD", {"BXD1", "BXD2", "BXD5"}),
+            markers)
+        mock_run.assert_not_called()
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.flat_files",
+                return_value="/genotype_files")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.file_stamp")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.mapping_cache")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.parse_reaper_output")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.run_tool")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.gen_pheno_txt_file")
+    def test_scans_have_their_own_files(self, mock_pheno, mock_run, _parse,
+                                        mock_cache, _file_stamp, _flat_files):
+        """Test that scans of the same trait write different phenotype
+        files, as they may run at the same time"""
+        mock_cache.fetch_mapping_results.return_value = None
+        mock_run.return_value = 0
+        trait = make_trait("10001", ["BXD1"], [1.5])
+        scan_trait(trait, self.dataset, "BXD", {"BXD1"})
+        scan_trait(trait, self.dataset, "BXD", {"BXD1"})
+        (first, second) = [call.args[2] for call in mock_pheno.call_args_list]
+        self.assertNotEqual(first, second)
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.flat_files",
+                return_value="/genotype_files")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.file_stamp")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.mapping_cache")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.parse_reaper_output")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.run_tool", return_value=1)
+    @mock.patch("gn2.wqflask.heatmap.heatmap.gen_pheno_txt_file")
+    def test_failed_scan(self, _pheno, _run, mock_parse, mock_cache,
+                         _file_stamp, _flat_files):
+        """Test that a failed qtlreaper run raises, and is neither parsed nor
+        cached"""
+        mock_cache.fetch_mapping_results.return_value = None
+        trait = make_trait("10001", ["BXD1"], [1.5])
+        with self.assertRaises(ToolError):
+            scan_trait(trait, self.dataset, "BXD", {"BXD1"})
+        mock_parse.assert_not_called()
+        mock_cache.cache_mapping_results.assert_not_called()
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.flat_files",
+                return_value="/genotype_files")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.file_stamp")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.mapping_cache")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.parse_reaper_output")
+    @mock.patch("gn2.wqflask.heatmap.heatmap.run_tool")
+    def test_scan_files_are_removed(self, mock_run, mock_parse, mock_cache,
+                                    _file_stamp, _flat_files):
+        """Test that the phenotype and qtlreaper output files are removed once
+        the scan is parsed, or has failed"""
+        def reaper(_tool, command):
+            with open(command.split(" -o ")[-1], "w") as output_file:
+                output_file.write("ID\tLocus\n")
+            return returncodes.pop(0)
+
+        returncodes = [0, 1]
+        mock_run.side_effect = reaper
+        mock_cache.fetch_mapping_results.return_value = None
+        mock_parse.return_value = []
+        trait = make_trait("10001", ["BXD1"], [1.5])
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             mock.patch("gn2.wqflask.heatmap.heatmap.TEMPDIR", tmpdir), \
+             mock.patch("gn2.wqflask.heatmap.heatmap.webqtlConfig"
+                        ".GENERATED_IMAGE_DIR", f"{tmpdir}/"):
+            os.makedirs(f"{tmpdir}/gn2")
+            scan_trait(trait, self.dataset, "BXD", {"BXD1"})
+            mock_parse.assert_called_once()
+            with self.assertRaises(ToolError):
+                scan_trait(trait, self.dataset, "BXD", {"BXD1"})
+            self.assertEqual(os.listdir(f"{tmpdir}/gn2"), [])
+            self.assertEqual(os.listdir(tmpdir), ["gn2"])
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.get_setting_int", return_value=2)
+    @mock.patch("gn2.wqflask.heatmap.heatmap.scan_trait")
+    def test_gen_reaper_results(self, mock_scan, _max_jobs):
+        """Test that the scans are signed by the additive effect and kept in
+        the order of the traits"""
+        scans = {
+            "T1": [{"lrs_value": 3.0, "additive": 0.5},
+                   {"lrs_value": 1.0, "additive": -0.2}],
+            "T2": [{"lrs_value": 2.0, "additive": -1.0},
+                   {"lrs_value": 4.0, "additive": 1.0}],
+            "T3": [{"lrs_value": 0.5, "additive": 0.0},
+                   {"lrs_value": 6.0, "additive": 2.0}]}
+        mock_scan.side_effect = lambda trait, *_args: scans[trait.name]
+        heatmap = Heatmap.__new__(Heatmap)
+        heatmap.dataset = self.dataset
+        heatmap.trait_list = [(make_trait(name, [], []), self.dataset)
+                              for name in scans]
+        progress = mock.Mock()
+
+        heatmap.gen_reaper_results(progress)
+
+        self.assertEqual(heatmap.trait_results, {
+            "T1": [-3.0, 1.0], "T2": [2.0, -4.0], "T3": [0.5, -6.0]})
+        self.assertEqual(list(heatmap.trait_results), ["T1", "T2", "T3"])
+        progress.assert_has_calls(
+            [mock.call(1, 3), mock.call(2, 3), mock.call(3, 3)])
+
+    @mock.patch("gn2.wqflask.heatmap.heatmap.get_setting_int", return_value=0)
+    @mock.patch("gn2.wqflask.heatmap.heatmap.scan_trait")
+    def test_gen_reaper_results_without_jobs(self, mock_scan, _max_jobs):
+        """Test that the scans still run with no traits or no REAPER_MAX_JOBS"""
+        heatmap = Heatmap.__new__(Heatmap)
+        heatmap.dataset = self.dataset
+        heatmap.trait_list = []
+        heatmap.gen_reaper_results()
+        self.assertEqual(heatmap.trait_results, {})
+
+        heatmap.trait_list = [(make_trait("T1", [], []), self.dataset)]
+        mock_scan.return_value = [{"lrs_value": 3.0, "additive": 0.5}]
+        heatmap.gen_reaper_results()
+        self.assertEqual(heatmap.trait_results, {"T1": [-3.0]})
@@ -1,12 +1,21 @@
 # test for wqflask/marker_regression/gemma_mapping.py
 import os
+import json
+import tempfile
 import unittest
 import random
 from unittest import mock
+from gn2.base.trait_sample_data import TraitSampleData
+from gn2.base.webqtlCaseData import webqtlCaseData
 from gn2.wqflask.marker_regression.gemma_mapping import run_gemma
 from gn2.wqflask.marker_regression.gemma_mapping import gen_pheno_txt_file
 from gn2.wqflask.marker_regression.gemma_mapping import gen_covariates_file
 from gn2.wqflask.marker_regression.gemma_mapping import parse_loco_output
+from gn2.wqflask.marker_regression.gemma_mapping import cached_gemma_output
+from gn2.wqflask.marker_regression.gemma_mapping import evict_gemma_cache
+from gn2.wqflask.marker_regression.gemma_mapping import kinship_cache_key
+from gn2.wqflask.marker_regression.gemma_mapping import run_gemma_command
+from gn2.jobs.tools import ToolError
 
 
 class AttributeSetter:
@@ -38,6 +47,7 @@ class TestGemmaMapping(unittest.TestCase):
         expected_results = ([], "file1")
         self.assertEqual(expected_results, result)
 
+    @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.run_tool")
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.webqtlConfig.GENERATED_IMAGE_DIR", "/home/user/img")
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.GEMMAOPTS", "-debug")
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.GEMMA_WRAPPER_COMMAND", "ghc")
@@ -49,12 +59,12 @@ class TestGemmaMapping(unittest.TestCase):
     @mock.patch("gn2.wqflask.marker_regression.run_mapping.random.choice")
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.os")
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.gen_pheno_txt_file")
-    def test_run_gemma_firstrun_set_true(self, mock_gen_pheno_txt, mock_os, mock_choice, mock_gen_covar, mock_flat_files, mock_parse_loco):
+    def test_run_gemma_firstrun_set_true(self, mock_gen_pheno_txt, mock_os, mock_choice, mock_gen_covar, mock_flat_files, mock_parse_loco, mock_run_tool):
         """add tests for run_gemma where first run is set to true"""
         this_chromosomes = {}
         for i in range(1, 5):
             this_chromosomes[f'CH{i}'] = (AttributeSetter({"name": f"CH{i}"}))
-        chromosomes = AttributeSetter({"chromosomes": lambda cursor: this_chromosomes})
+        chromosomes = AttributeSetter({"chromosomes": lambda cursor=None: this_chromosomes})
 
         dataset_group = MockGroup(
             {"name": "GP1", "genofile": "file_geno"})
@@ -69,14 +79,20 @@ class TestGemmaMapping(unittest.TestCase):
         mock_flat_files.return_value = os.path.join(
             os.path.dirname(__file__), "genotype/bimbam")
         mock_parse_loco.return_value = []
+        mock_run_tool.return_value = 0
         results = run_gemma(this_trait=trait, this_dataset=dataset, samples=[
         ], vals=[], covariates="", use_loco=True)
         mock_gen_pheno_txt.assert_called_once()
+        self.assertEqual(
+            [tool for ((tool, _command), _kwargs) in mock_run_tool.call_args_list],
+            ["gemma", "gemma"])
+        gwa_output_filename = results[1]
+        self.assertTrue(gwa_output_filename.startswith("GP1_GWA_"))
         mock_parse_loco.assert_called_once_with(
-            dataset, "GP1_GWA_RRRRRR", True)
+            dataset, gwa_output_filename, True)
         mock_os.path.isfile.assert_called_once_with(
             ('/home/user/imgfile_output.assoc.txt'))
-        self.assertEqual(results, ([], "GP1_GWA_RRRRRR"))
+        self.assertEqual(results[0], [])
 
     @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.TEMPDIR", "/home/user/data")
     def test_gen_pheno_txt_file(self):
@@ -109,7 +125,8 @@ class TestGemmaMapping(unittest.TestCase):
             create_dataset_side_effect.append(
                 AttributeSetter({"name": f'name_{i}'}))
             create_trait_side_effect.append(
-                AttributeSetter({"data": [f'data_{i}']}))
+                AttributeSetter({"data": TraitSampleData(
+                    [webqtlCaseData(f'data_{i}', float(i))])}))
 
         create_dataset.side_effect = create_trait_side_effect
         create_trait.side_effect = create_trait_side_effect
@@ -186,3 +203,60 @@ X\tM5\t12\tQ\tE\tMMB\tR\t21.1\tW\t0.65\t0.6"""
             results = parse_loco_output(
                 this_dataset={}, gwa_output_filename=".xw/")
             self.assertEqual(results, [])
+
+    def test_kinship_cache_key(self):
+        """test that kinship matrices are shared by traits missing the same
+        samples"""
+        key = kinship_cache_key("BXD_geno.txt", ["1.2", "x", "3.1"], True, "1,2")
+        self.assertEqual(
+            key, kinship_cache_key("BXD_geno.txt", ["0.5", "x", "2"], True, "1,2"))
+        self.assertNotEqual(
+            key, kinship_cache_key("BXD_geno.txt", ["0.5", "1", "2"], True, "1,2"))
+        self.assertNotEqual(
+            key, kinship_cache_key("BXD_geno.txt", ["1.2", "x", "3.1"], False, "1,2"))
+
+    def test_gemma_output_cache(self):
+        """test that complete outputs are reused and evicted oldest first"""
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch(
+                "gn2.wqflask.marker_regression.gemma_mapping.TEMPDIR", tmpdir):
+            os.makedirs(f"{tmpdir}/gn2")
+            for (idx, name) in enumerate(("BXD_GWA_old", "BXD_GWA_new")):
+                assoc_filepath = f"{tmpdir}/{name}.assoc.txt"
+                with open(assoc_filepath, "w") as assoc_file:
+                    assoc_file.write("chr\trs\n" * 100)
+                with open(f"{tmpdir}/gn2/{name}.json", "w") as output_file:
+                    json.dump({"files": [["1", "log", assoc_filepath]]},
+                              output_file)
+                os.utime(f"{tmpdir}/gn2/{name}.json", (idx, idx))
+            self.assertFalse(cached_gemma_output("BXD_GWA_missing"))
+            self.assertTrue(cached_gemma_output("BXD_GWA_old"))
+
+            self.assertEqual(evict_gemma_cache(1000), 1)
+            self.assertTrue(cached_gemma_output("BXD_GWA_old"))
+            self.assertFalse(cached_gemma_output("BXD_GWA_new"))
+            self.assertFalse(os.path.exists(f"{tmpdir}/BXD_GWA_new.assoc.txt"))
+
+    @mock.patch("gn2.wqflask.marker_regression.gemma_mapping.run_tool")
+    def test_run_gemma_command_failure(self, mock_run_tool):
+        """test that a failed gemma run raises, leaving no output behind"""
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch(
+                "gn2.wqflask.marker_regression.gemma_mapping.TEMPDIR", tmpdir):
+            os.makedirs(f"{tmpdir}/gn2")
+
+            def fail(_tool, command):
+                with open(command.split(" > ")[-1], "w") as output_file:
+                    output_file.write('{"files": [')
+                return 1
+
+            mock_run_tool.side_effect = fail
+            with self.assertRaises(ToolError):
+                run_gemma_command("gemma-wrapper", "BXD_GWA_failed")
+            self.assertEqual(os.listdir(f"{tmpdir}/gn2"), [])
+
+            mock_run_tool.side_effect = None
+            mock_run_tool.return_value = 0
+            with open(f"{tmpdir}/gn2/BXD_GWA_ok.json.{os.getpid()}.tmp",
+                      "w") as output_file:
+                output_file.write("{}")
+            run_gemma_command("gemma-wrapper", "BXD_GWA_ok")
+            self.assertEqual(os.listdir(f"{tmpdir}/gn2"), ["BXD_GWA_ok.json"])
@@ -0,0 +1,62 @@
+"""Tests for wqflask/marker_regression/mapping_cache.py"""
+import tempfile
+import unittest
+from unittest import mock
+
+from gn2.wqflask.marker_regression import mapping_cache
+from gn2.wqflask.marker_regression.mapping_cache import mapping_cache_key
+from gn2.wqflask.marker_regression.mapping_cache import pack_markers
+from gn2.wqflask.marker_regression.mapping_cache import unpack_markers
+
+
+class TestMappingCache(unittest.TestCase):
+    """Tests for caching mapping results"""
+
+    def setUp(self):
+        self.markers = [
+            {"name": "rs1", "chr": 1, "Mb": 3.5, "lod_score": 1.25,
+             "additive": -0.5},
+            {"name": "rs2", "chr": "X", "Mb": 4.0, "lod_score": 0.5},
+            {"name": "rs3", "chr": 2, "Mb": 1.0, "lod_score": 2.0,
+             "additive": 0.25}]
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = mock.patch.object(
+            mapping_cache, "MAPPING_CACHE_DIR", cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pack_markers(self):
+        """Test that markers are packed into columns and back"""
+        packed = pack_markers(self.markers)
+        self.assertEqual(packed["columns"]["lod_score"].dtype.kind, "f")
+        self.assertEqual(packed["columns"]["name"].dtype.kind, "U")
+        self.assertEqual(packed["columns"]["chr"], [1, "X", 2])
+        self.assertEqual(list(packed["present"]), ["additive"])
+        self.assertEqual(unpack_markers(packed), self.markers)
+
+    def test_key_is_canonical(self):
+        """Test that the key does not depend on the order of the inputs"""
+        self.assertEqual(
+            mapping_cache_key({"method": "gemma", "maf": "0.05"}),
+            mapping_cache_key({"maf": "0.05", "method": "gemma"}))
+        self.assertNotEqual(
+            mapping_cache_key({"method": "gemma", "maf": "0.05"}),
+            mapping_cache_key({"method": "gemma", "maf": "0.01"}))
+
+    def test_fetch_cached_results(self):
+        """Test that cached results are fetched, and missing ones are not"""
+        self.assertIsNone(mapping_cache.fetch_mapping_results("key"))
+        with mock.patch.object(mapping_cache, "get_setting_int",
+                               return_value=1024**2):
+            mapping_cache.cache_mapping_results(
+                "key", self.markers, {"output_files": ["f1", "f2"]})
+        self.assertEqual(mapping_cache.fetch_mapping_results("key"),
+                         (self.markers, {"output_files": ["f1", "f2"]}))
+
+    def test_cache_is_bounded(self):
+        """Test that older results are evicted to keep the cache in size"""
+        with mock.patch.object(mapping_cache, "get_setting_int",
+                               return_value=0):
+            mapping_cache.cache_mapping_results("key", self.markers, {})
+        self.assertIsNone(mapping_cache.fetch_mapping_results("key"))
@@ -7,8 +7,13 @@ from gn2.wqflask.marker_regression.run_mapping import geno_db_exists
 from gn2.wqflask.marker_regression.run_mapping import write_input_for_browser
 from gn2.wqflask.marker_regression.run_mapping import export_mapping_results
 from gn2.wqflask.marker_regression.run_mapping import trim_markers_for_figure
+from gn2.wqflask.marker_regression.run_mapping import trim_markers_for_table
+from gn2.wqflask.marker_regression.run_mapping import figure_mask
+from gn2.wqflask.marker_regression.run_mapping import p_wald_column
 from gn2.wqflask.marker_regression.run_mapping import get_perm_strata
 from gn2.wqflask.marker_regression.run_mapping import get_chr_lengths
+from gn2.wqflask.marker_regression.run_mapping import RunMapping
+from gn2.wqflask.marker_regression.exceptions import MappingNotCachedError
 
 
 class AttributeSetter:
@@ -45,7 +50,7 @@ class TestRunMapping(unittest.TestCase):
         self.dataset = AttributeSetter(
             {"fullname": "dataset_1", "group": self.group, "type": "ProbeSet"})
 
-        self.chromosomes = AttributeSetter({"chromosomes": lambda cur: chromosomes})
+        self.chromosomes = AttributeSetter({"chromosomes": lambda cur=None: chromosomes})
         self.trait = AttributeSetter(
             {"symbol": "IGFI", "chr": "X1", "mb": 123313, "display_name": "Test Name"})
 
@@ -141,6 +146,29 @@ class TestRunMapping(unittest.TestCase):
         self.assertEqual(results, expected)
         self.assertEqual(result_2, marker_2)
 
+    def test_figure_mask(self):
+        """test that low scores are thinned more than high ones"""
+        scores = [0.5] * 40 + [1.5] * 20 + [2.5] * 4 + [3.5] * 3
+        mask = figure_mask(scores, "lod_score")
+        self.assertEqual(mask.nonzero()[0].tolist(),
+                         [0, 20, 40, 50, 60, 62, 64, 65, 66])
+        self.assertEqual(figure_mask([0.5, 0.05, 0.0001], "p_wald").tolist(),
+                         [True, True, True])
+
+    def test_p_wald_column(self):
+        """test that p-values are derived from the LRS, then the LOD score"""
+        markers = [{"lrs_value": 4.61}, {"lrs_value": 0, "lod_score": 2},
+                   {"lod_score": 0}, {}]
+        self.assertEqual([round(p_wald, 6) for p_wald in p_wald_column(markers)],
+                         [0.1, 0.01, 0.0, 0.0])
+
+    def test_trim_markers_for_table(self):
+        """test that the table lists markers by score, highest first"""
+        markers = [{"name": "M1", "lrs_value": 1.0}, {"name": "M2", "lrs_value": 9.0},
+                   {"name": "M3", "lrs_value": 1.0}]
+        self.assertEqual([marker["name"] for marker in trim_markers_for_table(markers)],
+                         ["M2", "M1", "M3"])
+
     def test_export_mapping_results(self):
         """test for exporting mapping results"""
         datetime_mock = mock.Mock(wraps=datetime.datetime)
@@ -286,3 +314,74 @@ class TestRunMapping(unittest.TestCase):
             'chr': '16', 'size': '500000.0'}, {'chr': '18', 'size': '400000.0'}]
 
         self.assertEqual(result_with_other_mapping_scale, expected_value)
+
+
+class TestCachedMapping(unittest.TestCase):
+    """Tests for the caching of the mappings of `RunMapping`"""
+
+    def setUp(self):
+        self.mapping = RunMapping.__new__(RunMapping)
+        self.mapping.cached_only = False
+        self.mapping.mapping_method = "gemma"
+        self.mapping.dataset = AttributeSetter({
+            "name": "dataset_1",
+            "group": AttributeSetter({"name": "G1", "genofile": "g1_file.geno"})})
+        self.mapping.this_trait = AttributeSetter({"name": "1417483_at"})
+        self.mapping.samples = ["S1", "S2"]
+        self.mapping.vals = ["1.2", "3.4"]
+        flat_files = mock.patch(
+            "gn2.wqflask.marker_regression.run_mapping.flat_files",
+            return_value="/genotype_files")
+        flat_files.start()
+        self.addCleanup(flat_files.stop)
+
+    @mock.patch("gn2.wqflask.marker_regression.run_mapping.mapping_cache")
+    def test_cache_hit(self, mock_cache):
+        """Test that a cached mapping is not run, even with `cached_only`"""
+        self.mapping.cached_only = True
+        mock_cache.fetch_mapping_results.return_value = (
+            [{"name": "M1"}], {"output_files": "out"})
+        compute = mock.Mock()
+        self.assertEqual(self.mapping.cached_mapping(compute, maf=0.01),
+                         [{"name": "M1"}])
+        self.assertEqual(self.mapping.output_files, "out")
+        compute.assert_not_called()
+
+    @mock.patch("gn2.wqflask.marker_regression.run_mapping.mapping_cache")
+    def test_cache_miss(self, mock_cache):
+        """Test that a mapping that is not cached is run and cached"""
+        mock_cache.fetch_mapping_results.return_value = None
+        compute = mock.Mock(return_value=([{"name": "M1"}], {}))
+        self.assertEqual(self.mapping.cached_mapping(compute, maf=0.01),
+                         [{"name": "M1"}])
+        mock_cache.cache_mapping_results.assert_called_once_with(
+            mock_cache.mapping_cache_key.return_value, [{"name": "M1"}], {})
+
+    @mock.patch("gn2.wqflask.marker_regression.run_mapping.file_stamp")
+    @mock.patch("gn2.wqflask.marker_regression.run_mapping.mapping_cache")
+    def test_genotype_file_changes(self, mock_cache, mock_file_stamp):
+        """Test that mappings are not reused once the genotype file the
+        mapping method reads has changed"""
+        mock_cache.fetch_mapping_results.return_value = None
+        compute = mock.Mock(return_value=([], {}))
+        mock_file_stamp.return_value = {"mtime_ns": 1, "size": 10}
+        self.mapping.cached_mapping(compute, maf=0.01)
+        mock_file_stamp.return_value = {"mtime_ns": 2, "size": 10}
+        self.mapping.cached_mapping(compute, maf=0.01)
+
+        mock_file_stamp.assert_called_with("/genotype_files/g1_file_geno.txt")
+        (first, second) = [call.args[0] for call in
+                           mock_cache.mapping_cache_key.call_args_list]
+        self.assertEqual(first["genofile_stamp"], {"mtime_ns": 1, "size": 10})
+        self.assertEqual(second["genofile_stamp"], {"mtime_ns": 2, "size": 10})
+
+    @mock.patch("gn2.wqflask.marker_regression.run_mapping.mapping_cache")
+    def test_cached_only_miss(self, mock_cache):
+        """Test that with `cached_only` a mapping that is not cached is not
+        run"""
+        self.mapping.cached_only = True
+        mock_cache.fetch_mapping_results.return_value = None
+        compute = mock.Mock()
+        with self.assertRaises(MappingNotCachedError):
+            self.mapping.cached_mapping(compute, maf=0.01)
+        compute.assert_not_called()
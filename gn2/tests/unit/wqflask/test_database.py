@@ -0,0 +1,125 @@
+"""Tests for the pooled database connections in wqflask/database.py"""
+import unittest
+from unittest import mock
+
+import MySQLdb
+
+from gn2.wqflask import database
+from gn2.wqflask.database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """A connection that records what was done with it"""
+
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def ping(self):
+        if not self.alive:
+            raise MySQLdb.Error("gone away")
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(max_size=2, **kwargs):
+    """A pool of FakeConnections"""
+    return ConnectionPool(
+        FakeConnection, max_size, **{
+            "timeout": 0.05, "max_lifetime": 3600, "ping_after": 30,
+            **kwargs})
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Tests for the ConnectionPool class"""
+
+    def test_reuses_returned_connections(self):
+        """Test that a returned connection is handed out again"""
+        pool = make_pool()
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(pool.stats()["connections_created"], 1)
+        self.assertEqual(pool.stats()["checkouts"], 2)
+
+    def test_pool_is_bounded(self):
+        """Test that checkouts time out once every connection is in use"""
+        pool = make_pool(max_size=2)
+        pool.checkout()
+        pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        self.assertEqual(pool.stats()["in_use"], 2)
+
+    def test_discarded_connections_are_closed(self):
+        """Test that discarding a connection frees its place in the pool"""
+        pool = make_pool(max_size=1)
+        conn = pool.checkout()
+        pool.checkin(conn, discard=True)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.checkout(), conn)
+
+    def test_dead_connections_are_replaced(self):
+        """Test that idle connections failing a ping are not reused"""
+        pool = make_pool(ping_after=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.alive = False
+        self.assertIsNot(pool.checkout(), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_old_connections_are_recycled(self):
+        """Test that connections past their lifetime are closed"""
+        pool = make_pool(max_lifetime=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_forked_pool_starts_empty(self):
+        """Test that a forked process does not reuse (or close) the parent's
+        connections"""
+        pool = make_pool()
+        conn = pool.checkout()
+        pool.checkin(conn)
+        with mock.patch("gn2.wqflask.database.os.getpid",
+                        return_value=pool.pid + 1):
+            self.assertIsNot(pool.checkout(), conn)
+        self.assertFalse(conn.closed)
+
+
+class TestDatabaseConnection(unittest.TestCase):
+    """Tests for the database_connection context manager"""
+
+    def setUp(self):
+        self.pool = make_pool()
+        patcher = mock.patch(
+            "gn2.wqflask.database.connection_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_commits_and_returns_connection(self):
+        """Test that the connection is committed and returned to the pool"""
+        with database.database_connection("mysql://u@h/db") as conn:
+            pass
+        self.assertEqual(conn.commits, 1)
+        self.assertEqual(self.pool.stats()["idle"], 1)
+
+    def test_rolls_back_on_error(self):
+        """Test that errors roll back the transaction and are re-raised"""
+        with self.assertRaises(ValueError):
+            with database.database_connection("mysql://u@h/db") as conn:
+                raise ValueError("bad query")
+        self.assertEqual((conn.commits, conn.rollbacks), (0, 1))
+        self.assertFalse(conn.closed)
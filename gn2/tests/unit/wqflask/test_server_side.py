@@ -1,6 +1,6 @@
 import unittest
 
-from gn2.wqflask.server_side import ServerSideTable
+from gn2.wqflask.server_side import ServerSideTable, TableRows
 
 
 class TestServerSideTableTests(unittest.TestCase):
@@ -32,3 +32,59 @@ class TestServerSideTableTests(unittest.TestCase):
         self.assertEqual(test_page['iTotalDisplayRecords'], '3')
         self.assertEqual(test_page['data'], [{'first': 'b', 'second': 2, 'third': 'aa'}, {
                          'first': 'c', 'second': 1, 'third': 'ss'}, {'first': 'd', 'second': 4, 'third': 'zz'}])
+
+
+class TestTableRows(unittest.TestCase):
+    """Test that TableRows pages like a list of dicts"""
+
+    def setUp(self):
+        self.table_rows = [
+            {'first': 'd', 'second': 4, 'third': 'zz'},
+            {'first': 'b', 'second': 2, 'third': 'aa'},
+            {'first': 'c', 'second': 2},
+            {'first': 'a', 'second': 4, 'third': 'aa'},
+            {'first': 'e', 'second': 1, 'third': 'ss'},
+        ]
+        self.headers = ['first', 'second', 'third']
+
+    def get_page(self, table_rows, **request_args):
+        request_args = {'sEcho': '1', 'iSortCol_0': '', 'iSortingCols': '0',
+                        'iDisplayStart': '0', 'iDisplayLength': '-1',
+                        **request_args}
+        return ServerSideTable(
+            len(table_rows), table_rows, self.headers, request_args).get_page()
+
+    def test_rows_round_trip(self):
+        """Test that the rows read back as the dicts they were built from"""
+        rows = TableRows.from_dicts(self.table_rows, self.headers)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(list(rows), self.table_rows)
+        self.assertEqual(rows[2], {'first': 'c', 'second': 2})
+        self.assertEqual(rows.column('third'), ['zz', 'aa', None, 'aa', 'ss'])
+
+    def test_sorted_like_list(self):
+        """Test that sorting on several columns matches successive sorts"""
+        rows = TableRows.from_dicts(self.table_rows[:2] + self.table_rows[3:])
+        table_rows = self.table_rows[:2] + self.table_rows[3:]
+        sort_args = {'iSortCol_0': '3', 'sSortDir_0': 'asc',
+                     'iSortCol_1': '2', 'sSortDir_1': 'desc',
+                     'iSortingCols': '2'}
+        self.assertEqual(self.get_page(rows, **sort_args)['data'],
+                         self.get_page(table_rows, **sort_args)['data'])
+
+    def test_missing_values_sort(self):
+        """Test that a column missing from some rows can still be sorted on"""
+        rows = TableRows.from_dicts(self.table_rows)
+        page = self.get_page(rows, iSortCol_0='3', sSortDir_0='desc',
+                             iSortingCols='1')
+        self.assertEqual([row['first'] for row in page['data']],
+                         ['d', 'e', 'b', 'a', 'c'])
+
+    def test_paginates_sorted_rows(self):
+        """Test that a page is sliced out of the sorted rows"""
+        rows = TableRows.from_dicts(self.table_rows, self.headers)
+        page = self.get_page(rows, iSortCol_0='1', sSortDir_0='asc',
+                             iSortingCols='1', iDisplayStart='2',
+                             iDisplayLength='2')
+        self.assertEqual(page['iTotalDisplayRecords'], '5')
+        self.assertEqual([row['first'] for row in page['data']], ['c', 'd'])
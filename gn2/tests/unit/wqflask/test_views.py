@@ -0,0 +1,129 @@
+"""Tests for wqflask/views.py"""
+import os
+import json
+import uuid
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import g
+
+from gn2.wqflask import app
+from gn2.wqflask.views import (
+    json_default_handler, mapping_job_page, mapping_job_retry,
+    corr_compute_page)
+from gn2.wqflask.marker_regression.exceptions import NoMappingResultsError
+from gn2.base.webqtlCaseData import webqtlCaseData
+
+
+class TestJsonDefaultHandler(unittest.TestCase):
+    """Tests for the JSON serialization of the page data"""
+
+    def test_case_data(self):
+        """Test that the (slotted) sample cases of a trait serialize"""
+        case = webqtlCaseData("BXD1", 9.5, None, 3, "B1")
+        case.extra_info = "Sex: M"
+        self.assertEqual(
+            json.loads(json.dumps({"samples": [case]},
+                                  default=json_default_handler)),
+            {"samples": [{"name": "BXD1", "name2": "B1", "value": 9.5,
+                          "variance": None, "num_cases": 3,
+                          "extra_attributes": None, "this_id": None,
+                          "outlier": None, "extra_info": "Sex: M"}]})
+
+
+class TestMappingJobPage(unittest.TestCase):
+    """Tests for the pages of the background mapping jobs"""
+
+    def setUp(self):
+        self.job_id = uuid.uuid4()
+        self.failed_job = {"status": "completed",
+                           "completion-status": "error",
+                           "stderr": "Traceback\nValueError",
+                           "inputs-file": "/tmp/mapping_inputs"}
+
+    @mock.patch("gn2.wqflask.views.__run_mapping__")
+    @mock.patch("gn2.wqflask.views.render_template")
+    @mock.patch("gn2.wqflask.views.__mapping_job__")
+    def test_failed_job_is_not_rerun(self, mock_job, mock_render,
+                                     mock_run_mapping):
+        """Test that a failed job's page logs its errors, without mapping"""
+        mock_job.return_value = self.failed_job
+        mock_render.return_value = "error page"
+        with app.test_request_context(f"/mapping_job/{self.job_id}"), \
+             mock.patch.object(app.logger, "error") as mock_log:
+            self.assertEqual(mapping_job_page(self.job_id), "error page")
+        mock_render.assert_called_once_with(
+            "jobs/mapping-error.html", job_id=self.job_id)
+        self.assertIn("Traceback\nValueError", mock_log.call_args[0])
+        mock_run_mapping.assert_not_called()
+
+    @mock.patch("gn2.wqflask.views.__mapping_job__")
+    def test_job_without_results(self, mock_job):
+        """Test that a mapping without results raises the no-results error"""
+        mock_job.return_value = {**self.failed_job, "return-code": "3"}
+        with mock.patch("builtins.open", mock.mock_open(
+                read_data=pickle.dumps(({"trait_id": "1427571_at",
+                                         "dataset": "HC_M2_0606_P",
+                                         "method": "gemma"}, "a-uuid")))), \
+             app.test_request_context(f"/mapping_job/{self.job_id}"), \
+             self.assertRaises(NoMappingResultsError) as no_results:
+            mapping_job_page(self.job_id)
+        self.assertEqual(no_results.exception.trait, "1427571_at")
+
+    @mock.patch("gn2.wqflask.views.__queue_mapping__")
+    @mock.patch("gn2.wqflask.views.__mapping_job__")
+    def test_retry_queues_a_new_job(self, mock_job, mock_queue):
+        """Test that retrying a failed job queues its inputs again"""
+        new_job_id = uuid.uuid4()
+        mock_job.return_value = self.failed_job
+        mock_queue.return_value = new_job_id
+        with mock.patch("builtins.open", mock.mock_open(
+                read_data=pickle.dumps(({"method": "gemma"}, "a-uuid")))), \
+             app.test_request_context(
+                 f"/mapping_job/{self.job_id}/retry", method="POST"):
+            response = mapping_job_retry(self.job_id)
+        mock_queue.assert_called_once_with({"method": "gemma"}, "a-uuid")
+        self.assertTrue(
+            response.location.endswith(f"/mapping_job/{new_job_id}"))
+
+    @mock.patch("gn2.wqflask.views.__queue_mapping__")
+    @mock.patch("gn2.wqflask.views.__mapping_job__")
+    def test_retry_only_failed_jobs(self, mock_job, mock_queue):
+        """Test that jobs that did not fail are not queued again"""
+        mock_job.return_value = {"status": "running"}
+        with app.test_request_context(
+                f"/mapping_job/{self.job_id}/retry", method="POST"):
+            response = mapping_job_retry(self.job_id)
+        mock_queue.assert_not_called()
+        self.assertTrue(
+            response.location.endswith(f"/mapping_job/{self.job_id}"))
+
+
+class TestCorrComputePage(unittest.TestCase):
+    """Tests for queueing the correlation jobs"""
+
+    @mock.patch("gn2.wqflask.views.jobs")
+    @mock.patch("gn2.wqflask.views.Redis")
+    def test_inputs_are_written_before_queueing(self, _redis, mock_jobs):
+        """Test that the inputs file is complete once the job is queued"""
+        queued_inputs = []
+
+        def queue(_rconn, job):
+            with open(job["inputs-file"], "rb") as inputs_file:
+                queued_inputs.append(pickle.load(inputs_file))
+            return uuid.uuid4()
+
+        mock_jobs.queue.side_effect = queue
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             mock.patch("gn2.wqflask.views.TMPDIR", f"{tmpdir}/"), \
+             app.test_request_context(
+                 "/corr_compute", method="POST",
+                 data={"corr_type": "sample", "trait_id": "1427571_at"}):
+            g.user_session = mock.Mock(user_id="a-user")
+            corr_compute_page()
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+        self.assertEqual(queued_inputs[0].to_dict(),
+                         {"corr_type": "sample", "trait_id": "1427571_at"})
+        mock_jobs.submit.assert_called_once()
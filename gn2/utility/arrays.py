@@ -0,0 +1,126 @@
+"""Helpers for moving data between NumPy arrays and the plain Python
+structures the rest of GN2 expects"""
+
+import os
+import json
+import struct
+
+import numpy as np
+
+
+def nan_to_none(values):
+    """Convert a 2-d float array to a list of lists, with `None` in place of
+    NaN.
+
+    >>> nan_to_none(np.array([[1.0, np.nan], [2.0, 3.0]]))
+    [[1.0, None], [2.0, 3.0]]
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    rows = values.tolist()
+    for idx in np.flatnonzero(missing.any(axis=1)):
+        rows[idx] = [None if is_missing else val
+                     for (val, is_missing) in zip(rows[idx], missing[idx])]
+    return rows
+
+
+def index_positions(index, keys):
+    """Return the positions of `keys` in the 1-d array `index`, which must
+    hold each key exactly once. Keys missing from `index` get -1.
+
+    >>> index_positions(np.array([30, 10, 20]), [10, 20, 40, 30]).tolist()
+    [1, 2, -1, 0]
+
+    """
+    index = np.asarray(index)
+    keys = np.asarray(keys)
+    if index.size == 0:
+        return np.full(keys.shape, -1, dtype=np.intp)
+    order = np.argsort(index, kind="stable")
+    sorted_index = index[order]
+    found = np.searchsorted(sorted_index, keys)
+    found[found == len(sorted_index)] = 0
+    return np.where(sorted_index[found] == keys, order[found], -1)
+
+
+_ALIGNMENT = 64
+
+
+def __aligned__(offset):
+    return offset + ((-offset) % _ALIGNMENT)
+
+
+def write_array_file(file_path, magic, header, arrays):
+    """Write a binary file holding a JSON `header` and the raw contents of
+    `arrays`, each starting on a 64 byte boundary, so they can be memory-mapped
+    back with `read_array_file`.
+
+    Layout: `magic` | header length (uint64, little-endian) | JSON header
+    | padding | arrays. The dtype, shape and offset of each array are recorded
+    in the header under "arrays".
+
+    The file is written to a temporary name and moved into place, so readers
+    never see a partially written file."""
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    specs, offset = [], 0
+    for array in arrays:
+        specs.append({"dtype": array.dtype.str, "shape": list(array.shape),
+                      "offset": offset})
+        offset = __aligned__(offset + array.nbytes)
+    header_bytes = json.dumps({**header, "arrays": specs}).encode("utf-8")
+    data_start = __aligned__(len(magic) + 8 + len(header_bytes))
+
+    tmp_path = os.path.join(
+        os.path.dirname(file_path),
+        f".{os.path.basename(file_path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as file_handler:
+        file_handler.write(magic)
+        file_handler.write(struct.pack("<Q", len(header_bytes)))
+        file_handler.write(header_bytes)
+        position = len(magic) + 8 + len(header_bytes)
+        for (array, spec) in zip(arrays, specs):
+            start = data_start + spec["offset"]
+            file_handler.write(b"\0" * (start - position))
+            file_handler.write(array.tobytes())
+            position = start + array.nbytes
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def read_array_file(file_path, magic):
+    """Read a file written by `write_array_file`. Returns the header and the
+    arrays, memory-mapped read-only. Raises ValueError if the file does not
+    start with `magic`."""
+    with open(file_path, "rb") as file_handler:
+        if file_handler.read(len(magic)) != magic:
+            raise ValueError(f"{file_path} is not a {magic!r} file")
+        (header_length,) = struct.unpack("<Q", file_handler.read(8))
+        header = json.loads(file_handler.read(header_length))
+
+    data_start = __aligned__(len(magic) + 8 + header_length)
+    arrays = []
+    for spec in header["arrays"]:
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            arrays.append(np.empty(shape, dtype=np.dtype(spec["dtype"])))
+        else:
+            arrays.append(np.memmap(
+                file_path, dtype=np.dtype(spec["dtype"]), mode="r",
+                offset=data_start + spec["offset"], shape=shape))
+    return (header, arrays)
+
+
+def file_stamp(file_path):
+    """The modification time and size of `file_path`, recorded in derived
+    files so they can be discarded once their source changes"""
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def sidecar_paths(file_path, ext, cache_dirs=()):
+    """Candidate locations for a file derived from `file_path`: next to it
+    first, then in each of `cache_dirs`"""
+    basename = os.path.basename(file_path) + ext
+    return [os.path.join(directory, basename) for directory in
+            (os.path.dirname(os.path.abspath(file_path)), *cache_dirs)]
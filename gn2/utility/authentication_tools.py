@@ -1,49 +1,161 @@
 import json
+import time
 import requests
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import g
-from gn2.wqflask.database import database_connection
+from gn2.base.reference_data import inbred_set
 from gn2.base import webqtlConfig
 
 from gn2.utility.redis_tools import (get_redis_conn,
                                  get_resource_info,
                                  get_resource_id,
-                                 add_resource)
-from gn2.utility.tools import get_setting, GN_PROXY_URL
+                                 add_resource,
+                                 PERMISSIONS_GENERATION)
+from gn2.utility.tools import get_setting_int, GN_PROXY_URL
 
 Redis = get_redis_conn()
 
-def check_resource_availability(dataset, user_id, trait_id=None):
-    # At least for now assume temporary entered traits are accessible
-    if type(dataset) == str or dataset.type == "Temp":
-        return webqtlConfig.DEFAULT_PRIVILEGES
+# (user id, resource id) -> (privileges, permissions generation, expiry time),
+# least recently used first
+PRIVILEGES_CACHE = collections.OrderedDict()
+PRIVILEGES_CACHE_LOCK = threading.Lock()
 
-    resource_id = get_resource_id(dataset, trait_id)
 
-    # ZS: This should never be false, but it's technically possible if
-    # a non-Temp dataset somehow had a type other than
-    # Publish/ProbeSet/Geno
-    if resource_id:
-        resource_info = get_resource_info(resource_id)
+def cached_privileges(user_id, resource_id, generation):
+    """The privileges of `user_id` on `resource_id` cached by this process,
+    or None if there are none from the current permissions generation, within
+    `PRIVILEGES_CACHE_TTL` seconds"""
+    with PRIVILEGES_CACHE_LOCK:
+        (privileges, cached_generation, expires) = PRIVILEGES_CACHE.get(
+            (user_id, resource_id), (None, None, 0))
+        if cached_generation != generation or time.monotonic() > expires:
+            return None
+        PRIVILEGES_CACHE.move_to_end((user_id, resource_id))
+        return privileges
+
+
+def cache_privileges(user_id, resource_id, generation, privileges):
+    """Cache the privileges of `user_id` on `resource_id`, dropping the least
+    recently used ones beyond `PRIVILEGES_CACHE_SIZE`"""
+    with PRIVILEGES_CACHE_LOCK:
+        PRIVILEGES_CACHE[(user_id, resource_id)] = (
+            privileges, generation,
+            time.monotonic() + get_setting_int("PRIVILEGES_CACHE_TTL"))
+        PRIVILEGES_CACHE.move_to_end((user_id, resource_id))
+        while len(PRIVILEGES_CACHE) > get_setting_int("PRIVILEGES_CACHE_SIZE"):
+            PRIVILEGES_CACHE.popitem(last=False)
+
+
+def clear_privileges_cache():
+    """Forget the privileges cached by this process"""
+    with PRIVILEGES_CACHE_LOCK:
+        PRIVILEGES_CACHE.clear()
+
+
+def __proxy_privileges__(resource_id, user_id):
+    the_url = f"{GN_PROXY_URL}available?resource={resource_id}&user={user_id}"
+    return json.loads(requests.get(the_url).content)
+
+
+def fetch_privileges(resource_infos, user_id):
+    """Ask the proxy for the privileges of `user_id` on each resource of
+    `resource_infos` (a dict of resource ids to resource info), at most
+    `PRIVILEGES_PROXY_REQUESTS` requests at a time. Returns a dict of the
+    privileges and a dict of the resources the proxy could not answer for,
+    which fall back on their default mask."""
+    if not resource_infos:
+        return ({}, {})
+    with ThreadPoolExecutor(max_workers=min(
+            len(resource_infos),
+            get_setting_int("PRIVILEGES_PROXY_REQUESTS"))) as executor:
+        pending = {resource_id: executor.submit(
+            __proxy_privileges__, resource_id, user_id)
+                     for resource_id in resource_infos}
+    (answered, defaults) = ({}, {})
+    for (resource_id, future) in pending.items():
+        try:
+            answered[resource_id] = future.result()
+        except:
+            defaults[resource_id] = resource_infos[resource_id]['default_mask']
+    return (answered, defaults)
+
 
-        # If resource isn't already in redis, add it with default
-        # privileges
-        if not resource_info:
-            resource_info = add_new_resource(dataset, trait_id)
+def check_resources_availability(dataset, user_id, trait_ids):
+    """Return the privileges of `user_id` on the resources of each of
+    `trait_ids` in `dataset` (None for the dataset itself), as a dict keyed by
+    trait id.
+
+    Resources that are not yet in Redis are added with default privileges.
+    Decisions from the proxy are cached per user and resource for
+    `PRIVILEGES_CACHE_TTL` seconds, or until the permissions change (see
+    `redis_tools.permissions_changed`), so only the resources not seen lately
+    cost a request to the proxy."""
+    resource_ids = {trait_id: get_resource_id(dataset, trait_id)
+                    for trait_id in trait_ids}
+    unique_ids = list(dict.fromkeys(
+        resource_id for resource_id in resource_ids.values() if resource_id))
+    resource_infos = {}
+    if unique_ids:
+        resource_infos = dict(zip(unique_ids,
+                                  Redis.hmget("resources", unique_ids)))
+    for (trait_id, resource_id) in resource_ids.items():
+        if not resource_id:
+            # ZS: This should never be false, but it's technically possible
+            # if a non-Temp dataset somehow had a type other than
+            # Publish/ProbeSet/Geno
+            continue
+        if isinstance(resource_infos.get(resource_id), (str, bytes)):
+            resource_infos[resource_id] = json.loads(resource_infos[resource_id])
+        elif not isinstance(resource_infos.get(resource_id), dict):
+            # If resource isn't already in redis, add it with default
+            # privileges
+            resource_infos[resource_id] = add_new_resource(dataset, trait_id)
 
     # Check if super-user - we should probably come up with some
     # way to integrate this into the proxy
     if user_id in Redis.smembers("super_users"):
-        return webqtlConfig.SUPER_PRIVILEGES
+        return {trait_id: webqtlConfig.SUPER_PRIVILEGES
+                for trait_id in trait_ids}
 
-    response = None
-    the_url = f"{GN_PROXY_URL}available?resource={resource_id}&user={user_id}"
-    try:
-        response = json.loads(requests.get(the_url).content)
-    except:
-        response = resource_info['default_mask']
+    generation = Redis.get(PERMISSIONS_GENERATION)
+    privileges = {}
+    for resource_id in unique_ids:
+        cached = cached_privileges(user_id, resource_id, generation)
+        if cached is not None:
+            privileges[resource_id] = cached
+    (answered, defaults) = fetch_privileges(
+        {resource_id: resource_infos[resource_id] for resource_id in unique_ids
+         if resource_id not in privileges}, user_id)
+    for (resource_id, resource_privileges) in answered.items():
+        cache_privileges(user_id, resource_id, generation, resource_privileges)
+    privileges.update(answered)
+    privileges.update(defaults)
+    return {trait_id: privileges.get(resource_id,
+                                      webqtlConfig.DEFAULT_PRIVILEGES)
+            for (trait_id, resource_id) in resource_ids.items()}
+
+
+def check_resource_availability(dataset, user_id, trait_id=None):
+    # At least for now assume temporary entered traits are accessible
+    if type(dataset) == str or dataset.type == "Temp":
+        return webqtlConfig.DEFAULT_PRIVILEGES
+
+    return check_resources_availability(dataset, user_id, [trait_id])[trait_id]
 
-    return response
+
+def check_traits_availability(dataset, user_id, trait_ids):
+    """Return the privileges of `user_id` on each of the traits `trait_ids` in
+    `dataset`, as a dict keyed by trait id.
+
+    Only phenotype traits are resources of their own; the traits of any other
+    dataset all share the dataset's privileges, which are checked once."""
+    if type(dataset) == str or dataset.type != "Publish":
+        privileges = check_resource_availability(dataset, user_id)
+        return {trait_id: privileges for trait_id in trait_ids}
+    return check_resources_availability(dataset, user_id, trait_ids)
 
 
 def add_new_resource(dataset, trait_id=None):
@@ -82,14 +194,14 @@ def add_new_resource(dataset, trait_id=None):
 
 
 def get_group_code(dataset):
-    with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-        cursor.execute(
-            "SELECT InbredSetCode FROM InbredSet WHERE Name=%s",
-            (dataset.group.name,)
-        )
-        if results := cursor.fetchone():
-            return results[0]
-        return ""
+    if group := inbred_set(dataset.group.name):
+        return group["InbredSetCode"]
+    return ""
+
+
+def is_super_user(user_id) -> bool:
+    """Whether `user_id` is one of the site's super-users"""
+    return bool(user_id) and bool(Redis.sismember("super_users", user_id))
 
 
 def check_admin(resource_id=None):
@@ -1,3 +1,7 @@
+import numpy as np
+import scipy.stats
+
+
 def normalize_values(a_values, b_values):
     """
     Trim two lists of values to contain only the values they both share
@@ -40,3 +44,95 @@ def normalize_values_with_samples(a_samples, b_samples):
         b_new[sample] = b_samples[sample]
 
     return a_new, b_new, len(a_new)
+
+
+def correlation_p_values(coefficients, counts):
+    """Two-sided p-values of correlation `coefficients` over `counts`
+    samples each, from the t-distribution as in `scipy.stats.pearsonr`"""
+    dof = counts - 2.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = coefficients * np.sqrt(
+            dof / ((1.0 - coefficients) * (1.0 + coefficients)))
+        p_values = 2 * scipy.stats.t.sf(np.abs(t_stat), dof)
+    p_values = np.where(np.abs(coefficients) == 1.0, 0.0, p_values)
+    p_values = np.where(counts == 2, 1.0, p_values)
+    return np.where((counts < 2) | np.isnan(coefficients), np.nan, p_values)
+
+
+def row_ranks(values):
+    """
+    Average ranks (from 1) of the values in each row of the 2-d array
+    `values`, as `scipy.stats.rankdata` gives them. NaNs are not ranked and
+    stay NaN.
+
+    >>> row_ranks(np.array([[3.0, 1.0, np.nan, 3.0]])).tolist()
+    [[2.5, 1.0, nan, 2.5]]
+    """
+    (n_rows, n_cols) = values.shape
+    order = np.argsort(values, axis=1, kind="stable")
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    # Number each run of tied values, with a separate range for each row
+    new_run = np.ones(values.shape, dtype=bool)
+    new_run[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    runs = (np.cumsum(new_run, axis=1)
+            + (n_cols + 1) * np.arange(n_rows)[:, np.newaxis]).ravel()
+    positions = np.broadcast_to(
+        np.arange(1.0, n_cols + 1), values.shape).ravel()
+    with np.errstate(invalid="ignore"):
+        mean_positions = (np.bincount(runs, weights=positions)
+                          / np.bincount(runs))
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order,
+                      mean_positions[runs].reshape(values.shape), axis=1)
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
+def correlations_with_vector(vector, rows, method="pearson"):
+    """
+    Correlations of `vector` with each of `rows`, a 2-d array with a column
+    per element of `vector`. NaN marks missing values: each row is correlated
+    with `vector` on the samples both have values for. Any `method` other than
+    "pearson" gives Spearman's rho.
+
+    Returns the coefficients, p-values and numbers of samples, one per row.
+    Coefficients of rows with constant values are NaN.
+    """
+    vector = np.asarray(vector, dtype=float)
+    rows = np.asarray(rows, dtype=float)
+    present = ~np.isnan(rows) & ~np.isnan(vector)
+    counts = present.sum(axis=1)
+    x_values = np.where(present, vector, np.nan)
+    y_values = np.where(present, rows, np.nan)
+    if method != "pearson":
+        (x_values, y_values) = (row_ranks(x_values), row_ranks(y_values))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_dev = np.where(present, x_values, 0.0)
+        y_dev = np.where(present, y_values, 0.0)
+        x_dev -= (x_dev.sum(axis=1) / counts)[:, np.newaxis]
+        y_dev -= (y_dev.sum(axis=1) / counts)[:, np.newaxis]
+        x_dev[~present] = 0.0
+        y_dev[~present] = 0.0
+        spread = np.sqrt((x_dev * x_dev).sum(axis=1)
+                         * (y_dev * y_dev).sum(axis=1))
+        coefficients = np.clip((x_dev * y_dev).sum(axis=1) / spread, -1.0, 1.0)
+    coefficients[spread == 0] = np.nan
+    return (coefficients, correlation_p_values(coefficients, counts), counts)
+
+
+def largest_indices(scores, count):
+    """
+    Indices of the `count` largest `scores`, largest first. Only those are
+    sorted: the rest are left out with a partial sort.
+
+    >>> largest_indices(np.array([0.2, 0.9, 0.1, 0.5]), 2).tolist()
+    [1, 3]
+    """
+    if count <= 0:
+        return np.array([], dtype=int)
+    if count < len(scores):
+        top = np.argpartition(-scores, count - 1)[:count]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
@@ -0,0 +1,46 @@
+"""Helpers for size-bounded caches kept as files on disk
+
+Cache entries are one or more files; the modification time of an entry's
+first file is its last use, which `mark_used` updates on every cache hit."""
+import os
+
+
+def mark_used(file_path):
+    """Record a cache hit on `file_path`"""
+    try:
+        os.utime(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def evict_least_recently_used(entries, max_bytes):
+    """Delete the least recently used of `entries` until the rest take up at
+    most `max_bytes`. Each entry is a list of file paths, the first of which
+    dates the entry. Returns the number of entries evicted."""
+    sized_entries = []
+    for paths in entries:
+        try:
+            mtime = os.stat(paths[0]).st_mtime
+        except FileNotFoundError:
+            continue
+        size = 0
+        for file_path in paths:
+            try:
+                size += os.stat(file_path).st_size
+            except FileNotFoundError:
+                continue
+        sized_entries.append((mtime, size, paths))
+
+    total_bytes = sum(size for (_mtime, size, _paths) in sized_entries)
+    evicted = 0
+    for (_mtime, size, paths) in sorted(sized_entries, key=lambda entry: entry[:2]):
+        if total_bytes <= max_bytes:
+            break
+        for file_path in paths:
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
+                continue
+        total_bytes -= size
+        evicted += 1
+    return evicted
@@ -1,3 +1,13 @@
+import os
+
+import numpy as np
+
+from gn2.utility import arrays
+from gn2.utility.arrays import file_stamp
+from gn2.utility.arrays import read_array_file
+from gn2.utility.arrays import write_array_file
+
+
 class genotype:
     """
     Replacement for reaper.Dataset so we can remove qtlreaper use while still generating mapping output figure
@@ -180,3 +190,301 @@ class Locus:
                     self.genotype.append(geno_table[allele])
                 else:  # ZS: Some genotype appears that isn't specified in the metadata, make it unknown
                     self.genotype.append("U")
+
+
+# Code used for unknown genotypes in GenotypeMatrix.genotypes
+UNKNOWN_GENOTYPE = 9
+
+
+class GenotypeMatrix:
+    """
+    Array-backed alternative to `genotype`: the genotypes are held in a single
+    int8 (markers x samples) matrix, and the marker names, chromosomes and
+    cM/Mb positions in parallel arrays. Chromosomes and loci are exposed as
+    lazy views with the same interface as `Chr` and `Locus`.
+    """
+
+    def __init__(self, filename=None):
+        self.group = None
+        self.type = "riset"
+        self.prgy = []
+        self.nprgy = 0
+        self.mat = -1
+        self.pat = 1
+        self.het = 0
+        self.unk = "U"
+        self.filler = False
+        self.mb_exists = False
+
+        self.cm_column = 2
+        self.mb_column = 3
+
+        self.genotypes = np.empty((0, 0), dtype=np.int8)
+        self.names = np.empty(0, dtype=object)
+        self.chrs = np.empty(0, dtype=object)
+        self.cM = np.empty(0)
+        self.Mb = np.empty(0)
+        self.chromosomes = []
+
+        if filename:
+            self.read_file(filename)
+
+    def __iter__(self):
+        return iter(self.chromosomes)
+
+    def __getitem__(self, index):
+        return self.chromosomes[index]
+
+    def __len__(self):
+        return len(self.chromosomes)
+
+    def index_chromosomes(self, chr_names=None):
+        """Build the chromosome views: a new chromosome starts wherever the
+        chromosome name changes from one marker to the next."""
+        chr_names = self.chrs if chr_names is None else chr_names
+        starts = [idx for idx in range(len(chr_names))
+                  if idx == 0 or chr_names[idx] != chr_names[idx - 1]]
+        self.chromosomes = [
+            ChrView(chr_names[start], self, start, stop)
+            for (start, stop) in zip(starts, starts[1:] + [len(chr_names)])]
+
+    def read_rdata_output(self, qtl_results):
+        # R/qtl needs cM positions that don't exist in the .geno file for
+        # some groups (e.g. HET3-ITP), so take the markers from the results
+        names, chrs, chr_names, cms, mbs = [], [], [], [], []
+        this_chr = ""
+        for marker in qtl_results:
+            # Same chromosome grouping as genotype.read_rdata_output
+            if (str(marker['chr']) != this_chr) and this_chr != "X":
+                this_chr = str(marker['chr'])
+                if this_chr == "20":
+                    this_chr = "X"
+            chr_names.append(this_chr)
+            chrs.append(str(marker['chr']) if 'chr' in marker else None)
+            names.append(marker.get('name'))
+            cms.append(marker.get('cM'))
+            mbs.append(marker.get('Mb'))
+
+        self.names = np.array(names, dtype=object)
+        self.chrs = np.array(chrs, dtype=object)
+        self.cM = np.array(cms, dtype=float)
+        self.Mb = np.array(mbs, dtype=float)
+        self.genotypes = np.empty((len(names), 0), dtype=np.int8)
+        self.index_chromosomes(chr_names)
+
+        return self
+
+    def read_file(self, filename):
+        markers = []
+        with open(filename, 'r') as geno_file:
+            for line in geno_file:
+                line = line.rstrip("\r\n")
+                if not line or line[0] == "#":
+                    continue
+                elif line[0] == "@":
+                    (label, _sep, value) = line[1:].partition(":")
+                    value = value.strip()
+                    if label == "name":
+                        self.group = value
+                    elif label == "filler":
+                        self.filler = (value == "yes")
+                    elif label in ("type", "mat", "pat", "het", "unk"):
+                        setattr(self, label, value)
+                elif line[:3] == "Chr":
+                    header_row = line.split("\t")
+                    if header_row[2] == "Mb":
+                        self.mb_exists = True
+                        self.mb_column = 2
+                        self.cm_column = 3
+                    elif header_row[3] == "Mb":
+                        self.mb_exists = True
+                        self.mb_column = 3
+                    elif header_row[2] == "cM":
+                        self.cm_column = 2
+
+                    self.prgy = header_row[4:] if self.mb_exists else header_row[3:]
+                    self.nprgy = len(self.prgy)
+                else:
+                    markers.append(line.split("\t"))
+
+        start_pos = 4 if self.mb_exists else 3
+        self.chrs = np.array([row[0] for row in markers], dtype=object)
+        self.names = np.array([row[1] for row in markers], dtype=object)
+        (self.cM, self.Mb) = self.__positions__(markers)
+        self.genotypes = self.__encode_genotypes__(
+            [row[start_pos:] for row in markers])
+        self.index_chromosomes()
+
+    def __positions__(self, markers):
+        def __float__(row, column):
+            try:
+                return float(row[column])
+            except (IndexError, ValueError):
+                return None
+
+        cms, mbs = [], []
+        for row in markers:
+            # Same fallbacks as Locus: cM falls back to Mb (or 0) and Mb to cM
+            cm_pos = __float__(row, self.cm_column)
+            if cm_pos is None:
+                cm_pos = __float__(row, self.mb_column) if self.mb_exists else 0
+            mb_pos = __float__(row, self.mb_column) if self.mb_exists else None
+            if self.mb_exists and mb_pos is None:
+                mb_pos = cm_pos
+            cms.append(cm_pos)
+            mbs.append(mb_pos)
+        return (np.array(cms, dtype=float), np.array(mbs, dtype=float))
+
+    def __encode_genotypes__(self, alleles):
+        if not alleles:
+            return np.empty((0, self.nprgy), dtype=np.int8)
+        width = max(len(row) for row in alleles)
+        if any(len(row) != width for row in alleles):
+            alleles = [row + [""] * (width - len(row)) for row in alleles]
+
+        (tokens, inverse) = np.unique(np.array(alleles), return_inverse=True)
+        geno_table = {self.mat: -1, self.pat: 1, self.het: 0}
+        codes = np.array([geno_table.get(token, UNKNOWN_GENOTYPE)
+                          for token in tokens.tolist()], dtype=np.int8)
+        return codes[inverse].reshape(len(alleles), width)
+
+
+class ChrView:
+    """A chromosome of a GenotypeMatrix; behaves like `Chr`"""
+
+    def __init__(self, name, geno_ob, start, stop):
+        self.name = name
+        self.geno_ob = geno_ob
+        self.start = start
+        self.stop = stop
+        self.mb_exists = geno_ob.mb_exists
+        self.cm_column = geno_ob.cm_column
+        self.mb_column = geno_ob.mb_column
+
+    def __iter__(self):
+        return (LocusView(self.geno_ob, idx)
+                for idx in range(self.start, self.stop))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LocusView(self.geno_ob, idx) for idx in
+                    range(self.start, self.stop)[index]]
+        return LocusView(self.geno_ob, range(self.start, self.stop)[index])
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def loci(self):
+        return list(self)
+
+    @property
+    def genotypes(self):
+        """The (markers x samples) genotype codes of this chromosome"""
+        return self.geno_ob.genotypes[self.start:self.stop]
+
+
+class LocusView:
+    """A marker of a GenotypeMatrix; behaves like `Locus`"""
+    __slots__ = ("geno_ob", "index")
+
+    def __init__(self, geno_ob, index):
+        self.geno_ob = geno_ob
+        self.index = index
+
+    @property
+    def chr(self):
+        return self.geno_ob.chrs[self.index]
+
+    @property
+    def name(self):
+        return self.geno_ob.names[self.index]
+
+    @property
+    def cM(self):
+        return self.__position__(self.geno_ob.cM[self.index])
+
+    @property
+    def Mb(self):
+        return self.__position__(self.geno_ob.Mb[self.index])
+
+    @staticmethod
+    def __position__(value):
+        return None if np.isnan(value) else float(value)
+
+    @property
+    def genotype(self):
+        return ["U" if code == UNKNOWN_GENOTYPE else code
+                for code in self.geno_ob.genotypes[self.index].tolist()]
+
+
+# Parsed genotypes are cached in binary "sidecar" files next to the .geno
+# file (or in a fallback cache directory). The genotype arrays are
+# memory-mapped, so every worker process shares one copy through the page
+# cache. A sidecar records the mtime and size of its .geno file and is
+# ignored once they no longer match.
+SIDECAR_MAGIC = b"GN2GENO1"
+SIDECAR_EXT = ".gn2geno"
+_SIDECAR_METADATA = ("group", "type", "prgy", "nprgy", "mat", "pat", "het",
+                     "unk", "filler", "mb_exists", "cm_column", "mb_column")
+
+
+def sidecar_paths(filename, cache_dirs=()):
+    """Candidate sidecar files for `filename`, in order of preference"""
+    return arrays.sidecar_paths(filename, SIDECAR_EXT, cache_dirs)
+
+
+def write_genotype_sidecar(geno_ob, filename, sidecar_path):
+    """Write the parsed genotype `geno_ob`, read from `filename`, to
+    `sidecar_path`"""
+    return write_array_file(
+        sidecar_path, SIDECAR_MAGIC, {
+            "source": file_stamp(filename),
+            "metadata": {attr: getattr(geno_ob, attr)
+                         for attr in _SIDECAR_METADATA},
+            "names": geno_ob.names.tolist(),
+            "chrs": geno_ob.chrs.tolist()},
+        [np.asarray(geno_ob.cM, dtype=np.float64),
+         np.asarray(geno_ob.Mb, dtype=np.float64),
+         np.asarray(geno_ob.genotypes, dtype=np.int8)])
+
+
+def read_genotype_sidecar(filename, sidecar_path):
+    """Load a GenotypeMatrix from `sidecar_path`; None if the sidecar is
+    missing, unreadable or older than `filename`"""
+    try:
+        (header, (cms, mbs, genotypes)) = read_array_file(
+            sidecar_path, SIDECAR_MAGIC)
+    except (OSError, ValueError, KeyError):
+        return None
+    if header["source"] != file_stamp(filename):
+        return None
+
+    geno_ob = GenotypeMatrix()
+    for (attr, value) in header["metadata"].items():
+        setattr(geno_ob, attr, value)
+    geno_ob.names = np.array(header["names"], dtype=object)
+    geno_ob.chrs = np.array(header["chrs"], dtype=object)
+    (geno_ob.cM, geno_ob.Mb, geno_ob.genotypes) = (cms, mbs, genotypes)
+    geno_ob.index_chromosomes()
+    return geno_ob
+
+
+def load_genotype(filename, cache_dirs=()):
+    """Return the GenotypeMatrix for the .geno file `filename`, from a fresh
+    sidecar if there is one. Otherwise the file is parsed and a sidecar is
+    written to the first writable location."""
+    paths = sidecar_paths(filename, cache_dirs)
+    for sidecar_path in paths:
+        geno_ob = read_genotype_sidecar(filename, sidecar_path)
+        if geno_ob is not None:
+            return geno_ob
+
+    geno_ob = GenotypeMatrix(filename)
+    for sidecar_path in paths:
+        try:
+            write_genotype_sidecar(geno_ob, filename, sidecar_path)
+            break
+        except OSError:
+            continue
+    return geno_ob
@@ -1,5 +1,5 @@
 from gn2.base import data_set
-from gn2.base.trait import create_trait
+from gn2.base.trait import create_trait, create_traits
 from gn2.base.species import TheSpecies
 
 from gn2.utility import hmac
@@ -71,26 +71,46 @@ def get_species_dataset_trait(self, start_vars):
                                    get_qtl_info=True)
 
 def get_trait_db_obs(self, trait_db_list):
+    """Create the traits in `trait_db_list`, a list (or comma-separated
+    string) of HMAC-signed `trait:dataset` strings, as `self.trait_list` of
+    `(trait, dataset)` pairs. The traits of each dataset are created together
+    with `create_traits`, which fetches their info and sample data in bulk."""
     if isinstance(trait_db_list, str):
         trait_db_list = trait_db_list.split(",")
 
-    self.trait_list = []
+    requested = []
     for trait in trait_db_list:
         data, _separator, hmac_string = trait.rpartition(':')
         data = data.strip()
         assert hmac_string == hmac.hmac_creation(data), "Data tampering?"
         trait_name, dataset_name = data.split(":")[:2]
+        requested.append((trait_name, dataset_name))
+
+    names_by_dataset = {}
+    for (trait_name, dataset_name) in requested:
+        if dataset_name != "Temp":
+            names_by_dataset.setdefault(dataset_name, []).append(trait_name)
+    created = {}
+    for (dataset_name, trait_names) in names_by_dataset.items():
+        dataset_ob = data_set.create_dataset(dataset_name)
+        for (trait_name, trait_ob) in create_traits(
+                dataset_ob, list(dict.fromkeys(trait_names)),
+                get_sample_info=True).items():
+            created[(trait_name, dataset_name)] = (trait_ob, dataset_ob)
+
+    self.trait_list = []
+    for (trait_name, dataset_name) in requested:
         if dataset_name == "Temp":
             dataset_ob = data_set.create_dataset(
                 dataset_name=dataset_name, dataset_type="Temp",
                 group_name=trait_name.split("_")[2])
-        else:
-            dataset_ob = data_set.create_dataset(dataset_name)
-        trait_ob = create_trait(dataset=dataset_ob,
-                                name=trait_name,
-                                cellid=None)
-        if trait_ob:
-            self.trait_list.append((trait_ob, dataset_ob))
+            trait_ob = create_trait(dataset=dataset_ob,
+                                    name=trait_name,
+                                    cellid=None)
+            if trait_ob:
+                self.trait_list.append((trait_ob, dataset_ob))
+        elif (trait_name, dataset_name) in created:
+            self.trait_list.append(created[(trait_name, dataset_name)])
 
 
 def get_species_groups():
@@ -14,6 +14,27 @@ def get_redis_conn():
 
 Redis = get_redis_conn()
 
+# Incremented whenever access masks, owners or group memberships change, so
+# that privileges cached by any process are no longer used
+PERMISSIONS_GENERATION = "permissions_generation"
+
+
+def permissions_changed(redis_conn=Redis):
+    """Invalidate the privileges cached by `check_resource_availability`"""
+    redis_conn.incr(PERMISSIONS_GENERATION)
+
+
+# Incremented whenever the data or metadata of datasets is edited, so that the
+# table timestamps and dataset metadata memoized by any process are no longer
+# used
+DATASETS_GENERATION = "datasets_generation"
+
+
+def datasets_changed(redis_conn=Redis):
+    """Invalidate the table timestamps and dataset metadata memoized by
+    `gn2.base.data_set.utils`"""
+    redis_conn.incr(DATASETS_GENERATION)
+
 
 def is_redis_available():
     try:
@@ -164,6 +185,7 @@ def delete_group(user_id, group_id):
     group_info = get_group_info(group_id)
     if user_id in group_info["admins"]:
         Redis.hdel("groups", group_id)
+        permissions_changed()
         return get_user_groups(user_id)
     else:
         None
@@ -194,6 +216,7 @@ def add_users_to_group(user_id, group_id, user_emails=[], admins=False):
         group_info["changed_timestamp"] = datetime.datetime.utcnow().strftime(
             '%b %d %Y %I:%M%p')
         Redis.hset("groups", group_id, json.dumps(group_info))
+        permissions_changed()
         return group_info
     else:
         return None
@@ -219,6 +242,7 @@ def remove_users_from_group(user_id,
         group_info["changed_timestamp"] = datetime.datetime.utcnow().strftime(
             '%b %d %Y %I:%M%p')
         Redis.hset("groups", group_id, json.dumps(group_info))
+        permissions_changed()
 
 
 def change_group_name(user_id, group_id, new_name):
@@ -272,6 +296,8 @@ def add_resource(resource_info, update=True):
 
     if update or not Redis.hexists("resources", resource_id):
         Redis.hset("resources", resource_id, json.dumps(resource_info))
+        if update:
+            permissions_changed()
 
     return resource_info
 
@@ -281,5 +307,6 @@ def add_access_mask(resource_id, group_id, access_mask):
     the_resource['group_masks'][group_id] = access_mask
 
     Redis.hset("resources", resource_id, json.dumps(the_resource))
+    permissions_changed()
 
     return the_resource
@@ -42,6 +42,7 @@ from gn2.wqflask.oauth2.collections import num_collections
 from gn2.wqflask.oauth2.request_utils import user_details, authserver_authorise_uri
 
 from gn2.wqflask.jupyter_notebooks import jupyter_notebooks
+from gn2.wqflask.database import release_request_connections
 
 from gn2.wqflask.startup import (
     StartupError,
@@ -146,6 +147,8 @@ def before_request():
     g.request_start_time = time.time()
     g.request_time = lambda: "%.5fs" % (time.time() - g.request_start_time)
 
+app.teardown_request(release_request_connections)
+
 @app.context_processor
 def include_admin_role_class():
     return {'AdminRole': AdminRole}
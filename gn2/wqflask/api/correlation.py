@@ -78,44 +78,44 @@ def calculate_results(this_trait, this_dataset, target_dataset, corr_params):
         sorted_results = collections.OrderedDict(sorted(list(corr_results.items()),
                                                         key=lambda t: -abs(t[1][1])))
     else:
-        for target_trait, target_vals in list(target_dataset.trait_data.items()):
-            result = get_sample_r_and_p_values(
-                this_trait, this_dataset, target_vals, target_dataset, corr_params['type'])
-            if result is not None:
-                corr_results[target_trait] = result
-
-        sorted_results = collections.OrderedDict(
-            sorted(list(corr_results.items()), key=lambda t: -abs(t[1][0])))
+        sorted_results = do_sample_correlation_for_all_traits(
+            this_trait, target_dataset, corr_params)
 
     return sorted_results
 
 
-def do_tissue_correlation_for_all_traits(this_trait, trait_symbol_dict, corr_params, tissue_dataset_id=1):
-    # Gets tissue expression values for the primary trait
-    primary_trait_tissue_vals_dict = correlation_functions.get_trait_symbol_and_tissue_values(
-        symbol_list=[this_trait.symbol])
-
-    if this_trait.symbol.lower() in primary_trait_tissue_vals_dict:
-        primary_trait_tissue_values = primary_trait_tissue_vals_dict[this_trait.symbol.lower(
-        )]
-
-        corr_result_tissue_vals_dict = correlation_functions.get_trait_symbol_and_tissue_values(
-            symbol_list=list(trait_symbol_dict.values()))
-
-        tissue_corr_data = {}
-        for trait, symbol in list(trait_symbol_dict.items()):
-            if symbol and symbol.lower() in corr_result_tissue_vals_dict:
-                this_trait_tissue_values = corr_result_tissue_vals_dict[symbol.lower(
-                )]
+def do_sample_correlation_for_all_traits(this_trait, target_dataset, corr_params):
+    """
+    Correlate the sample values of `this_trait` with those of every trait in
+    `target_dataset` at once, from the dataset's trait matrix (see
+    `DataSet.get_trait_data`), as `get_sample_r_and_p_values` does for one
+    trait.
 
-                result = correlation_functions.cal_zero_order_corr_for_tiss(primary_trait_tissue_values,
-                                                                            this_trait_tissue_values,
-                                                                            corr_params['method'])
+    Returns the `return_count` strongest correlations (all of them if it is
+    not set), strongest first.
+    """
+    trait_matrix = target_dataset.trait_matrix
+    samples = target_dataset.group.samplelist[:trait_matrix.shape[1]]
+    (sample_r, sample_p, num_overlap) = corr_result_helpers.correlations_with_vector(
+        this_trait.data.values_for(samples), trait_matrix[:, :len(samples)],
+        corr_params['method'])
+
+    kept = numpy.flatnonzero((num_overlap > 5) & ~numpy.isnan(sample_r))
+    return_count = corr_params.get('return_count', len(kept))
+    strongest = kept[corr_result_helpers.largest_indices(
+        numpy.abs(sample_r[kept]), return_count)]
+    return collections.OrderedDict(
+        (target_dataset.trait_names[idx],
+         [float(sample_r[idx]), float(sample_p[idx]), int(num_overlap[idx])])
+        for idx in strongest)
 
-                tissue_corr_data[trait] = [
-                    result[0], result[1], result[2], symbol]
 
-        return tissue_corr_data
+def do_tissue_correlation_for_all_traits(this_trait, trait_symbol_dict, corr_params, tissue_dataset_id=1):
+    tissue_corrs = correlation_functions.tissue_correlations(
+        this_trait.symbol, trait_symbol_dict, corr_params['method'])
+    if tissue_corrs is not None:
+        return {trait: [corr, num_tissues, p_value, trait_symbol_dict[trait]]
+                for (trait, (corr, num_tissues, p_value)) in tissue_corrs.items()}
 
 
 def do_literature_correlation_for_all_traits(this_trait, target_dataset, trait_geneid_dict, corr_params):
@@ -5,6 +5,7 @@ import io
 import csv
 import json
 import datetime
+import itertools
 import requests
 
 from zipfile import ZipFile, ZIP_DEFLATED
@@ -12,16 +13,18 @@ from zipfile import ZipFile, ZIP_DEFLATED
 
 import flask
 from flask import current_app
-from gn2.wqflask.database import database_connection
+from gn2.wqflask.database import database_connection, pool_metrics
 from flask import request
 from flask import make_response
 from flask import send_file
 
 from gn2.wqflask import app
 
-from gn2.wqflask.api import correlation, mapping, gen_menu
+from gn2.wqflask.api import correlation, mapping, gen_menu, streaming
+from gn2.wqflask.decorators import super_user_required
 
 from gn2.utility.tools import flat_files, get_setting
+from gn2.base.data_set.utils import DATASET_CACHE_STATS
 
 from gn2.wqflask.database import database_connection
 
@@ -353,28 +356,18 @@ def fetch_traits(dataset_name, file_format="json"):
             return flask.jsonify(trait_ids)
         else:
             filename = dataset_name + "_trait_ids.csv"
-
-            si = io.StringIO()
-            csv_writer = csv.writer(si)
-            csv_writer.writerows([[trait_id] for trait_id in trait_ids])
-            output = make_response(si.getvalue())
-            output.headers["Content-Disposition"] = "attachment; filename=" + filename
-            output.headers["Content-type"] = "text/csv"
-            return output
+            return streaming.streamed_response(
+                streaming.csv_chunks([trait_id] for trait_id in trait_ids),
+                "text/csv", filename)
     elif ("names_only" in request.args) and (len(trait_ids) > 0):
         if file_format == "json":
             filename = dataset_name + "_trait_names.json"
             return flask.jsonify(trait_names)
         else:
             filename = dataset_name + "_trait_names.csv"
-
-            si = io.StringIO()
-            csv_writer = csv.writer(si)
-            csv_writer.writerows([[trait_name] for trait_name in trait_names])
-            output = make_response(si.getvalue())
-            output.headers["Content-Disposition"] = "attachment; filename=" + filename
-            output.headers["Content-type"] = "text/csv"
-            return output
+            return streaming.streamed_response(
+                streaming.csv_chunks([trait_name] for trait_name in trait_names),
+                "text/csv", filename)
     else:
         if len(trait_ids) > 0:
             if data_type == "ProbeSet":
@@ -395,7 +388,7 @@ def fetch_traits(dataset_name, file_format="json"):
                                 INNER JOIN ProbeSet ON ProbeSet.`Id` = ProbeSetXRef.`ProbeSetId`
                                 LEFT JOIN Geno ON ProbeSetXRef.`Locus` = Geno.`Name` AND Geno.`SpeciesId` = Species.`Id`
                             WHERE
-                                ProbeSetXRef.ProbeSetFreezeId = "{0}"
+                                ProbeSetXRef.ProbeSetFreezeId = %s
                             ORDER BY
                                 ProbeSet.Id"""
 
@@ -408,7 +401,7 @@ def fetch_traits(dataset_name, file_format="json"):
                             FROM
                                 Geno, GenoXRef, GenoFreeze
                             WHERE
-                                GenoXRef.GenoFreezeId = "{0}" AND
+                                GenoXRef.GenoFreezeId = %s AND
                                 GenoXRef.GenoId = Geno.Id AND
                                 GenoXRef.GenoFreezeId = GenoFreeze.Id AND
                                 GenoFreeze.public > 0 AND
@@ -438,7 +431,7 @@ def fetch_traits(dataset_name, file_format="json"):
                             INNER JOIN Phenotype ON Phenotype.`Id` = PublishXRef.`PhenotypeId`
                             LEFT JOIN Geno ON PublishXRef.Locus = Geno.Name AND Geno.SpeciesId = Species.Id
                         WHERE
-                            PublishXRef.InbredSetId = {0} AND
+                            PublishXRef.InbredSetId = %s AND
                             PublishFreeze.InbredSetId = PublishXRef.InbredSetId AND
                             PublishFreeze.public > 0 AND
                             PublishFreeze.confidentiality < 1
@@ -448,46 +441,30 @@ def fetch_traits(dataset_name, file_format="json"):
                 field_list = ["Id", "Description", "Authors", "Year", "PubMedID", "Mean",
                               "LRS", "Additive", "Locus", "Chr", "Mb"]
 
-            if 'limit_to' in request.args:
-                limit_number = request.args['limit_to']
-                query += "LIMIT " + str(limit_number)
-            with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-                if file_format == "json":
-                    filename = dataset_name + "_traits.json"
-                    cursor.execute(query.format(dataset_id))
-                    result_list = []
-                    for result in cursor.fetchall():
-                        trait_dict = {}
-                        for i, field in enumerate(field_list):
-                            if result[i]:
-                                trait_dict[field] = result[i]
-                        result_list.append(trait_dict)
-                    return flask.jsonify(result_list)
-                elif file_format == "csv":
-                    filename = dataset_name + "_traits.csv"
-
-                    results_list = []
-                    header_list = []
-                    header_list += field_list
-                    results_list.append(header_list)
-                    cursor.execute(query.format(dataset_id))
-                    for result in cursor.fetchall():
-                        results_list.append(result)
-
-                    si = io.StringIO()
-                    csv_writer = csv.writer(si)
-                    csv_writer.writerows(results_list)
-                    output = make_response(si.getvalue())
-                    output.headers["Content-Disposition"] = "attachment; filename=" + filename
-                    output.headers["Content-type"] = "text/csv"
-                    return output
-                else:
-                    return return_error(
-                        code=400,
-                        source=request.url_rule.rule,
-                        title="Invalid Output Format",
-                        details="Current formats available are JSON and CSV, with CSV as default"
-                    )
+            params = (dataset_id,)
+            if request.args.get('limit_to', "").isdigit():
+                query += " LIMIT %s"
+                params += (int(request.args['limit_to']),)
+            if file_format == "json":
+                return streaming.streamed_response(
+                    streaming.json_array_chunks(
+                        {field: value
+                         for (field, value) in zip(field_list, result) if value}
+                        for result in streaming.query_rows(query, params)),
+                    "application/json")
+            elif file_format == "csv":
+                filename = dataset_name + "_traits.csv"
+                return streaming.streamed_response(
+                    streaming.csv_chunks(itertools.chain(
+                        [field_list], streaming.query_rows(query, params))),
+                    "text/csv", filename)
+            else:
+                return return_error(
+                    code=400,
+                    source=request.url_rule.rule,
+                    title="Invalid Output Format",
+                    details="Current formats available are JSON and CSV, with CSV as default"
+                )
         else:
             return return_error(
                 code=204,
@@ -508,103 +485,94 @@ def all_sample_data(dataset_name, file_format="csv"):
         if data_type == "ProbeSet":
             query = """
                         SELECT
-                            Strain.Name, Strain.Name2, ProbeSetData.value, ProbeSetData.Id, ProbeSetSE.error
+                            Strain.Name, ProbeSetXRef.ProbeSetId, ProbeSetData.value
                         FROM
-                            (ProbeSetData, Strain, ProbeSetXRef, ProbeSetFreeze)
-                        LEFT JOIN ProbeSetSE ON
-                            (ProbeSetSE.DataId = ProbeSetData.Id AND ProbeSetSE.StrainId = ProbeSetData.StrainId)
+                            ProbeSetData, Strain, ProbeSetXRef, ProbeSetFreeze
                         WHERE
-                            ProbeSetXRef.ProbeSetFreezeId = "{0}" AND
-                            ProbeSetXRef.ProbeSetId = "{1}" AND
+                            ProbeSetXRef.ProbeSetFreezeId = %s AND
                             ProbeSetXRef.DataId = ProbeSetData.Id AND
                             ProbeSetData.StrainId = Strain.Id AND
                             ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id AND
                             ProbeSetFreeze.public > 0 AND
                             ProbeSetFreeze.confidentiality < 1
                         ORDER BY
-                            Strain.Name
+                            Strain.Name, Strain.Id
                     """
         elif data_type == "Geno":
             query = """
                         SELECT
-                            Strain.Name, Strain.Name2, GenoData.value, GenoData.Id, GenoSE.error
+                            Strain.Name, GenoXRef.GenoId, GenoData.value
                         FROM
-                            (GenoData, Strain, GenoXRef, GenoFreeze)
-                        LEFT JOIN GenoSE ON
-                            (GenoSE.DataId = GenoData.Id AND GenoSE.StrainId = GenoData.StrainId)
+                            GenoData, Strain, GenoXRef, GenoFreeze
                         WHERE
-                            GenoXRef.GenoFreezeId = "{0}" AND
-                            GenoXRef.GenoId = "{1}" AND
+                            GenoXRef.GenoFreezeId = %s AND
                             GenoXRef.DataId = GenoData.Id AND
                             GenoData.StrainId = Strain.Id AND
                             GenoXRef.GenoFreezeId = GenoFreeze.Id AND
                             GenoFreeze.public > 0 AND
                             GenoFreeze.confidentiality < 1
                         ORDER BY
-                            Strain.Name
+                            Strain.Name, Strain.Id
                     """
         else:
             query = """
                         SELECT
-                            Strain.Name, Strain.Name2, PublishData.value, PublishData.Id, PublishSE.error, NStrain.count
+                            Strain.Name, PublishXRef.PhenotypeId, PublishData.value
                         FROM
-                            (PublishData, Strain, PublishXRef, PublishFreeze)
-                        LEFT JOIN PublishSE ON
-                            (PublishSE.DataId = PublishData.Id AND PublishSE.StrainId = PublishData.StrainId)
-                        LEFT JOIN NStrain ON
-                            (NStrain.DataId = PublishData.Id AND
-                            NStrain.StrainId = PublishData.StrainId)
+                            PublishData, Strain, PublishXRef, PublishFreeze
                         WHERE
-                            PublishXRef.InbredSetId = "{0}" AND
-                            PublishXRef.PhenotypeId = "{1}" AND
+                            PublishXRef.InbredSetId = %s AND
                             PublishData.Id = PublishXRef.DataId AND
                             PublishData.StrainId = Strain.Id AND
                             PublishXRef.InbredSetId = PublishFreeze.InbredSetId AND
                             PublishFreeze.public > 0 AND
                             PublishFreeze.confidentiality < 1
                         ORDER BY
-                            Strain.Name
+                            Strain.Name, Strain.Id
                     """
 
         if file_format == "csv":
             filename = dataset_name + "_sample_data.csv"
-
-            results_list = []
-            header_list = []
-            header_list.append("id")
-            header_list += sample_list
-            results_list.append(header_list)
-            with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
-                for i, trait_id in enumerate(trait_ids):
-                    line_list = []
-                    line_list.append(str(trait_names[i]))
-                    cursor.execute(query.format(dataset_id, trait_id))
-                    results = cursor.fetchall()
-                    results_dict = {}
-                    for item in results:
-                        results_dict[item[0]] = item[2]
-                    for sample in sample_list:
-                        if sample in results_dict:
-                            line_list.append(results_dict[sample])
-                        else:
-                            line_list.append("x")
-                    results_list.append(line_list)
-
-            results_list = list(map(list, zip(*results_list)))
-
-            si = io.StringIO()
-            csv_writer = csv.writer(si)
-            csv_writer.writerows(results_list)
-            output = make_response(si.getvalue())
-            output.headers["Content-Disposition"] = "attachment; filename=" + filename
-            output.headers["Content-type"] = "text/csv"
-            return output
+            return streaming.streamed_response(
+                streaming.csv_chunks(itertools.chain(
+                    [["id"] + [str(trait_name) for trait_name in trait_names]],
+                    sample_data_rows(
+                        streaming.query_rows(query, (dataset_id,)),
+                        trait_ids, sample_list))),
+                "text/csv", filename)
         else:
             return return_error(code=415, source=request.url_rule.rule, title="Unsupported file format", details="")
     else:
         return return_error(code=204, source=request.url_rule.rule, title="No Results", details="")
 
 
+def sample_data_rows(results, trait_ids, sample_list):
+    """Yield a row for each sample of `sample_list`: the sample's name, then its
+    value for each of `trait_ids` ("x" where there is none).
+
+    `results` are the `(sample, trait id, value)` of the dataset ordered by
+    sample, so each row is complete once the next sample's results start.
+    The samples are in the order of `results`; those with no results at all
+    come last."""
+    columns = {trait_id: column
+               for (column, trait_id) in enumerate(trait_ids, start=1)}
+    remaining = dict.fromkeys(sample_list, True)
+    (sample, row) = (None, None)
+    for (result_sample, trait_id, value) in results:
+        if result_sample != sample:
+            if row is not None:
+                yield row
+            sample = result_sample
+            row = ([sample] + ["x"] * len(trait_ids)
+                   if remaining.pop(sample, False) else None)
+        if row is not None and trait_id in columns:
+            row[columns[trait_id]] = value
+    if row is not None:
+        yield row
+    for sample in remaining:
+        yield [sample] + ["x"] * len(trait_ids)
+
+
 @app.route("/api/v_{}/sample_data/<path:dataset_name>/<path:trait_name>".format(version))
 @app.route("/api/v_{}/sample_data/<path:dataset_name>/<path:trait_name>.<path:file_format>".format(version))
 def trait_sample_data(dataset_name, trait_name, file_format="json"):
@@ -810,25 +778,14 @@ def get_genotypes(group_name, file_format="csv", dataset_name=None):
         if request.args['limit_to'].isdigit():
             limit_num = int(request.args['limit_to'])
 
-    si = io.StringIO()
     if file_format == "csv" or file_format == "geno":
         filename = group_name + ".geno"
 
         if os.path.isfile("{0}/{1}.geno".format(flat_files("genotype"), group_name)):
-            output_lines = []
-            with open("{0}/{1}.geno".format(flat_files("genotype"), group_name)) as genofile:
-                i = 0
-                for line in genofile:
-                    if line[0] == "#" or line[0] == "@":
-                        output_lines.append([line.strip()])
-                    else:
-                        if limit_num and i >= limit_num:
-                            break
-                        output_lines.append(line.split())
-                        i += 1
-
-            csv_writer = csv.writer(
-                si, delimiter="\t", escapechar="\\", quoting=csv.QUOTE_NONE)
+            output_lines = geno_file_rows(
+                "{0}/{1}.geno".format(flat_files("genotype"), group_name), limit_num)
+            fmtparams = dict(
+                delimiter="\t", escapechar="\\", quoting=csv.QUOTE_NONE)
         else:
             return return_error(code=204, source=request.url_rule.rule, title="No Results", details="")
     elif file_format == "rqtl2":
@@ -872,26 +829,40 @@ def get_genotypes(group_name, file_format="csv", dataset_name=None):
         filename = group_name + ".bimbam"
 
         if os.path.isfile("{0}/{1}.geno".format(flat_files("genotype"), group_name)):
-            output_lines = []
-            with open("{0}/{1}_geno.txt".format(flat_files("genotype/bimbam"), group_name)) as genofile:
-                i = 0
-                for line in genofile:
-                    if limit_num and i >= limit_num:
-                        break
-                    output_lines.append([line.strip()
-                                         for line in line.split(",")])
-                    i += 1
-
-            csv_writer = csv.writer(si, delimiter=",")
+            output_lines = bimbam_file_rows(
+                "{0}/{1}_geno.txt".format(flat_files("genotype/bimbam"), group_name), limit_num)
+            fmtparams = dict(delimiter=",")
         else:
             return return_error(code=204, source=request.url_rule.rule, title="No Results", details="")
 
-    csv_writer.writerows(output_lines)
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=" + filename
-    output.headers["Content-type"] = "text/csv"
+    return streaming.streamed_response(
+        streaming.csv_chunks(output_lines, **fmtparams), "text/csv", filename)
+
 
-    return output
+def geno_file_rows(path, limit_num=None):
+    """Yield the lines of the .geno file at `path` split into fields, the
+    comment and header lines (starting with "#" or "@") whole, stopping after
+    `limit_num` genotype lines"""
+    with open(path) as genofile:
+        i = 0
+        for line in genofile:
+            if line[0] == "#" or line[0] == "@":
+                yield [line.strip()]
+            else:
+                if limit_num and i >= limit_num:
+                    break
+                yield line.split()
+                i += 1
+
+
+def bimbam_file_rows(path, limit_num=None):
+    """Yield the first `limit_num` lines (all of them by default) of the
+    BIMBAM genotype file at `path`, split into fields"""
+    with open(path) as genofile:
+        for (i, line) in enumerate(genofile):
+            if limit_num and i >= limit_num:
+                break
+            yield [field.strip() for field in line.split(",")]
 
 
 @app.route("/api/v_{}/gen_dropdown".format(version), methods=("GET",))
@@ -905,6 +876,20 @@ def gen_dropdown_menu():
         return return_error(code=500, source=request.url_rule.rule, title="Some error occurred", details="")
 
 
+@app.route("/api/v_{}/db_pool_metrics".format(version), methods=("GET",))
+@super_user_required
+def db_pool_metrics():
+    return flask.jsonify(pool_metrics())
+
+
+@app.route("/api/v_{}/dataset_cache_metrics".format(version), methods=("GET",))
+@super_user_required
+def dataset_cache_metrics():
+    """The hits, misses and evictions of the dataset results cache in this
+    process"""
+    return flask.jsonify(dict(DATASET_CACHE_STATS))
+
+
 def return_error(code, source, title, details):
     json_ob = {"errors": [
         {
@@ -920,10 +905,9 @@ def return_error(code, source, title, details):
 
 def get_dataset_trait_ids(dataset_name, start_vars):
 
-    if 'limit_to' in start_vars:
-        limit_string = "LIMIT " + str(start_vars['limit_to'])
-    else:
-        limit_string = ""
+    limit_string, limit_params = "", ()
+    if str(start_vars.get('limit_to', "")).isdigit():
+        limit_string, limit_params = "LIMIT %s", (int(start_vars['limit_to']),)
     with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as cursor:
         if "Geno" in dataset_name:
             data_type = "Geno"  # ZS: Need to pass back the dataset type
@@ -934,7 +918,7 @@ def get_dataset_trait_ids(dataset_name, start_vars):
                 "Geno.Id = GenoXRef.GenoId AND "
                 "GenoXRef.GenoFreezeId = GenoFreeze.Id "
                 f"AND GenoFreeze.Name = %s {limit_string}",
-            (dataset_name,))
+            (dataset_name,) + limit_params)
 
             results = cursor.fetchall()
 
@@ -954,7 +938,7 @@ def get_dataset_trait_ids(dataset_name, start_vars):
                 "PublishXRef.InbredSetId = %s AND "
                 "InbredSet.Id = PublishXRef.InbredSetId "
                 f"{limit_string}",
-                (dataset_id,)
+                (dataset_id,) + limit_params
             )
             results = cursor.fetchall()
 
@@ -974,7 +958,7 @@ def get_dataset_trait_ids(dataset_name, start_vars):
                 "ProbeSet.Id = ProbeSetXRef.ProbeSetId AND "
                 "ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
                 f"AND ProbeSetFreeze.Name = %s {limit_string}",
-                (dataset_name,)
+                (dataset_name,) + limit_params
             )
             results = cursor.fetchall()
             trait_ids = [result[0] for result in results]
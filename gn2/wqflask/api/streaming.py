@@ -0,0 +1,79 @@
+"""Streamed responses for the bulk API endpoints
+
+The responses are generated as they are sent: rows are read from a
+server-side cursor (or a file) and written out a batch at a time, so whole
+datasets are never held in memory and the first bytes go out as soon as the
+query returns its first rows."""
+
+import io
+import csv
+import zlib
+import itertools
+
+import flask
+import MySQLdb
+
+from gn2.utility.tools import get_setting
+from gn2.wqflask.database import database_connection
+
+BATCH_SIZE = 10000
+
+
+def in_batches(rows, size=None):
+    """Yield the items of `rows` in lists of (at most) `size`, by default
+    `BATCH_SIZE`"""
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size or BATCH_SIZE)):
+        yield batch
+
+
+def query_rows(query, params=None):
+    """Yield the rows of `query`, read from a server-side cursor `BATCH_SIZE`
+    rows at a time. The connection is held until the last row is read or the
+    generator is closed."""
+    with database_connection(get_setting("SQL_URI")) as conn:
+        with conn.cursor(MySQLdb.cursors.SSCursor) as cursor:
+            cursor.execute(query, params)
+            while rows := cursor.fetchmany(BATCH_SIZE):
+                yield from rows
+
+
+def csv_chunks(rows, **fmtparams):
+    """`rows` written as CSV (with the `csv.writer` options `fmtparams`), a
+    batch of rows per chunk"""
+    for batch in in_batches(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, **fmtparams).writerows(batch)
+        yield buffer.getvalue()
+
+
+def json_array_chunks(items):
+    """`items` written as one JSON array, a batch of items per chunk"""
+    yield "["
+    separator = ""
+    for batch in in_batches(items):
+        yield separator + ",".join(flask.json.dumps(item) for item in batch)
+        separator = ","
+    yield "]"
+
+
+def gzip_chunks(chunks):
+    """The text `chunks`, encoded and compressed as one gzip stream"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk.encode()):
+            yield compressed
+    yield compressor.flush()
+
+
+def streamed_response(chunks, mimetype, filename=None):
+    """A response sending `chunks` as they are generated, gzipped when the
+    client accepts it. It keeps the request context for the generator."""
+    headers = {"Vary": "Accept-Encoding"}
+    if filename:
+        headers["Content-Disposition"] = "attachment; filename=" + filename
+    if "gzip" in flask.request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return flask.Response(flask.stream_with_context(chunks),
+                          mimetype=mimetype, headers=headers)
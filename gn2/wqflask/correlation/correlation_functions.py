@@ -23,10 +23,14 @@
 # Created by GeneNetwork Core Team 2010/08/10
 
 
-from gn2.base.mrna_assay_tissue_data import MrnaAssayTissueData
+import collections
+
+import numpy as np
+
+from gn2.base.tissue_expression import tissue_matrix
+from gn2.utility.corr_result_helpers import (
+    correlations_with_vector, largest_indices)
 from gn3.computations.correlations import compute_corr_coeff_p_value
-from gn2.wqflask.database import database_connection
-from gn2.utility.tools import get_setting
 
 #####################################################################################
 # Input: primaryValue(list): one list of expression values of one probeSet,
@@ -61,8 +65,37 @@ def cal_zero_order_corr_for_tiss(primary_values, target_values, method="pearson"
 
 
 def get_trait_symbol_and_tissue_values(symbol_list=None):
-    with database_connection(get_setting("SQL_URI")) as conn:
-        tissue_data = MrnaAssayTissueData(gene_symbols=symbol_list, conn=conn)
-        if len(tissue_data.gene_symbols) > 0:
-            results = tissue_data.get_symbol_values_pairs()
-            return results
+    if symbol_list:
+        matrix = tissue_matrix()
+        return {str(symbol).lower(): values[~np.isnan(values)].tolist()
+                for (symbol, values) in (
+                    (symbol, matrix.values_for(symbol))
+                    for symbol in symbol_list)
+                if values is not None}
+
+
+def tissue_correlations(symbol, trait_symbol_dict, method="pearson",
+                        count=None):
+    """Correlate the tissue expression of the gene `symbol` with that of the
+    symbol of each trait in `trait_symbol_dict`, in one pass over the tissue
+    expression matrix. Returns the `(corr, number of tissues, p-value)` of the
+    `count` (by default, all) most strongly correlated traits, strongest first,
+    or None if `symbol` has no tissue expression."""
+    matrix = tissue_matrix()
+    primary_values = matrix.values_for(symbol)
+    if primary_values is None:
+        return None
+
+    traits = list(trait_symbol_dict)
+    rows = matrix.positions(trait_symbol_dict.values())
+    with_values = np.flatnonzero(rows >= 0)
+    (corrs, p_values, num_tissues) = correlations_with_vector(
+        np.asarray(primary_values), matrix.values[rows[with_values]], method)
+
+    kept = np.flatnonzero(~np.isnan(corrs))
+    strongest = kept[largest_indices(
+        np.abs(corrs[kept]), len(kept) if count is None else count)]
+    return collections.OrderedDict(
+        (traits[with_values[idx]],
+         (float(corrs[idx]), int(num_tissues[idx]), float(p_values[idx])))
+        for idx in strongest)
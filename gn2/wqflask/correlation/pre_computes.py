@@ -1,8 +1,10 @@
 import csv
 import json
 import os
+import time
 import hashlib
 import datetime
+import threading
 
 import lmdb
 import pickle
@@ -11,9 +13,19 @@ from pathlib import Path
 from gn2.base.data_set import query_table_timestamp
 from gn2.base.webqtlConfig import TEXTDIR
 from gn2.base.webqtlConfig import TMPDIR
+from gn2.utility.tools import get_setting, get_setting_int
+from gn2.wqflask.database import database_connection
+from gn2.wqflask.correlation.trait_matrix import MATRIX_EXT
+from gn2.wqflask.correlation.trait_matrix import TraitMatrix
+from gn2.wqflask.correlation.trait_matrix import build_trait_matrix
+from gn2.wqflask.correlation.trait_matrix import write_trait_matrix
 
 from json.decoder import JSONDecodeError
 
+# dataset id -> (number of rows of the dataset, expiry time)
+DATASET_ROW_COUNTS = {}
+
+
 def cache_trait_metadata(dataset_name, data):
 
 
@@ -84,12 +96,109 @@ def generate_filename(*args, suffix="", file_ext="json"):
 
 
 
+def matrix_manifest_path(dataset_name, text_dir=TMPDIR):
+    """path to the manifest recording how the dataset's matrix was built"""
+    return os.path.join(
+        text_dir, generate_filename(dataset_name, suffix="matrix_manifest"))
+
+
+def read_matrix_manifest(dataset_name, text_dir=TMPDIR):
+    """read the manifest of the dataset's matrix; empty if there is none"""
+    try:
+        with open(matrix_manifest_path(dataset_name, text_dir)) as file_handler:
+            return json.load(file_handler)
+    except (FileNotFoundError, JSONDecodeError):
+        return {}
+
+
+def write_matrix_manifest(dataset_name, manifest, text_dir=TMPDIR):
+    """atomically replace the manifest of the dataset's matrix"""
+    file_path = matrix_manifest_path(dataset_name, text_dir)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file_handler:
+        json.dump(manifest, file_handler)
+    os.replace(tmp_path, file_path)
+
+
+def __dataset_row_count__(conn, dataset_id):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM ProbeSetXRef WHERE ProbeSetFreezeId = %s",
+            (dataset_id,))
+        return cursor.fetchone()[0]
+
+
+def dataset_row_count(conn, dataset_id):
+    """The number of rows of the dataset, memoized in-process for
+    `TABLE_TIMESTAMP_TTL` seconds, since it is checked on every fetch of the
+    dataset's matrix"""
+    (row_count, expires) = DATASET_ROW_COUNTS.get(dataset_id, (None, 0))
+    if time.monotonic() < expires:
+        return row_count
+    row_count = __dataset_row_count__(conn, dataset_id)
+    DATASET_ROW_COUNTS[dataset_id] = (
+        row_count, time.monotonic() + get_setting_int("TABLE_TIMESTAMP_TTL"))
+    return row_count
+
+
+def text_file_is_stale(manifest, conn, dataset_id):
+    """check whether the matrix recorded in `manifest` predates the last
+    update of the ProbeSetData table, or no longer has the dataset's number
+    of rows. While the table's update time is unknown (NULL, as after a
+    server restart), only the number of rows is compared."""
+    if not (manifest and os.path.exists(manifest.get("file_path", ""))):
+        return True
+    if manifest.get("row_count") != dataset_row_count(conn, dataset_id):
+        return True
+    timestamp = query_table_timestamp("ProbeSet")
+    return (timestamp is not None and manifest.get("timestamp") is not None
+            and manifest["timestamp"] != timestamp)
+
+
+def rebuild_text_file_in_background(dataset_name, text_dir=TMPDIR,
+                                    lock_timeout=3600):
+    """Re-export the dataset in a background thread, unless some process is
+    already doing so. Returns the thread, or None if no rebuild was started.
+
+    A lock file guards against several workers exporting the same dataset;
+    locks older than `lock_timeout` seconds are assumed abandoned."""
+    lock_path = f"{matrix_manifest_path(dataset_name, text_dir)}.lock"
+    try:
+        if time.time() - os.path.getmtime(lock_path) > lock_timeout:
+            os.unlink(lock_path)
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return None
+
+    def __rebuild__():
+        try:
+            with database_connection(get_setting("SQL_URI")) as conn:
+                write_db_to_textfile(dataset_name, conn, text_dir)
+        finally:
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+
+    thread = threading.Thread(target=__rebuild__, daemon=True)
+    thread.start()
+    return thread
+
+
 def fetch_text_file(dataset_name, conn, text_dir=TMPDIR):
-    """fetch textfiles with strain vals if exists"""
+    """fetch the binary matrix or textfile with strain vals if exists
+
+    A stale or missing matrix is rebuilt in the background; the last good
+    file, if any, is returned in the meantime."""
 
-    def __file_scanner__(text_dir, target_file):
+    def __file_scanner__(text_dir, target_file, file_ext=""):
         for file in os.listdir(text_dir):
-            if file.startswith(f"ProbeSetFreezeId_{target_file}_"):
+            if (file.startswith(f"ProbeSetFreezeId_{target_file}_")
+                    and file.endswith(file_ext)):
                 return os.path.join(text_dir, file)
 
     with conn.cursor() as cursor:
@@ -97,16 +206,30 @@ def fetch_text_file(dataset_name, conn, text_dir=TMPDIR):
             'SELECT Id, FullName FROM ProbeSetFreeze WHERE Name = %s', (dataset_name,))
         results = cursor.fetchone()
     if results:
+        manifest = read_matrix_manifest(dataset_name, text_dir)
+        if text_file_is_stale(manifest, conn, results[0]):
+            rebuild_text_file_in_background(dataset_name, text_dir)
+        if os.path.exists(manifest.get("file_path", "")):
+            return manifest["file_path"]
         try:
-            # checks first for recently generated textfiles if not use gn1 datamatrix
+            # checks first for a binary matrix, then for recently generated
+            # textfiles; if neither exists use the gn1 datamatrix
 
-            return __file_scanner__(text_dir, results[0]) or __file_scanner__(TEXTDIR, results[0])
+            return (__file_scanner__(text_dir, results[0], MATRIX_EXT)
+                    or __file_scanner__(text_dir, results[0])
+                    or __file_scanner__(TEXTDIR, results[0]))
 
         except Exception:
             pass
 
 
 def read_text_file(sample_dict, file_path):
+    """Read the values of the samples in `sample_dict` from a binary trait
+    matrix or a CSV datamatrix. Returns the sample values and the target data
+    as `[trait, value, ...]` rows."""
+
+    if str(file_path).endswith(MATRIX_EXT):
+        return TraitMatrix(file_path).sample_rows(sample_dict)
 
     def __fetch_id_positions__(all_ids, target_ids):
         _vals = []
@@ -127,38 +250,32 @@ def read_text_file(sample_dict, file_path):
 
 
 def write_db_to_textfile(db_name, conn, text_dir=TMPDIR):
+    """Export the strain values of a ProbeSet dataset to a binary trait
+    matrix in `text_dir`"""
 
     def __sanitise_filename__(filename):
         ttable = str.maketrans({" ": "_", "/": "_", "\\": "_"})
         return str.translate(filename, ttable)
 
     def __generate_file_name__(db_name):
-        # todo add expiry time and checker
         with conn.cursor() as cursor:
             cursor.execute(
                 'SELECT Id, FullName FROM ProbeSetFreeze WHERE Name = %s', (db_name,))
             results = cursor.fetchone()
             if (results):
-                return __sanitise_filename__(
-                    f"ProbeSetFreezeId_{results[0]}_{results[1]}")
-
-    def __parse_to_dict__(results):
-        ids = ["ID"]
-        data = {}
-        for (trait, strain, val) in results:
-            if strain not in ids:
-                ids.append(strain)
-            if trait in data:
-                data[trait].append(val)
-            else:
-                data[trait] = [trait, val]
-        return (data, ids)
-
-    def __write_to_file__(file_path, data, col_names):
-        with open(file_path, 'w+', encoding='UTF8') as file_handler:
-            writer = csv.writer(file_handler)
-            writer.writerow(col_names)
-            writer.writerows(data.values())
+                return (results[0], __sanitise_filename__(
+                    f"ProbeSetFreezeId_{results[0]}_{results[1]}"))
+            return (None, None)
+
+    # read the timestamp before exporting, so that updates made while the
+    # export runs leave the matrix marked as stale
+    timestamp = query_table_timestamp("ProbeSet")
+    (dataset_id, file_name) = __generate_file_name__(db_name)
+    if not file_name:
+        return None
+    row_count = __dataset_row_count__(conn, dataset_id)
+    DATASET_ROW_COUNTS[dataset_id] = (
+        row_count, time.monotonic() + get_setting_int("TABLE_TIMESTAMP_TTL"))
 
     with conn.cursor() as cursor:
         cursor.execute(
@@ -171,8 +288,18 @@ def write_db_to_textfile(db_name, conn, text_dir=TMPDIR):
             "(SELECT Id FROM ProbeSetFreeze WHERE Name = %s) "
             "ORDER BY Strain.Name",
             (db_name,))
-        results = cursor.fetchall()
-        file_name = __generate_file_name__(db_name)
-        if (results and file_name):
-            __write_to_file__(os.path.join(text_dir, file_name),
-                              *__parse_to_dict__(results))
+        (traits, strains, values) = build_trait_matrix(cursor)
+
+    if not traits:
+        return None
+    file_path = write_trait_matrix(
+        os.path.join(text_dir, f"{file_name}{MATRIX_EXT}"),
+        traits, strains, values)
+    write_matrix_manifest(db_name, {
+        "file_path": file_path,
+        "timestamp": timestamp,
+        "row_count": row_count,
+        "shape": [len(traits), len(strains)],
+        "created": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }, text_dir)
+    return file_path
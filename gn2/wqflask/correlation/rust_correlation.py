@@ -3,22 +3,18 @@ import json
 from functools import reduce
 
 from gn2.utility.tools import SQL_URI
-from gn2.utility.db_tools import mescape
-from gn2.utility.db_tools import create_in_clause
-from gn2.wqflask.correlation.correlation_functions\
-    import get_trait_symbol_and_tissue_values
+from gn2.base.reference_data import strain_ids
+from gn2.wqflask.correlation.correlation_functions import tissue_correlations
 from gn2.wqflask.correlation.correlation_gn3_api import create_target_this_trait
 from gn2.wqflask.correlation.correlation_gn3_api import lit_for_trait_list
 from gn2.wqflask.correlation.correlation_gn3_api import do_lit_correlation
 from gn2.wqflask.correlation.pre_computes import fetch_text_file
 from gn2.wqflask.correlation.pre_computes import read_text_file
-from gn2.wqflask.correlation.pre_computes import write_db_to_textfile
 from gn2.wqflask.correlation.pre_computes import read_trait_metadata
 from gn2.wqflask.correlation.pre_computes import cache_trait_metadata
 from gn3.computations.correlations import compute_all_lit_correlation
 from gn3.computations.rust_correlation import run_correlation
 from gn3.computations.rust_correlation import get_sample_corr_data
-from gn3.computations.rust_correlation import parse_tissue_corr_data
 from gn3.db_utils import database_connection
 
 from gn2.wqflask.correlation.exceptions import WrongCorrelationType
@@ -130,17 +126,8 @@ def compute_top_n_sample(start_vars, dataset, trait_list):
             sample_data=json.loads(samples_vals),
             dataset_samples=dataset.group.all_samples_ordered())
 
-        with database_connection(SQL_URI) as conn:
-            with conn.cursor() as curr:
-                curr.execute(
-                    """
-                    SELECT Strain.Name, Strain.Id FROM Strain, Species
-                    WHERE Strain.Name IN {}
-                    and Strain.SpeciesId=Species.Id
-                    and Species.name = '{}'
-                    """.format(create_in_clause(list(sample_data.keys())),
-                               *mescape(dataset.group.species)))
-                return (sample_data, dict(curr.fetchall()))
+        return (sample_data,
+                strain_ids(dataset.group.species, list(sample_data.keys())))
 
     (sample_data, sample_ids) = __fetch_sample_ids__(
         start_vars["sample_vals"], start_vars["corr_samples_group"])
@@ -206,20 +193,7 @@ def compute_top_n_tissue(target_dataset, this_trait, traits, method):
         in target_dataset.retrieve_genes("Symbol").items()
         if traits.get(trait_name)})
 
-    corr_result_tissue_vals_dict = get_trait_symbol_and_tissue_values(
-        symbol_list=list(trait_symbol_dict.values()))
-
-    data = parse_tissue_corr_data(symbol_name=this_trait.symbol,
-                                  symbol_dict=get_trait_symbol_and_tissue_values(
-                                      symbol_list=[this_trait.symbol]),
-                                  dataset_symbols=trait_symbol_dict,
-                                  dataset_vals=corr_result_tissue_vals_dict)
-
-    if data and data[0]:
-        return run_correlation(
-            data[1], data[0], method, ",", "tissue")
-
-    return {}
+    return __tissue_corr_results__(this_trait, trait_symbol_dict, method)
 
 
 def merge_results(dict_a: dict, dict_b: dict, dict_c: dict) -> list[dict]:
@@ -266,15 +240,8 @@ def __compute_sample_corr__(
 
                 return run_correlation(target_data, sample_vals,
                                        method, ",", corr_type, n_top)
-
-            write_db_to_textfile(target_dataset.name, conn)
-            file_path = fetch_text_file(target_dataset.name, conn)
-            if file_path:
-                (sample_vals, target_data) = read_text_file(
-                    sample_data, file_path)
-
-                return run_correlation(target_data, sample_vals,
-                                       method, ",", corr_type, n_top)
+            # no pre-computed file yet: one is being built in the
+            # background, so query the database directly this time
 
     target_dataset.get_trait_data(list(sample_data.keys()))
 
@@ -302,6 +269,18 @@ def __datasets_compatible_p__(trait_dataset, target_dataset, corr_method):
              target_dataset.type in ("Publish", "Geno")))
 
 
+def __tissue_corr_results__(this_trait, trait_symbol_dict, method, n_top=500):
+    """The tissue correlations of `this_trait` with the traits of
+    `trait_symbol_dict`, strongest first, in the form of `run_correlation`'s
+    results"""
+    results = tissue_correlations(
+        this_trait.symbol, trait_symbol_dict, method, n_top)
+    return {
+        trait_name: {"tissue_corr": corr, "tissue_number": num_tissues,
+                     "tissue_p_val": p_value}
+        for (trait_name, (corr, num_tissues, p_value)) in (results or {}).items()}
+
+
 def __compute_tissue_corr__(
         start_vars: dict, corr_type: str, method: str, n_top: int,
         target_trait_info: tuple):
@@ -310,20 +289,8 @@ def __compute_tissue_corr__(
     if not __datasets_compatible_p__(this_dataset, target_dataset, corr_type):
         raise WrongCorrelationType(this_trait, target_dataset, corr_type)
 
-    trait_symbol_dict = target_dataset.retrieve_genes("Symbol")
-    corr_result_tissue_vals_dict = get_trait_symbol_and_tissue_values(
-        symbol_list=list(trait_symbol_dict.values()))
-
-    data = parse_tissue_corr_data(
-        symbol_name=this_trait.symbol,
-        symbol_dict=get_trait_symbol_and_tissue_values(
-            symbol_list=[this_trait.symbol]),
-        dataset_symbols=trait_symbol_dict,
-        dataset_vals=corr_result_tissue_vals_dict)
-
-    if data:
-        return run_correlation(data[1], data[0], method, ",", "tissue")
-    return {}
+    return __tissue_corr_results__(
+        this_trait, target_dataset.retrieve_genes("Symbol"), method, n_top)
 
 
 def __compute_lit_corr__(
@@ -22,7 +22,7 @@ import hashlib
 import html
 import json
 
-from gn2.base.trait import create_trait, jsonable
+from gn2.base.trait import create_trait, create_traits, jsonable
 from gn2.base.data_set import create_dataset
 
 from gn2.utility import hmac
@@ -179,15 +179,10 @@ def get_user_filters(start_vars):
 
 
 def generate_table_metadata(all_traits, dataset_metadata, dataset_obj):
-
-    def __fetch_trait_data__(trait, dataset_obj):
-        target_trait_ob = create_trait(dataset=dataset_obj,
-                                       name=trait,
-                                       get_qtl_info=True)
-        return jsonable(target_trait_ob, dataset_obj)
-
-    metadata = [__fetch_trait_data__(trait, dataset_obj) for
-                trait in (all_traits)]
+    target_traits = create_traits(dataset_obj, list(all_traits),
+                                  get_qtl_info=True)
+    metadata = [jsonable(trait, dataset_obj)
+                for trait in target_traits.values()]
 
     return (dataset_metadata | ({str(trait["name"]): trait for trait in metadata}))
 
@@ -198,6 +193,9 @@ def populate_table(dataset_metadata, target_dataset, this_dataset, corr_results,
 
         trait_name = list(trait.keys())[0]
         target_trait = dataset_metadata.get(trait_name)
+        if target_trait is None:
+            # Not in the database, or not accessible to the user
+            return None
         trait = trait[trait_name]
         if not apply_filters(trait, target_trait, target_dataset, **filters):
             results_dict = {}
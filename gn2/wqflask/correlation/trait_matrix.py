@@ -0,0 +1,82 @@
+"""Binary, memory-mapped trait matrices for the correlation pre-computes
+
+A matrix file holds the values of every trait in a dataset, laid out strain by
+strain so that the values for a selection of samples are contiguous and can be
+sliced straight off the memory map, without parsing any text.
+
+The files are written with `gn2.utility.arrays.write_array_file`; the header
+carries the strain names (the row index) and the trait names (the column
+index) of the single strains x traits values array.
+"""
+import numpy as np
+
+from gn2.utility.arrays import nan_to_none
+from gn2.utility.arrays import read_array_file
+from gn2.utility.arrays import write_array_file
+
+MAGIC = b"GN2TMAT1"
+MATRIX_EXT = ".tmat"
+
+
+def build_trait_matrix(rows):
+    """Pivot `(trait, strain, value)` rows into a traits x strains array.
+
+    Traits and strains keep the order in which they are first seen; cells with
+    no value are NaN."""
+    trait_index, strain_index, cells = {}, {}, []
+    for (trait, strain, value) in rows:
+        cells.append((trait_index.setdefault(trait, len(trait_index)),
+                      strain_index.setdefault(strain, len(strain_index)),
+                      value))
+
+    values = np.full((len(trait_index), len(strain_index)), np.nan)
+    if cells:
+        (trait_ids, strain_ids, vals) = zip(*cells)
+        values[list(trait_ids), list(strain_ids)] = np.array(vals, dtype=float)
+    return (list(trait_index), list(strain_index), values)
+
+
+def write_trait_matrix(file_path, traits, strains, values, dtype=np.float32):
+    """Write a traits x strains `values` array to `file_path`."""
+    return write_array_file(
+        file_path, MAGIC, {"strains": list(strains), "traits": list(traits)},
+        [np.asarray(values, dtype=dtype).T])
+
+
+class TraitMatrix:
+    """A read-only view of a trait matrix file"""
+
+    def __init__(self, file_path):
+        (header, (self.values,)) = read_array_file(file_path, MAGIC)
+        self.file_path = file_path
+        self.strains = header["strains"]
+        self.traits = header["traits"]
+        self.strain_index = {
+            strain: idx for (idx, strain) in enumerate(self.strains)}
+        self.trait_index = {
+            trait: idx for (idx, trait) in enumerate(self.traits)}
+
+    def sample_positions(self, sample_dict):
+        """Return the row positions and values of the samples in
+        `sample_dict`, in the order the strains appear in the matrix."""
+        positions, sample_vals = [], []
+        for (idx, strain) in enumerate(self.strains):
+            if strain in sample_dict:
+                positions.append(idx)
+                sample_vals.append(sample_dict[strain])
+        return (positions, sample_vals)
+
+    def sample_values(self, sample_dict):
+        """Return the sample values and a traits x samples array holding only
+        the columns for the samples in `sample_dict`."""
+        (positions, sample_vals) = self.sample_positions(sample_dict)
+        return (sample_vals, self.values[positions].T)
+
+    def sample_rows(self, sample_dict):
+        """Like `sample_values`, but return the target data as
+        `[trait, value, ...]` rows, with `None` for missing values, which is
+        what the rust correlation expects."""
+        (sample_vals, values) = self.sample_values(sample_dict)
+        return (sample_vals,
+                [[trait] + row
+                 for (trait, row) in zip(self.traits, nan_to_none(values))])
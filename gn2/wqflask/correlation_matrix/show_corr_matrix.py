@@ -28,8 +28,9 @@ from gn2.base.data_set import create_dataset
 from gn2.base.webqtlConfig import GENERATED_TEXT_DIR
 
 
+from gn2.utility.arrays import nan_to_none
+from gn2.utility.corr_result_helpers import correlation_p_values
 from gn2.utility.helper_functions import get_trait_db_obs
-from gn2.utility.corr_result_helpers import normalize_values
 from gn2.utility.redis_tools import get_redis_conn
 
 
@@ -48,7 +49,6 @@ class CorrelationMatrix:
 
         get_trait_db_obs(self, trait_db_list)
 
-        self.all_sample_list = []
         self.traits = []
         self.do_PCA = True
         # ZS: Getting initial group name before verifying all traits are in the same group in the following loop
@@ -57,27 +57,32 @@ class CorrelationMatrix:
             this_group = trait_db[1].group.name
             this_trait = trait_db[0]
             self.traits.append(this_trait)
-            this_sample_data = this_trait.data
-
-            for sample in this_sample_data:
-                if sample not in self.all_sample_list:
-                    self.all_sample_list.append(sample)
-
-        self.sample_data = []
-        for trait_db in self.trait_list:
-            this_trait = trait_db[0]
-            this_sample_data = this_trait.data
-
-            this_trait_vals = []
-            for sample in self.all_sample_list:
-                if sample in this_sample_data:
-                    this_trait_vals.append(this_sample_data[sample].value)
-                else:
-                    this_trait_vals.append('')
-            self.sample_data.append(this_trait_vals)
+        self.all_sample_list = list(dict.fromkeys(
+            sample for this_trait in self.traits for sample in this_trait.data))
+
+        # The values of all the traits, with NaN for missing values, and for
+        # each trait which samples it has and which are in its group
+        values = np.array([this_trait.data.values_for(self.all_sample_list)
+                           for this_trait in self.traits])
+        in_data = np.array([
+            this_trait.data.positions(self.all_sample_list) >= 0
+            for this_trait in self.traits])
+        in_group = np.zeros(values.shape, dtype=bool)
+        sample_index = {sample: idx
+                        for (idx, sample) in enumerate(self.all_sample_list)}
+        for (row, (this_trait, this_db)) in enumerate(self.trait_list):
+            for sample in this_db.group.all_samples_ordered():
+                if sample in sample_index:
+                    in_group[row, sample_index[sample]] = True
+
+        self.sample_data = [
+            [value if present else ''
+             for (value, present) in zip(trait_values, trait_in_data)]
+            for (trait_values, trait_in_data)
+            in zip(nan_to_none(values), in_data.tolist())]
 
         # Shouldn't do PCA if there are more traits than observations/samples
-        if len(this_trait_vals) < len(self.trait_list) or len(self.trait_list) < 3:
+        if len(self.all_sample_list) < len(self.trait_list) or len(self.trait_list) < 3:
             self.do_PCA = False
 
         # ZS: Variable set to the lowest overlapping samples in order to notify user, or 8, whichever is lower (since 8 is when we want to display warning)
@@ -86,60 +91,37 @@ class CorrelationMatrix:
         self.corr_results = []
         self.pca_corr_results = []
         self.scree_data = []
-        self.shared_samples_list = self.all_sample_list
-        for trait_db in self.trait_list:
-            this_trait = trait_db[0]
-            this_db = trait_db[1]
 
-            this_db_samples = this_db.group.all_samples_ordered()
-            this_sample_data = this_trait.data
-
-            corr_result_row = []
-            pca_corr_result_row = []
-            is_spearman = False  # ZS: To determine if it's above or below the diagonal
-            for target in self.trait_list:
-                target_trait = target[0]
-                target_db = target[1]
-                target_samples = target_db.group.all_samples_ordered()
-                target_sample_data = target_trait.data
-
-                this_trait_vals = []
-                target_vals = []
-                for index, sample in enumerate(target_samples):
-                    if (sample in this_sample_data) and (sample in target_sample_data):
-                        sample_value = this_sample_data[sample].value
-                        target_sample_value = target_sample_data[sample].value
-                        this_trait_vals.append(sample_value)
-                        target_vals.append(target_sample_value)
-                    else:
-                        if sample in self.shared_samples_list:
-                            self.shared_samples_list.remove(sample)
-
-                this_trait_vals, target_vals, num_overlap = normalize_values(
-                    this_trait_vals, target_vals)
-
-                if num_overlap < self.lowest_overlap:
-                    self.lowest_overlap = num_overlap
-                if num_overlap < 2:
-                    corr_result_row.append([target_trait, 0, num_overlap])
-                    pca_corr_result_row.append(0)
-                else:
-                    pearson_r, pearson_p = scipy.stats.pearsonr(
-                        this_trait_vals, target_vals)
-                    if is_spearman == False:
-                        sample_r, sample_p = pearson_r, pearson_p
-                        if sample_r > 0.999:
-                            is_spearman = True
-                    else:
-                        sample_r, sample_p = scipy.stats.spearmanr(
-                            this_trait_vals, target_vals)
-
-                    corr_result_row.append(
-                        [target_trait, sample_r, num_overlap])
-                    pca_corr_result_row.append(pearson_r)
-
-            self.corr_results.append(corr_result_row)
-            self.pca_corr_results.append(pca_corr_result_row)
+        # Samples in some trait's group but missing from another trait
+        not_shared = (~in_data).any(axis=0) & in_group.any(axis=0)
+        self.shared_samples_list = self.all_sample_list
+        self.shared_samples_list[:] = [
+            sample for (sample, dropped)
+            in zip(self.all_sample_list, not_shared) if not dropped]
+
+        pearson_r, _pearson_p, num_overlap = pearson_correlations(
+            values, in_group)
+        computed = num_overlap >= 2
+        # ZS: Spearman is shown above the diagonal: each row switches to it
+        # after its first coefficient over 0.999, the trait with itself
+        switch = computed & (pearson_r > 0.999)
+        use_spearman = computed & ((np.cumsum(switch, axis=1) - switch) > 0)
+        spearman_r, _spearman_p = spearman_correlations(
+            values, in_group, use_spearman)
+        sample_r = np.where(use_spearman, spearman_r, pearson_r)
+
+        if len(self.trait_list) > 0:
+            self.lowest_overlap = min(
+                self.lowest_overlap, int(num_overlap.min()))
+        for (row, _trait_db) in enumerate(self.trait_list):
+            self.corr_results.append([
+                [target[0],
+                 float(sample_r[row, col]) if computed[row, col] else 0,
+                 int(num_overlap[row, col])]
+                for (col, target) in enumerate(self.trait_list)])
+            self.pca_corr_results.append([
+                float(pearson_r[row, col]) if computed[row, col] else 0
+                for col in range(len(self.trait_list))])
 
         self.export_filename, self.export_filepath = export_corr_matrix(
             self.corr_results)
@@ -220,6 +202,119 @@ class CorrelationMatrix:
         return pca
 
 
+def pearson_correlations(values, target_masks):
+    """
+    Pairwise-complete Pearson correlations between the rows of `values`, a
+    traits × samples array with NaN for missing values. Each pair of traits is
+    correlated on the samples that both have values for, amongst the samples
+    in the second trait's row of `target_masks`.
+
+    Returns the coefficients, p-values and numbers of samples, as traits ×
+    traits arrays. Coefficients of pairs with constant values are NaN.
+    """
+    present = ~np.isnan(values)
+    in_target = (present & target_masks).astype(float)
+    with np.errstate(invalid="ignore"):
+        # Centring first keeps the sums below from losing precision
+        means = np.nanmean(np.where(present, values, np.nan), axis=1)
+    centred = np.where(present, values - np.nan_to_num(means)[:, None], 0.0)
+    target_centred = centred * in_target
+
+    counts = present.astype(float) @ in_target.T
+    sum_x = centred @ in_target.T
+    sum_y = present.astype(float) @ target_centred.T
+    sum_xx = (centred ** 2) @ in_target.T
+    sum_yy = present.astype(float) @ (target_centred ** 2).T
+    sum_xy = centred @ target_centred.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = sum_xx - sum_x ** 2 / counts
+        var_y = sum_yy - sum_y ** 2 / counts
+        # Within rounding of zero, the values are constant
+        var_x[var_x <= sum_xx * 1e-12] = 0.0
+        var_y[var_y <= sum_yy * 1e-12] = 0.0
+        coefficients = np.clip(
+            (sum_xy - sum_x * sum_y / counts) / np.sqrt(var_x * var_y),
+            -1.0, 1.0)
+    counts = counts.astype(int)
+    coefficients[(counts < 2) | (var_x * var_y == 0)] = np.nan
+    return coefficients, correlation_p_values(coefficients, counts), counts
+
+
+def __rank_counts__(values, masks):
+    """
+    For each row of `values`: how much each sample counts towards the rank of
+    each other, 1 if its value is lower and 0.5 if equal, for the samples in
+    the row of `masks`. Counts of halves are exact in single precision, which
+    is faster to multiply.
+    """
+    return ((values[:, None, :] < values[:, :, None])
+            + np.float32(0.5) * (values[:, None, :] == values[:, :, None])
+            ).astype(np.float32) * masks[:, None, :]
+
+
+def spearman_correlations(values, target_masks, pairs, chunk_size=None):
+    """
+    Pairwise-complete Spearman correlations, as in `pearson_correlations`,
+    for the pairs of traits in the traits × traits mask `pairs`; the others
+    are NaN.
+
+    Values are ranked on the samples each pair shares: the rank of a value is
+    how many of those samples have lower values, counting equal ones by half.
+    These counts are products of each trait's comparisons of its values with
+    the masks of the other traits, taken for `chunk_size` × `chunk_size`
+    pairs of traits at a time.
+    """
+    (num_traits, num_samples) = values.shape
+    present = ~np.isnan(values)
+    in_target = present & target_masks
+    filled = np.where(present, values, 0.0)
+    if chunk_size is None:
+        chunk_size = max(1, min(64, 2**24 // max(1, num_samples ** 2)))
+
+    coefficients = np.full(pairs.shape, np.nan)
+    counts = np.zeros(pairs.shape, dtype=int)
+    chunks = [np.arange(start, min(start + chunk_size, num_traits))
+              for start in range(0, num_traits, chunk_size)]
+    for cols in chunks:
+        col_counts = None
+        for rows in chunks:
+            if not pairs[np.ix_(rows, cols)].any():
+                continue
+            if col_counts is None:
+                col_counts = __rank_counts__(filled[cols], in_target[cols])
+            row_counts = __rank_counts__(filled[rows], present[rows])
+
+            # shared[i, s, j]: whether sample s is used for the pair (i, j)
+            shared = present[rows, :, None] & in_target[cols].T[None]
+            row_ranks = (row_counts.reshape(-1, num_samples)
+                         @ in_target[cols].T.astype(np.float32)).reshape(
+                             len(rows), num_samples, len(cols))
+            col_ranks = (col_counts.reshape(-1, num_samples)
+                         @ present[rows].T.astype(np.float32)).reshape(
+                             len(cols), num_samples, len(rows)
+                         ).transpose(2, 1, 0)
+            row_ranks = np.where(shared, row_ranks + 0.5, 0.0)
+            col_ranks = np.where(shared, col_ranks + 0.5, 0.0)
+
+            num_shared = shared.sum(axis=1)
+            centre = num_shared * ((num_shared + 1) / 2.0) ** 2
+            with np.errstate(divide="ignore", invalid="ignore"):
+                chunk_coefficients = np.clip(
+                    (np.einsum("isj,isj->ij", row_ranks, col_ranks) - centre)
+                    / np.sqrt(
+                        (np.einsum("isj,isj->ij", row_ranks, row_ranks)
+                         - centre)
+                        * (np.einsum("isj,isj->ij", col_ranks, col_ranks)
+                           - centre)),
+                    -1.0, 1.0)
+            chunk_coefficients[num_shared < 2] = np.nan
+            coefficients[np.ix_(rows, cols)] = chunk_coefficients
+            counts[np.ix_(rows, cols)] = num_shared
+
+    coefficients[~pairs] = np.nan
+    return coefficients, correlation_p_values(coefficients, counts)
+
+
 def export_corr_matrix(corr_results):
     corr_matrix_filename = "corr_matrix_" + \
         ''.join(random.choice(string.ascii_uppercase + string.digits)
@@ -1,3 +1,4 @@
+import math
 import requests
 import itertools
 
@@ -71,11 +72,13 @@ def parse_phenotype_data(trait_list, dataset, individuals):
             ts = trait.split(':')
             gt = create_trait(name=ts[0], dataset_name=ts[1])
             gt = retrieve_sample_data(gt, dataset, individuals)
-            for ind in individuals:
-                if ind in list(gt.data.keys()):
-                    traits.append(gt.data[ind].value)
-                else:
+            positions = gt.data.positions(individuals)
+            values = gt.data.values_for(individuals).tolist()
+            for (position, value) in zip(positions, values):
+                if position < 0:
                     traits.append("-999")
+                else:
+                    traits.append(None if math.isnan(value) else value)
 
     return {
         "trait_db_list": trait_list,
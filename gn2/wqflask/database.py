@@ -1,13 +1,18 @@
 # Module to initialize sqlalchemy with flask
 import os
 import sys
+import time
 import logging
+import threading
+import collections
 import traceback
 from typing import Tuple, Protocol, Any, Iterator
 from urllib.parse import urlparse
 import importlib
 import contextlib
 
+from flask import g, has_request_context
+
 #: type: ignore
 import MySQLdb
 
@@ -27,6 +32,206 @@ def parse_db_url(sql_uri: str) -> Tuple:
         parsed_db.path[1:], parsed_db.port)
 
 
+class PoolTimeout(Exception):
+    """Raised when no pooled connection is free in time"""
+
+    def __init__(self, timeout: float):
+        """Initialise the exception object."""
+        super().__init__(
+            f"No database connection became free within {timeout} seconds.")
+
+
+class ConnectionPool:
+    """A bounded pool of connections to one database, shared by the threads
+    of a process.
+
+    At most `max_size` connections are open at once; a checkout waits up to
+    `timeout` seconds for one to be returned. Connections are closed once they
+    are `max_lifetime` seconds old, and are pinged before reuse if they have
+    been idle for more than `ping_after` seconds. A process forked from the
+    one that opened the connections starts with an empty pool."""
+
+    def __init__(self, connect, max_size: int, timeout: float,
+                 max_lifetime: float, ping_after: float):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.condition = threading.Condition()
+        self.idle = collections.deque()  # (connection, last returned)
+        self.opened = {}  # id(connection) -> time it was opened
+        self.size = 0  # connections open, idle or checked out
+        self.metrics = collections.Counter()
+        self.pid = os.getpid()
+        # Connections inherited across a fork share their sockets with the
+        # parent; they are kept referenced so they are never closed here
+        self.inherited = []
+
+    def __check_fork__(self):
+        if self.pid != os.getpid():
+            self.inherited.extend(connection for (connection, _) in self.idle)
+            self.idle.clear()
+            self.opened.clear()
+            self.size = 0
+            self.pid = os.getpid()
+
+    def __expired__(self, connection) -> bool:
+        return (time.monotonic() - self.opened.get(id(connection), 0)
+                > self.max_lifetime)
+
+    def __alive__(self, connection) -> bool:
+        try:
+            connection.ping()
+            return True
+        except MySQLdb.Error:
+            return False
+
+    def __close__(self, connection):
+        self.opened.pop(id(connection), None)
+        try:
+            connection.close()
+        except MySQLdb.Error:
+            pass
+        self.metrics["connections_closed"] += 1
+
+    def checkout(self):
+        """Take a connection from the pool, opening one if there is room"""
+        started = time.monotonic()
+        with self.condition:
+            self.__check_fork__()
+            while not self.idle and self.size >= self.max_size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.metrics["timeouts"] += 1
+                    raise PoolTimeout(self.timeout)
+                self.condition.wait(remaining)
+            waited = time.monotonic() - started
+            self.metrics["checkouts"] += 1
+            self.metrics["wait_time"] += waited
+            if waited > 0.001:
+                self.metrics["waits"] += 1
+
+            while self.idle:
+                (connection, returned) = self.idle.pop()
+                if not self.__expired__(connection) and (
+                        time.monotonic() - returned <= self.ping_after or
+                        self.__alive__(connection)):
+                    return connection
+                self.__close__(connection)
+                self.size -= 1
+            self.size += 1
+
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened[id(connection)] = time.monotonic()
+            self.metrics["connections_created"] += 1
+        return connection
+
+    def checkin(self, connection, discard: bool = False):
+        """Return `connection` to the pool; it is closed instead if `discard`
+        is set or it has reached its maximum lifetime"""
+        with self.condition:
+            if id(connection) not in self.opened:
+                # Opened before a fork, or already closed
+                return
+            if discard or self.__expired__(connection):
+                self.__close__(connection)
+                self.size -= 1
+            else:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def stats(self) -> dict:
+        """The pool's counters, with its current size"""
+        with self.condition:
+            return {**self.metrics,
+                    "wait_time": round(self.metrics["wait_time"], 6),
+                    "max_size": self.max_size,
+                    "open": self.size,
+                    "idle": len(self.idle),
+                    "in_use": self.size - len(self.idle)}
+
+
+# sql_uri -> ConnectionPool
+__POOLS__ = {}
+__POOLS_LOCK__ = threading.Lock()
+
+
+def __connect__(sql_uri: str):
+    host, user, passwd, db_name, port = parse_db_url(sql_uri)
+    return MySQLdb.connect(
+        db=db_name, user=user, passwd=passwd or '', host=host,
+        port=(port or 3306), autocommit=False  # Required for roll-backs
+    )
+
+
+def connection_pool(sql_uri: str):
+    """The connection pool for `sql_uri`, or None if pooling is disabled
+    (DB_POOL_SIZE = 0)"""
+    with __POOLS_LOCK__:
+        if sql_uri not in __POOLS__:
+            # Imported here to avoid a circular import
+            from gn2.utility.tools import get_setting_int
+            max_size = get_setting_int("DB_POOL_SIZE")
+            __POOLS__[sql_uri] = max_size and ConnectionPool(
+                lambda: __connect__(sql_uri), max_size,
+                timeout=get_setting_int("DB_POOL_TIMEOUT"),
+                max_lifetime=get_setting_int("DB_POOL_MAX_LIFETIME"),
+                ping_after=get_setting_int("DB_POOL_PING_AFTER"))
+        return __POOLS__[sql_uri] or None
+
+
+def pool_metrics() -> dict:
+    """The metrics of each connection pool in this process, by database"""
+    with __POOLS_LOCK__:
+        pools = [(sql_uri, pool) for (sql_uri, pool) in __POOLS__.items()
+                 if pool]
+    return {parse_db_url(sql_uri)[3]: pool.stats() for (sql_uri, pool) in pools}
+
+
+def __checkout__(sql_uri: str):
+    pool = connection_pool(sql_uri)
+    return pool.checkout() if pool else __connect__(sql_uri)
+
+
+def __checkin__(sql_uri: str, connection, discard: bool = False):
+    pool = connection_pool(sql_uri)
+    if pool:
+        pool.checkin(connection, discard)
+    else:
+        connection.close()
+
+
+def __request_scoped__() -> bool:
+    # Imported here to avoid a circular import
+    from gn2.utility.tools import get_setting_bool
+    return has_request_context() and get_setting_bool(
+        "DB_REQUEST_SCOPED_CONNECTION")
+
+
+def __request_connection__(sql_uri: str):
+    """The connection to `sql_uri` for the current request, checked out on
+    first use and returned by `release_request_connections`"""
+    connections = g.setdefault("db_connections", {})
+    if sql_uri not in connections:
+        connections[sql_uri] = [__checkout__(sql_uri), False]
+    return connections[sql_uri]
+
+
+def release_request_connections(_exc=None):
+    """Return the current request's connections to their pools; registered
+    as a teardown function of the app"""
+    for (sql_uri, (connection, broken)) in g.pop("db_connections", {}).items():
+        __checkin__(sql_uri, connection, discard=broken)
+
+
 @contextlib.contextmanager
 def database_connection(sql_uri: str) -> Iterator[Connection]:
     """Provide a context manager for opening, closing, and rolling
@@ -34,19 +239,30 @@ def database_connection(sql_uri: str) -> Iterator[Connection]:
     and if the table supports transactions, the connection will be
     rolled back.
 
+    Connections come from a per-process pool (see `ConnectionPool`) and go
+    back to it when the block exits. With DB_REQUEST_SCOPED_CONNECTION set,
+    every block within a request shares one connection, which is returned
+    when the request ends.
+
     """
-    host, user, passwd, db_name, port = parse_db_url(sql_uri)
-    connection = MySQLdb.connect(
-        db=db_name, user=user, passwd=passwd or '', host=host,
-        port=(port or 3306), autocommit=False  # Required for roll-backs
-    )
+    request_connection = (
+        __request_connection__(sql_uri) if __request_scoped__() else None)
+    connection = (request_connection[0] if request_connection
+                  else __checkout__(sql_uri))
+    broken = False
     try:
         yield connection
         connection.commit()
     except Exception as _exc:
         logging.error("===== Query Error =====\r\n%s\r\n===== END: Query Error",
                       traceback.format_exc())
-        connection.rollback()
+        try:
+            connection.rollback()
+        except MySQLdb.Error:
+            broken = True
         raise _exc
     finally:
-        connection.close()
+        if request_connection:
+            request_connection[1] = request_connection[1] or broken
+        else:
+            __checkin__(sql_uri, connection, discard=broken)
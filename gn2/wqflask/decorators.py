@@ -55,6 +55,16 @@ def edit_admins_access_required(f):
         return f(*args, **kwargs)
     return wrap
 
+def super_user_required(f):
+    """Use this for endpoints only the site's super-users may access"""
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        from gn2.utility.authentication_tools import is_super_user
+        if not is_super_user(g.user_session.user_id):
+            return redirect(url_for("no_access_page"))
+        return f(*args, **kwargs)
+    return wrap
+
 class AuthorisationError(Exception):
     """Raise when there is an authorisation issue."""
     def __init__(self, description, user):
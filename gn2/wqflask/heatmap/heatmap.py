@@ -1,23 +1,28 @@
-import string
 import os
+import uuid
+import string
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from gn2.base import species
 from gn2.base import webqtlConfig
+from gn2.jobs.tools import run_tool, ToolError
 from gn2.utility import helper_functions
+from gn2.utility.arrays import file_stamp
+from gn2.wqflask.marker_regression import mapping_cache
 
-from gn2.utility.tools import flat_files, REAPER_COMMAND, TEMPDIR
+from gn2.utility.tools import flat_files, get_setting_int, REAPER_COMMAND, TEMPDIR
 from redis import Redis
 from flask import Flask, g
 
-from gn2.wqflask.database import database_connection
-from gn2.utility.tools import get_setting
 
 Redis = Redis()
 
+HEATMAP_PERMUTATIONS = 1000
+
 
 class Heatmap:
 
-    def __init__(self, db_cursor, start_vars, temp_uuid):
+    def __init__(self, db_cursor, start_vars, temp_uuid, progress=None):
         trait_db_list = [trait.strip()
                          for trait in start_vars['trait_list'].split(',')]
         helper_functions.get_trait_db_obs(self, trait_db_list)
@@ -31,13 +36,9 @@ class Heatmap:
         self.all_sample_list = []
         self.traits = []
 
-        chrnames = []
         self.species = species.TheSpecies(dataset=self.trait_list[0][1])
-
-        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as db_cursor:
-            for this_chr in self.species.chromosomes.chromosomes(db_cursor):
-                chrnames.append([self.species.chromosomes.chromosomes(db_cursor)[this_chr].name,
-                                self.species.chromosomes.chromosomes(db_cursor)[this_chr].mb_length])
+        chrnames = [[chromosome.name, chromosome.mb_length] for chromosome
+                    in self.species.chromosomes.chromosomes().values()]
 
         for trait_db in self.trait_list:
 
@@ -62,7 +63,7 @@ class Heatmap:
                     this_trait_vals.append('')
             self.sample_data.append(this_trait_vals)
 
-        self.gen_reaper_results()
+        self.gen_reaper_results(progress)
 
         lodnames = []
         chr_pos = []
@@ -91,56 +92,91 @@ class Heatmap:
             json_data=self.json_data
         )
 
-    def gen_reaper_results(self):
-        self.trait_results = {}
-        for trait_db in self.trait_list:
-            self.dataset.group.get_markers()
-            this_trait = trait_db[0]
-
-            genotype = self.dataset.group.read_genotype_file(use_reaper=False)
-            samples, values, variances, sample_aliases = this_trait.export_informative()
-
-            if self.dataset.group.genofile != None:
-                genofile_name = self.dataset.group.genofile[:-5]
-            else:
-                genofile_name = self.dataset.group.name
+    def gen_reaper_results(self, progress=None):
+        """Scan each trait with qtlreaper, running up to `REAPER_MAX_JOBS`
+        scans at once and reusing the cached scans of traits mapped before.
+        `progress`, if given, is called with the number of traits done and
+        the number of traits after each one finishes."""
+        if self.dataset.group.genofile != None:
+            genofile_name = self.dataset.group.genofile[:-5]
+        else:
+            genofile_name = self.dataset.group.name
+        samplelist = set(self.dataset.group.samplelist)
+
+        traits = [trait_db[0] for trait_db in self.trait_list]
+        with ThreadPoolExecutor(max_workers=max(1, min(
+                len(traits), get_setting_int("REAPER_MAX_JOBS")))) as executor:
+            pending = [executor.submit(
+                scan_trait, this_trait, self.dataset, genofile_name, samplelist)
+                       for this_trait in traits]
+            for (done, _future) in enumerate(as_completed(pending), start=1):
+                if progress is not None:
+                    progress(done, len(pending))
 
-            trimmed_samples = []
-            trimmed_values = []
-            for i in range(0, len(samples)):
-                if samples[i] in self.dataset.group.samplelist:
-                    trimmed_samples.append(str(samples[i]))
-                    trimmed_values.append(values[i])
-
-            trait_filename = str(this_trait.name) + "_" + \
-                str(self.dataset.name) + "_pheno"
-            gen_pheno_txt_file(trimmed_samples, trimmed_values, trait_filename)
-
-            output_filename = self.dataset.group.name + "_GWA_" + \
-                ''.join(random.choice(string.ascii_uppercase + string.digits)
-                        for _ in range(6))
-
-            reaper_command = REAPER_COMMAND + ' --geno {0}/{1}.geno --traits {2}/gn2/{3}.txt -n 1000 -o {4}{5}.txt'.format(flat_files('genotype'),
-                                                                                                                           genofile_name,
-                                                                                                                           TEMPDIR,
-                                                                                                                           trait_filename,
-                                                                                                                           webqtlConfig.GENERATED_IMAGE_DIR,
-                                                                                                                           output_filename)
-
-            os.system(reaper_command)
-
-            reaper_results = parse_reaper_output(output_filename)
-
-            lrs_values = [float(qtl['lrs_value']) for qtl in reaper_results]
-
-            self.trait_results[this_trait.name] = []
-            for qtl in reaper_results:
-                if qtl['additive'] > 0:
-                    self.trait_results[this_trait.name].append(
-                        -float(qtl['lrs_value']))
-                else:
-                    self.trait_results[this_trait.name].append(
-                        float(qtl['lrs_value']))
+        self.trait_results = {}
+        for (this_trait, future) in zip(traits, pending):
+            self.trait_results[this_trait.name] = [
+                -float(qtl['lrs_value']) if qtl['additive'] > 0
+                else float(qtl['lrs_value'])
+                for qtl in future.result()]
+
+
+def scan_trait(this_trait, dataset, genofile_name, samplelist):
+    """The markers of a qtlreaper scan of `this_trait` with
+    `HEATMAP_PERMUTATIONS` permutations, from the mapping cache if the trait
+    was scanned with the same values and genotypes (the same version of the
+    .geno file) before"""
+    samples, values, _variances, _sample_aliases = this_trait.export_informative()
+    trimmed_samples = []
+    trimmed_values = []
+    for (sample, value) in zip(samples, values):
+        if sample in samplelist:
+            trimmed_samples.append(str(sample))
+            trimmed_values.append(value)
+
+    geno_filepath = f"{flat_files('genotype')}/{genofile_name}.geno"
+    key = mapping_cache.mapping_cache_key({
+        "method": "heatmap_reaper",
+        "dataset": dataset.name,
+        "trait": this_trait.name,
+        "genofile": genofile_name,
+        "genofile_stamp": file_stamp(geno_filepath),
+        "samples": trimmed_samples,
+        "vals": trimmed_values,
+        "num_perm": HEATMAP_PERMUTATIONS})
+    cached = mapping_cache.fetch_mapping_results(key)
+    if cached is not None:
+        return cached[0]
+
+    # Unique to the scan, as the traits are scanned concurrently
+    trait_filename = (f"{this_trait.name}_{dataset.name}_pheno_"
+                      f"{uuid.uuid4().hex}")
+    output_filename = dataset.group.name + "_GWA_" + \
+        ''.join(random.choice(string.ascii_uppercase + string.digits)
+                for _ in range(6))
+    pheno_filepath = f"{TEMPDIR}/gn2/{trait_filename}.txt"
+    output_filepath = f"{webqtlConfig.GENERATED_IMAGE_DIR}{output_filename}.txt"
+
+    reaper_command = (
+        f"{REAPER_COMMAND} --geno {geno_filepath} --traits {pheno_filepath} "
+        f"-n {HEATMAP_PERMUTATIONS} -o {output_filepath}")
+    try:
+        gen_pheno_txt_file(trimmed_samples, trimmed_values, trait_filename)
+        returncode = run_tool("reaper", reaper_command)
+        if returncode != 0:
+            raise ToolError("reaper", returncode)
+        reaper_results = parse_reaper_output(output_filename)
+    finally:
+        # The scans are only kept in the mapping cache
+        for file_path in (pheno_filepath, output_filepath):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    if len(reaper_results) > 0:
+        mapping_cache.cache_mapping_results(key, reaper_results, {})
+    return reaper_results
 
 
 def gen_pheno_txt_file(samples, vals, filename):
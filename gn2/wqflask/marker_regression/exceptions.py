@@ -1,5 +1,8 @@
 """Mapping Exception classes."""
 
+# The exit code of `gn2.scripts.mapping_compute` if the mapping had no results
+NO_RESULTS_EXIT_CODE = 3
+
 class NoMappingResultsError(Exception):
     "Exception to raise if no results are computed."
 
@@ -11,3 +14,6 @@ class NoMappingResultsError(Exception):
             f"The mapping of trait '{trait}' from dataset '{dataset}' using "
             f"the '{mapping_method}' mapping method returned no results.")
         super().__init__(self.message, trait, mapping_method)
+
+class MappingNotCachedError(Exception):
+    "Exception to raise if a mapping that may only be read from the cache is not cached."
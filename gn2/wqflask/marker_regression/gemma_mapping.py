@@ -1,20 +1,21 @@
 import os
 import math
-import string
-import random
 import json
 import logging
 
 from gn2.base import webqtlConfig
 from gn2.base.trait import create_trait
 from gn2.base.data_set import create_dataset
+from gn2.jobs.tools import run_tool, ToolError
 from gn2.utility.redis_tools import get_redis_conn
 from gn2.utility.tools import flat_files, assert_file
 from gn2.utility.tools import GEMMA_WRAPPER_COMMAND
 from gn2.utility.tools import TEMPDIR
 from gn2.utility.tools import WEBSERVER_MODE
-from gn2.utility.tools import get_setting
-from gn2.wqflask.database import database_connection
+from gn2.utility.tools import get_setting_int
+from gn2.utility.arrays import file_stamp
+from gn2.utility.file_cache import mark_used
+from gn2.utility.file_cache import evict_least_recently_used
 from gn3.computations.gemma import generate_hash_of_string
 
 
@@ -23,14 +24,99 @@ if WEBSERVER_MODE == 'PROD':
     GEMMAOPTS = "-no-check"
 
 
-def generate_random_n_string(n):
-    return ''.join(random.choice(string.ascii_uppercase + string.digits)
-                   for _ in range(n))
+def gemma_output_path(output_filename):
+    return f"{TEMPDIR}/gn2/{output_filename}.json"
+
+
+def __gemma_output_files__(output_path):
+    """The result files listed in the gemma-wrapper output `output_path`;
+    None if the output is missing, empty or unreadable"""
+    try:
+        with open(output_path) as output_file:
+            data = json.load(output_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return [file[-1] for file in data.get("files") or []]
+
+
+def cached_gemma_output(output_filename):
+    """Whether a complete gemma-wrapper output called `output_filename` is in
+    the cache; marks it as used if it is"""
+    output_path = gemma_output_path(output_filename)
+    files = __gemma_output_files__(output_path)
+    if files is None or not all(os.path.exists(file) for file in files):
+        return False
+    mark_used(output_path)
+    return True
+
+
+def evict_gemma_cache(max_bytes):
+    """Delete the least recently used kinship and association outputs, and the
+    files they list, until they take up at most `max_bytes`"""
+    output_dir = f"{TEMPDIR}/gn2"
+    with os.scandir(output_dir) as entries:
+        output_paths = [entry.path for entry in entries
+                        if entry.name.endswith(".json") and
+                        ("_K_" in entry.name or "_GWA_" in entry.name)]
+    return evict_least_recently_used(
+        [[output_path] + (__gemma_output_files__(output_path) or [])
+         for output_path in output_paths],
+        max_bytes)
+
+
+def run_gemma_command(command, output_filename):
+    """Run a gemma-wrapper `command`, moving its output into place under
+    `output_filename` only once it has been written in full. Raises
+    `ToolError` if gemma-wrapper fails, so no partial output is parsed or
+    cached."""
+    output_path = gemma_output_path(output_filename)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    command = f"{command} > {tmp_path}"
+    logging.debug("gemma command: %s", command)
+    returncode = run_tool("gemma", command)
+    if returncode != 0:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise ToolError("gemma", returncode)
+    os.replace(tmp_path, output_path)
+
+
+def __file_stamp__(file_path):
+    try:
+        return file_stamp(file_path)
+    except OSError:
+        return None
+
+
+def kinship_cache_key(geno_filepath, vals, use_loco, chr_list_string):
+    """The cache key of a kinship matrix. GEMMA computes the matrix over the
+    samples that have a phenotype value, so it depends on which values are
+    missing, but not on the values themselves."""
+    samples_mask = "".join("0" if value == "x" else "1" for value in vals)
+    loco = chr_list_string if str(use_loco).lower() == "true" else ""
+    return generate_hash_of_string(
+        f"{geno_filepath}:{__file_stamp__(geno_filepath)}:{samples_mask}:"
+        f"{loco}:{GEMMAOPTS}").replace("/", "_")
+
+
+def association_cache_key(k_cache_key, vals, covar_filename, maf, use_loco):
+    """The cache key of an association run on the kinship matrix
+    `k_cache_key`. Covariate files are named by a hash of their contents."""
+    return generate_hash_of_string(
+        f"{k_cache_key}:{vals}:{covar_filename}:{maf}:"
+        f"{str(use_loco).lower()}").replace("/", "_")
 
 
 def run_gemma(this_trait, this_dataset, samples, vals, covariates, use_loco,
               maf=0.01, first_run=True, output_files=None):
-    """Generates p-values for each marker using GEMMA"""
+    """Generates p-values for each marker using GEMMA
+
+    Kinship and association outputs are content-addressed, so mapping the same
+    values again reuses the earlier outputs instead of running GEMMA."""
 
     if this_dataset.group.genofile is not None:
         genofile_name = this_dataset.group.genofile[:-5]
@@ -46,36 +132,40 @@ def run_gemma(this_trait, this_dataset, samples, vals, covariates, use_loco,
                   f"{genofile_name}_output.assoc.txt"),
                  "w+")
 
-        k_output_filename = (f"{this_dataset.group.name}_K_"
-                             f"{generate_random_n_string(6)}")
-        gwa_output_filename = (f"{this_dataset.group.name}_GWA_"
-                               f"{generate_random_n_string(6)}")
-
-
-        this_chromosomes_name = []
-        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as db_cursor:
-            for this_chr in this_dataset.species.chromosomes.chromosomes(db_cursor):
-                this_chromosomes_name.append(this_dataset.species.chromosomes.chromosomes(db_cursor)[this_chr].name)
+        this_chromosomes_name = [
+            chromosome.name for chromosome
+            in this_dataset.species.chromosomes.chromosomes().values()]
 
         chr_list_string = ",".join(this_chromosomes_name)
+        covar_filename = ""
         if covariates != "":
             covar_filename = gen_covariates_file(this_dataset, covariates, samples)
-        if str(use_loco).lower() == "true":
+
+        k_cache_key = kinship_cache_key(
+            f"{flat_files('genotype/bimbam')}/{genofile_name}_geno.txt",
+            vals, use_loco, chr_list_string)
+        k_output_filename = f"{this_dataset.group.name}_K_{k_cache_key}"
+        gwa_output_filename = (
+            f"{this_dataset.group.name}_GWA_"
+            f"{association_cache_key(k_cache_key, vals, covar_filename, maf, use_loco)}")
+
+        if cached_gemma_output(gwa_output_filename):
+            logging.debug("gemma: using cached %s", gwa_output_filename)
+        elif str(use_loco).lower() == "true":
             bimbam_dir = flat_files('genotype/bimbam')
             geno_filepath = assert_file(
                 f"{bimbam_dir}/{genofile_name}_geno.txt")
             pheno_filepath = f"{TEMPDIR}/gn2/{pheno_filename}.txt"
             snps_filepath = assert_file(
                 f"{bimbam_dir}/{genofile_name}_snps.txt")
-            k_json_output_filepath = f"{TEMPDIR}/gn2/{k_output_filename}.json"
-            generate_k_command = (f"{GEMMA_WRAPPER_COMMAND} --json --loco "
-                                  f"{chr_list_string} -- {GEMMAOPTS} "
-                                  f"-g {geno_filepath} -p "
-                                  f"{pheno_filepath} -a "
-                                  f"{snps_filepath} -gk > "
-                                  f"{k_json_output_filepath}")
-            logging.debug("generate_k_command: %s", generate_k_command)
-            os.system(generate_k_command)
+            k_json_output_filepath = gemma_output_path(k_output_filename)
+            if not cached_gemma_output(k_output_filename):
+                generate_k_command = (f"{GEMMA_WRAPPER_COMMAND} --json --loco "
+                                      f"{chr_list_string} -- {GEMMAOPTS} "
+                                      f"-g {geno_filepath} -p "
+                                      f"{pheno_filepath} -a "
+                                      f"{snps_filepath} -gk")
+                run_gemma_command(generate_k_command, k_output_filename)
 
             gemma_command = (f"{GEMMA_WRAPPER_COMMAND} --json --loco "
                              f"--input {k_json_output_filepath} "
@@ -87,28 +177,25 @@ def run_gemma(this_trait, this_dataset, samples, vals, covariates, use_loco,
                                   f"{covar_filename}.txt "
                                   f"-a {flat_files('genotype/bimbam')}/"
                                   f"{genofile_name}_snps.txt "
-                                  f"-lmm 9 -maf {maf} > {TEMPDIR}/gn2/"
-                                  f"{gwa_output_filename}.json")
+                                  f"-lmm 9 -maf {maf}")
             else:
                 gemma_command += (f"-a {flat_files('genotype/bimbam')}/"
                                   f"{genofile_name}_snps.txt -lmm 9 -maf "
-                                  f"{maf} > "
-                                  f"{TEMPDIR}/gn2/{gwa_output_filename}.json")
-
+                                  f"{maf}")
+            run_gemma_command(gemma_command, gwa_output_filename)
         else:
-            generate_k_command = (f"{GEMMA_WRAPPER_COMMAND} --json -- "
-                                  f"{GEMMAOPTS} "
-                                  f" -g {flat_files('genotype/bimbam')}/"
-                                  f"{genofile_name}_geno.txt -p "
-                                  f"{TEMPDIR}/gn2/{pheno_filename}.txt -a "
-                                  f"{flat_files('genotype/bimbam')}/"
-                                  f"{genofile_name}_snps.txt -gk > "
-                                  f"{TEMPDIR}/gn2/{k_output_filename}.json")
-            logging.debug("generate_k_command: %s", generate_k_command)
-            os.system(generate_k_command)
+            if not cached_gemma_output(k_output_filename):
+                generate_k_command = (f"{GEMMA_WRAPPER_COMMAND} --json -- "
+                                      f"{GEMMAOPTS} "
+                                      f" -g {flat_files('genotype/bimbam')}/"
+                                      f"{genofile_name}_geno.txt -p "
+                                      f"{TEMPDIR}/gn2/{pheno_filename}.txt -a "
+                                      f"{flat_files('genotype/bimbam')}/"
+                                      f"{genofile_name}_snps.txt -gk")
+                run_gemma_command(generate_k_command, k_output_filename)
 
             gemma_command = (f"{GEMMA_WRAPPER_COMMAND} --json --input "
-                             f"{TEMPDIR}/gn2/{k_output_filename}.json -- "
+                             f"{gemma_output_path(k_output_filename)} -- "
                              f"{GEMMAOPTS} "
                              f"-a {flat_files('genotype/bimbam')}/"
                              f"{genofile_name}_snps.txt "
@@ -118,13 +205,10 @@ def run_gemma(this_trait, this_dataset, samples, vals, covariates, use_loco,
 
             if covariates != "":
                 gemma_command += (f" -c {flat_files('mapping')}/"
-                                  f"{covar_filename}.txt > "
-                                  f"{TEMPDIR}/gn2/{gwa_output_filename}.json")
-            else:
-                gemma_command += f" > {TEMPDIR}/gn2/{gwa_output_filename}.json"
+                                  f"{covar_filename}.txt")
+            run_gemma_command(gemma_command, gwa_output_filename)
 
-        logging.debug("gemma_command: %s", gemma_command)
-        os.system(gemma_command)
+        evict_gemma_cache(get_setting_int("GEMMA_CACHE_MAX_BYTES"))
     else:
         gwa_output_filename = output_files
 
@@ -170,14 +254,18 @@ def gen_covariates_file(this_dataset, covariates, samples):
                                 cellid=None)
         this_dataset.group.get_samplelist(redis_conn=get_redis_conn())
         trait_samples = this_dataset.group.samplelist
-        trait_sample_data = trait_ob.data
-        for index, sample in enumerate(trait_samples):
-            if sample in samples:
-                if sample in trait_sample_data:
-                    sample_value = trait_sample_data[sample].value
-                    this_covariate_data.append(sample_value)
-                else:
-                    this_covariate_data.append("-9")
+        mapped_samples = set(samples)
+        covariate_samples = [sample for sample in trait_samples
+                             if sample in mapped_samples]
+        positions = trait_ob.data.positions(covariate_samples)
+        values = trait_ob.data.values_for(covariate_samples).tolist()
+        for (position, sample_value) in zip(positions, values):
+            if position < 0:
+                this_covariate_data.append("-9")
+            elif math.isnan(sample_value):
+                this_covariate_data.append(None)
+            else:
+                this_covariate_data.append(sample_value)
         covariate_data_object.append(this_covariate_data)
 
     filename = "COVAR_" + generate_hash_of_string(this_dataset.name + str(covariate_data_object)).replace("/", "_")
@@ -0,0 +1,113 @@
+"""Cache of mapping results, so that showing a mapping again (a shared link,
+zooming in, picking another chromosome) only redraws it
+
+Results are keyed on a hash of the inputs the mapping is computed from: the
+trait's values, the genotypes and the settings of the mapping method, but
+not the settings that only change how the results are displayed. The markers
+are stored as columns, with numbers and text in NumPy arrays, and the cache is
+held under `MAPPING_CACHE_MAX_BYTES` by evicting the least recently used
+results."""
+
+import os
+import json
+import pickle
+import hashlib
+
+import numpy as np
+
+from gn2.base.webqtlConfig import TMPDIR
+from gn2.utility.tools import get_setting_int
+from gn2.utility.file_cache import mark_used, evict_least_recently_used
+
+MAPPING_CACHE_DIR = os.path.join(TMPDIR, "mapping_cache")
+MAPPING_CACHE_VERSION = 1  # Bump when the way results are computed changes
+
+
+def mapping_cache_key(inputs: dict) -> str:
+    """The key of the results of a mapping computed from `inputs`"""
+    return hashlib.sha256(json.dumps(
+        [MAPPING_CACHE_VERSION, inputs], sort_keys=True, default=str
+    ).encode()).hexdigest()
+
+
+def mapping_cache_path(key: str) -> str:
+    """Path of the cached results with key `key`"""
+    return os.path.join(MAPPING_CACHE_DIR, f"{key}.pkl")
+
+
+def __pack_column__(values):
+    """Values of one type in an array; anything else is kept as a list"""
+    if all(isinstance(value, str) for value in values):
+        return np.array(values, dtype=str)
+    if any(isinstance(value, bool) for value in values):
+        return list(values)
+    if all(isinstance(value, int) for value in values):
+        return np.array(values, dtype=np.int64)
+    if all(isinstance(value, float) for value in values):
+        return np.array(values, dtype=float)
+    return list(values)
+
+
+def __unpack_column__(column):
+    return column.tolist() if isinstance(column, np.ndarray) else column
+
+
+def pack_markers(markers):
+    """The marker dicts `markers` as columns, one per key. Keys missing from
+    some markers have a mask of the markers that have them."""
+    keys = list(dict.fromkeys(key for marker in markers for key in marker))
+    columns = {}
+    present = {}
+    for key in keys:
+        has_key = np.array([key in marker for marker in markers], dtype=bool)
+        if not has_key.all():
+            present[key] = has_key
+        columns[key] = __pack_column__(
+            [marker[key] for marker in markers if key in marker])
+    return {"count": len(markers), "keys": keys, "columns": columns,
+            "present": present}
+
+
+def unpack_markers(packed):
+    """The marker dicts packed by `pack_markers`"""
+    markers = [{} for _ in range(packed["count"])]
+    for key in packed["keys"]:
+        rows = (np.flatnonzero(packed["present"][key])
+                if key in packed["present"] else range(packed["count"]))
+        for (row, value) in zip(rows, __unpack_column__(packed["columns"][key])):
+            markers[row][key] = value
+    return markers
+
+
+def fetch_mapping_results(key: str):
+    """The cached markers and other outputs of the mapping with key `key`,
+    or None if they're not cached"""
+    file_path = mapping_cache_path(key)
+    try:
+        with open(file_path, "rb") as results_file:
+            (packed, outputs) = pickle.load(results_file)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, ValueError):
+        os.unlink(file_path)
+        return None
+
+    mark_used(file_path)
+    return (unpack_markers(packed), outputs)
+
+
+def cache_mapping_results(key: str, markers, outputs: dict):
+    """Cache the markers and other outputs of the mapping with key `key`"""
+    os.makedirs(MAPPING_CACHE_DIR, exist_ok=True)
+    file_path = mapping_cache_path(key)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as results_file:
+        pickle.dump((pack_markers(markers), outputs), results_file,
+                    pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, file_path)
+
+    with os.scandir(MAPPING_CACHE_DIR) as cache_dir:
+        entries = [[entry.path] for entry in cache_dir
+                   if entry.name.endswith(".pkl")]
+    evict_least_recently_used(
+        entries, get_setting_int("MAPPING_CACHE_MAX_BYTES"))
@@ -1,7 +1,7 @@
 import string
-import os
 
 from gn2.base.webqtlConfig import TMPDIR
+from gn2.jobs.tools import run_tool
 from gn2.utility import webqtlUtil
 from gn2.utility.tools import flat_files, PLINK_COMMAND
 
@@ -13,7 +13,7 @@ def run_plink(this_trait, dataset, species, vals, maf):
 
     plink_command = f"{PLINK_COMMAND}  --noweb --bfile {flat_files('mapping')}/{dataset.group.name} --no-pheno --no-fid --no-parents --no-sex --maf {maf} --out { TMPDIR}{plink_output_filename} --assoc "
 
-    os.system(plink_command)
+    run_tool("plink", plink_command)
 
     count, p_values = parse_plink_output(plink_output_filename, species)
 
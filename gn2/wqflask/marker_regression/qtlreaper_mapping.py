@@ -1,4 +1,3 @@
-import os
 import math
 import string
 import random
@@ -8,6 +7,7 @@ import re
 from gn2.base import webqtlConfig
 from gn2.base.trait import GeneralTrait
 from gn2.base.data_set import create_dataset
+from gn2.jobs.tools import run_tool
 from gn2.utility.tools import flat_files, REAPER_COMMAND, TEMPDIR
 
 
@@ -64,7 +64,7 @@ def run_reaper(this_trait, this_dataset, samples, vals, json_data, num_perm, boo
                               opt_list),
                               webqtlConfig.GENERATED_IMAGE_DIR,
                               output_filename))
-        os.system(reaper_command)
+        run_tool("reaper", reaper_command)
     else:
         output_filename, permu_filename, bootstrap_filename = output_files
 
@@ -29,13 +29,16 @@ from gn2.base.trait import GeneralTrait
 from gn2.base import data_set
 from gn2.base import species
 from gn2.base import webqtlConfig
+from gn2.jobs.tools import run_tool
 from gn2.utility import webqtlUtil, helper_functions, hmac, Plot, Bunch, temp_data
 from gn2.utility.redis_tools import get_redis_conn
-from gn2.wqflask.database import database_connection
 from gn2.wqflask.marker_regression import gemma_mapping, rqtl_mapping, qtlreaper_mapping, plink_mapping
+from gn2.wqflask.marker_regression import mapping_cache
+from gn2.wqflask.marker_regression.exceptions import MappingNotCachedError
 from gn2.wqflask.show_trait.SampleList import SampleList
 
-from gn2.utility.tools import locate, get_setting, locate_ignore_error, GEMMA_COMMAND, PLINK_COMMAND, TEMPDIR
+from gn2.utility.tools import locate, locate_ignore_error, flat_files, GEMMA_COMMAND, PLINK_COMMAND, TEMPDIR
+from gn2.utility.arrays import file_stamp
 from gn2.utility.external import shell
 from gn2.base.webqtlConfig import TMPDIR, GENERATED_TEXT_DIR
 
@@ -43,7 +46,10 @@ Redis = get_redis_conn()
 
 class RunMapping:
 
-    def __init__(self, start_vars, temp_uuid):
+    def __init__(self, start_vars, temp_uuid, cached_only=False):
+        # With `cached_only`, a mapping that is not cached raises
+        # MappingNotCachedError instead of being run
+        self.cached_only = cached_only
         helper_functions.get_species_dataset_trait(self, start_vars)
 
         # needed to pass temp_uuid to gn1 mapping code (marker_regression_gn1.py)
@@ -211,14 +217,16 @@ class RunMapping:
                 self.first_run = False
             self.score_type = "-logP"
             self.manhattan_plot = True
-            if self.use_loco == "True":
-                marker_obs, self.output_files = gemma_mapping.run_gemma(
-                    self.this_trait, self.dataset, self.samples, self.vals, self.covariates, self.use_loco, self.maf, self.first_run, self.output_files)
-            else:
-                marker_obs, self.output_files = gemma_mapping.run_gemma(
+
+            def run_gemma():
+                marker_obs, output_files = gemma_mapping.run_gemma(
                     self.this_trait, self.dataset, self.samples, self.vals, self.covariates, self.use_loco, self.maf, self.first_run, self.output_files)
-            results = marker_obs
+                return marker_obs, {"output_files": output_files}
+            results = self.cached_mapping(
+                run_gemma, covariates=self.covariates, use_loco=self.use_loco,
+                maf=self.maf)
         elif self.mapping_method == "rqtl_plink":
+            self.uncached_mapping()
             results = self.run_rqtl_plink()
         elif self.mapping_method == "rqtl_geno":
             self.perm_strata = []
@@ -243,12 +251,30 @@ class RunMapping:
             self.pair_scan = False
             if start_vars['pair_scan'] == "true":
                self.pair_scan = True
-            if self.permCheck and self.num_perm > 0:
-                self.perm_output, self.suggestive, self.significant, results = rqtl_mapping.run_rqtl(
-                    self.this_trait.name, self.vals, self.samples, self.dataset, self.pair_scan, self.mapping_scale, self.model, self.method, self.num_perm, self.perm_strata, self.do_control, self.control_marker, self.manhattan_plot, self.covariates)
+
+            def run_rqtl():
+                if self.permCheck and self.num_perm > 0:
+                    perm_output, suggestive, significant, results = rqtl_mapping.run_rqtl(
+                        self.this_trait.name, self.vals, self.samples, self.dataset, self.pair_scan, self.mapping_scale, self.model, self.method, self.num_perm, self.perm_strata, self.do_control, self.control_marker, self.manhattan_plot, self.covariates)
+                    return results, {"perm_output": perm_output,
+                                     "suggestive": suggestive,
+                                     "significant": significant}
+                return rqtl_mapping.run_rqtl(self.this_trait.name, self.vals, self.samples, self.dataset, self.pair_scan, self.mapping_scale, self.model, self.method,
+                                             self.num_perm, self.perm_strata, self.do_control, self.control_marker, self.manhattan_plot, self.covariates), {}
+            if self.pair_scan:
+                # Pair scans give a figure and a table, not markers
+                self.uncached_mapping()
+                results = run_rqtl()[0]
             else:
-                results = rqtl_mapping.run_rqtl(self.this_trait.name, self.vals, self.samples, self.dataset, self.pair_scan, self.mapping_scale, self.model, self.method,
-                                                     self.num_perm, self.perm_strata, self.do_control, self.control_marker, self.manhattan_plot, self.covariates)
+                results = self.cached_mapping(
+                    run_rqtl, mapping_scale=self.mapping_scale,
+                    model=self.model, rqtl_method=self.method,
+                    num_perm=self.num_perm if self.permCheck else 0,
+                    perm_strata=self.perm_strata,
+                    control_marker=self.control_marker,
+                    do_control=self.do_control,
+                    manhattan_plot=self.manhattan_plot,
+                    covariates=self.covariates)
         elif self.mapping_method == "reaper":
             if "startMb" in start_vars:  # ZS: Check if first time page loaded, so it can default to ON
                 if "additiveCheck" in start_vars:
@@ -286,24 +312,31 @@ class RunMapping:
                     self.output_files = start_vars['output_files'].split(
                         ",")
 
-            results, self.perm_output, self.suggestive, self.significant, self.bootstrap_results, self.output_files = qtlreaper_mapping.run_reaper(self.this_trait,
-                                                                                                                                                    self.dataset,
-                                                                                                                                                    self.samples,
-                                                                                                                                                    self.vals,
-                                                                                                                                                    self.json_data,
-                                                                                                                                                    self.num_perm,
-                                                                                                                                                    self.bootCheck,
-                                                                                                                                                    self.num_bootstrap,
-                                                                                                                                                    self.do_control,
-                                                                                                                                                    self.control_marker,
-                                                                                                                                                    self.manhattan_plot,
-                                                                                                                                                    self.first_run,
-                                                                                                                                                    self.output_files)
+            def run_reaper():
+                (results, perm_output, suggestive, significant,
+                 bootstrap_results, output_files) = qtlreaper_mapping.run_reaper(
+                     self.this_trait, self.dataset, self.samples, self.vals,
+                     self.json_data, self.num_perm, self.bootCheck,
+                     self.num_bootstrap, self.do_control, self.control_marker,
+                     self.manhattan_plot, self.first_run, self.output_files)
+                return results, {"perm_output": perm_output,
+                                 "suggestive": suggestive,
+                                 "significant": significant,
+                                 "bootstrap_results": bootstrap_results,
+                                 "output_files": output_files}
+            results = self.cached_mapping(
+                run_reaper, num_perm=self.num_perm,
+                num_bootstrap=self.num_bootstrap if self.bootCheck else 0,
+                control_marker=self.control_marker, do_control=self.do_control,
+                manhattan_plot=self.manhattan_plot)
         elif self.mapping_method == "plink":
             self.score_type = "-logP"
             self.manhattan_plot = True
-            results = plink_mapping.run_plink(
-                self.this_trait, self.dataset, self.species, self.vals, self.maf)
+            results = self.cached_mapping(
+                lambda: (plink_mapping.run_plink(
+                    self.this_trait, self.dataset, self.species, self.vals,
+                    self.maf), {}),
+                maf=self.maf)
             #results = self.run_plink()
 
         self.no_results = False
@@ -314,94 +347,83 @@ class RunMapping:
                 self.figure_data = results[0]
                 self.table_data = results[1]
             else:
-                self.qtl_results = []
-                self.results_for_browser = []
-                self.annotations_for_browser = []
-                highest_chr = 1  # This is needed in order to convert the highest chr to X/Y
-                for marker in results:
-                    marker['hmac'] = hmac.data_hmac('{}:{}'.format(marker['name'], self.dataset.group.name + "Geno"))
-                    if 'Mb' in marker:
-                        this_ps = marker['Mb'] * 1000000
-                    else:
-                        this_ps = marker['cM'] * 1000000
-
-                    browser_marker = dict(
-                        chr=str(marker['chr']),
-                        rs=marker['name'],
-                        ps=this_ps,
-                        url="/show_trait?trait_id=" + \
-                            marker['name'] + "&dataset=" + \
-                        self.dataset.group.name + "Geno"
-                    )
-
-                    if self.geno_db_exists == "True":
-                        annot_marker = dict(
-                            name=str(marker['name']),
-                            chr=str(marker['chr']),
-                            rs=marker['name'],
-                            pos=this_ps,
-                            url="/show_trait?trait_id=" + \
-                                marker['name'] + "&dataset=" + \
-                            self.dataset.group.name + "Geno"
-                        )
-                    else:
-                        annot_marker = dict(
-                            name=str(marker['name']),
-                            chr=str(marker['chr']),
-                            rs=marker['name'],
-                            pos=this_ps
-                        )
-
-                    if 'lrs_value' in marker and marker['lrs_value'] > 0:
-                        browser_marker['p_wald'] = 10**- \
-                            (marker['lrs_value'] / 4.61)
-                    elif 'lod_score' in marker and marker['lod_score'] > 0:
-                        browser_marker['p_wald'] = 10**-(marker['lod_score'])
-                    else:
-                        browser_marker['p_wald'] = 0
-
-                    self.results_for_browser.append(browser_marker)
-                    self.annotations_for_browser.append(annot_marker)
-                    if str(marker['chr']) > '0' or str(marker['chr']) == "X" or str(marker['chr']) == "X/Y":
-                        if str(marker['chr']) > str(highest_chr) or str(marker['chr']) == "X" or str(marker['chr']) == "X/Y":
-                            highest_chr = marker['chr']
-                        if ('lod_score' in marker.keys()) or ('lrs_value' in marker.keys()):
-                            if 'Mb' in marker.keys():
-                                marker['display_pos'] = "Chr" + \
-                                    str(marker['chr']) + ": " + \
-                                    "{:.6f}".format(marker['Mb'])
-                            elif 'cM' in marker.keys():
-                                marker['display_pos'] = "Chr" + \
-                                    str(marker['chr']) + ": " + \
-                                    "{:.3f}".format(marker['cM'])
-                            else:
-                                marker['display_pos'] = "N/A"
-                            self.qtl_results.append(marker)
-
+                # The outputs are built from columns pulled out of the
+                # results once; marker dicts are only made for the markers
+                # each output keeps
+                geno_dataset = self.dataset.group.name + "Geno"
+                names = [marker['name'] for marker in results]
+                chrs = [str(marker['chr']) for marker in results]
+                positions = (np.array(
+                    [marker['Mb'] if 'Mb' in marker else marker['cM']
+                     for marker in results], dtype=float) * 1000000).tolist()
+                p_walds = p_wald_column(results).tolist()
+                in_qtl_results = np.array([
+                    (chr_name > '0' or chr_name in ("X", "X/Y")) and
+                    ('lod_score' in marker or 'lrs_value' in marker)
+                    for (chr_name, marker) in zip(chrs, results)], dtype=bool)
+
+                self.qtl_results = [
+                    results[idx] for idx in np.flatnonzero(in_qtl_results)]
                 total_markers = len(self.qtl_results)
                 export_mapping_results(self.dataset, self.this_trait, self.qtl_results, self.mapping_results_path,
                                        self.mapping_method, self.mapping_scale, self.score_type,
                                        self.transform, self.covariates, self.n_samples, self.vals_hash)
 
+                browser_rows = range(len(results))
+                annotation_rows = browser_rows
                 if len(self.qtl_results) > 30000:
                     self.qtl_results = trim_markers_for_figure(
                         self.qtl_results)
-                    self.results_for_browser = trim_markers_for_figure(
-                        self.results_for_browser)
-                    filtered_annotations = []
-                    for marker in self.results_for_browser:
-                        for annot_marker in self.annotations_for_browser:
-                            if annot_marker['rs'] == marker['rs']:
-                                filtered_annotations.append(annot_marker)
-                                break
-                    self.annotations_for_browser = filtered_annotations
-                    browser_files = write_input_for_browser(
-                        self.dataset, self.results_for_browser, self.annotations_for_browser)
-                else:
-                    browser_files = write_input_for_browser(
-                        self.dataset, self.results_for_browser, self.annotations_for_browser)
+                    browser_rows = np.flatnonzero(
+                        figure_mask(p_walds, 'p_wald')).tolist()
+                    # Each browser marker is annotated with the first
+                    # marker of the same name
+                    first_rows = {}
+                    for (idx, name) in enumerate(names):
+                        first_rows.setdefault(name, idx)
+                    annotation_rows = [first_rows[names[idx]]
+                                       for idx in browser_rows]
+
+                self.results_for_browser = [
+                    dict(chr=chrs[idx],
+                         rs=names[idx],
+                         ps=positions[idx],
+                         url="/show_trait?trait_id=" + names[idx] + \
+                             "&dataset=" + geno_dataset,
+                         p_wald=p_walds[idx])
+                    for idx in browser_rows]
+                self.annotations_for_browser = []
+                for idx in annotation_rows:
+                    annot_marker = dict(name=str(names[idx]),
+                                        chr=chrs[idx],
+                                        rs=names[idx],
+                                        pos=positions[idx])
+                    if self.geno_db_exists == "True":
+                        annot_marker['url'] = "/show_trait?trait_id=" + \
+                            names[idx] + "&dataset=" + geno_dataset
+                    self.annotations_for_browser.append(annot_marker)
 
-                self.trimmed_markers = trim_markers_for_table(results)
+                browser_files = write_input_for_browser(
+                    self.dataset, self.results_for_browser, self.annotations_for_browser)
+
+                # Only the markers in the table are displayed with a link
+                # and a position, so only they get an HMAC and display_pos
+                table_rows = table_order(results)
+                self.trimmed_markers = [results[idx] for idx in table_rows]
+                for idx in table_rows:
+                    marker = results[idx]
+                    marker['hmac'] = hmac.data_hmac(
+                        '{}:{}'.format(marker['name'], geno_dataset))
+                    if not in_qtl_results[idx]:
+                        continue
+                    if 'Mb' in marker:
+                        marker['display_pos'] = "Chr" + \
+                            chrs[idx] + ": " + "{:.6f}".format(marker['Mb'])
+                    elif 'cM' in marker:
+                        marker['display_pos'] = "Chr" + \
+                            chrs[idx] + ": " + "{:.3f}".format(marker['cM'])
+                    else:
+                        marker['display_pos'] = "N/A"
 
                 chr_lengths = get_chr_lengths(
                     self.mapping_scale, self.mapping_method, self.dataset, self.qtl_results)
@@ -457,6 +479,43 @@ class RunMapping:
                         total_markers=total_markers
                     )
 
+    def cached_mapping(self, compute, **inputs):
+        """
+        Map with `compute` unless the same mapping is cached: one on the same
+        values of the trait, with the same genotypes (the same version of the
+        genotype file the method reads) and the same `inputs`, the settings
+        of the mapping method. `compute` returns the markers and a dict of the
+        other outputs of the mapping, which are set on `self`.
+        """
+        key = mapping_cache.mapping_cache_key({
+            "method": self.mapping_method,
+            "dataset": self.dataset.name,
+            "trait": self.this_trait.name,
+            "genofile": self.dataset.group.genofile,
+            "genofile_stamp": genotype_file_stamp(
+                genotype_file(self.mapping_method, self.dataset.group)),
+            "samples": self.samples,
+            "vals": self.vals,
+            **inputs})
+        cached = mapping_cache.fetch_mapping_results(key)
+        if cached is None:
+            self.uncached_mapping()
+            (markers, outputs) = compute()
+            if len(markers) > 0:
+                mapping_cache.cache_mapping_results(key, markers, outputs)
+        else:
+            (markers, outputs) = cached
+
+        for (name, value) in outputs.items():
+            setattr(self, name, value)
+        return markers
+
+    def uncached_mapping(self):
+        """Check that the mapping may be run, which it may not be when only
+        cached mappings are wanted"""
+        if self.cached_only:
+            raise MappingNotCachedError()
+
     def run_rqtl_plink(self):
         # os.chdir("") never do this inside a webserver!!
 
@@ -469,7 +528,7 @@ class RunMapping:
         rqtl_command = './plink --noweb --ped %s.ped --no-fid --no-parents --no-sex --no-pheno --map %s.map --pheno %s/%s.txt --pheno-name %s --maf %s --missing-phenotype -9999 --out %s%s --assoc ' % (
             self.dataset.group.name, self.dataset.group.name, TMPDIR, plink_output_filename, self.this_trait.name, self.maf, TMPDIR, plink_output_filename)
 
-        os.system(rqtl_command)
+        run_tool("plink", rqtl_command)
 
         count, p_values = self.parse_rqtl_output(plink_output_filename)
 
@@ -497,6 +556,24 @@ class RunMapping:
         return trimmed_genotype_data
 
 
+def genotype_file(mapping_method, group):
+    """The path of the genotype file `mapping_method` reads for `group`"""
+    if mapping_method == "gemma":
+        genofile_name = group.genofile[:-5] if group.genofile else group.name
+        return f"{flat_files('genotype/bimbam')}/{genofile_name}_geno.txt"
+    if mapping_method == "plink":
+        return f"{flat_files('mapping')}/{group.name}.bed"
+    return f"{flat_files('genotype')}/{group.genofile or group.name + '.geno'}"
+
+
+def genotype_file_stamp(file_path):
+    """The `file_stamp` of a genotype file, or None if it cannot be read"""
+    try:
+        return file_stamp(file_path)
+    except OSError:
+        return None
+
+
 def export_mapping_results(dataset, trait, markers, results_path, mapping_method, mapping_scale, score_type, transform, covariates, n_samples, vals_hash):
     if mapping_scale == "physic":
         scale_string = "Mb"
@@ -563,6 +640,45 @@ def export_mapping_results(dataset, trait, markers, results_path, mapping_method
                 output_file.write("\n")
 
 
+def score_column(markers, score_type):
+    """The `score_type` scores of `markers` as an array, NaN where missing"""
+    return np.array([marker.get(score_type, np.nan) for marker in markers],
+                    dtype=float)
+
+
+def p_wald_column(markers):
+    """The p-values shown in the genome browser: from the LRS if positive,
+    else from the LOD score if positive, else 0"""
+    lrs_values = score_column(markers, 'lrs_value')
+    lod_scores = score_column(markers, 'lod_score')
+    with np.errstate(all="ignore"):
+        return np.where(lrs_values > 0, 10 ** -(lrs_values / 4.61),
+                        np.where(lod_scores > 0, 10 ** -lod_scores, 0.0))
+
+
+def figure_mask(scores, score_type):
+    """Which markers to keep for the figure, given their scores: only every
+    20th marker with a low score, every 10th with a middling one and every
+    2nd with a high one. Markers with higher scores are all kept."""
+    scores = np.asarray(scores, dtype=float)
+    with np.errstate(invalid="ignore"):
+        if score_type == 'p_wald':
+            bands = (scores > 0.1,
+                     (0.1 >= scores) & (scores > 0.01),
+                     (0.01 >= scores) & (scores > 0.001))
+        else:
+            unit = 1 if score_type == 'lod_score' else 4.61
+            bands = (scores < unit,
+                     (unit <= scores) & (scores < 2 * unit),
+                     (2 * unit <= scores) & (scores <= 3 * unit))
+
+    keep = np.ones(len(scores), dtype=bool)
+    for (band, step) in zip(bands, (20, 10, 2)):
+        rank_in_band = np.cumsum(band) - 1
+        keep[band] = rank_in_band[band] % step == 0
+    return keep
+
+
 def trim_markers_for_figure(markers):
     if 'p_wald' in list(markers[0].keys()):
         score_type = 'p_wald'
@@ -571,73 +687,24 @@ def trim_markers_for_figure(markers):
     else:
         score_type = 'lrs_value'
 
-    filtered_markers = []
-    low_counter = 0
-    med_counter = 0
-    high_counter = 0
-    for marker in markers:
-        if score_type == 'p_wald':
-            if marker[score_type] > 0.1:
-                if low_counter % 20 == 0:
-                    filtered_markers.append(marker)
-                low_counter += 1
-            elif 0.1 >= marker[score_type] > 0.01:
-                if med_counter % 10 == 0:
-                    filtered_markers.append(marker)
-                med_counter += 1
-            elif 0.01 >= marker[score_type] > 0.001:
-                if high_counter % 2 == 0:
-                    filtered_markers.append(marker)
-                high_counter += 1
-            else:
-                filtered_markers.append(marker)
-        elif score_type == 'lod_score':
-            if marker[score_type] < 1:
-                if low_counter % 20 == 0:
-                    filtered_markers.append(marker)
-                low_counter += 1
-            elif 1 <= marker[score_type] < 2:
-                if med_counter % 10 == 0:
-                    filtered_markers.append(marker)
-                med_counter += 1
-            elif 2 <= marker[score_type] <= 3:
-                if high_counter % 2 == 0:
-                    filtered_markers.append(marker)
-                high_counter += 1
-            else:
-                filtered_markers.append(marker)
-        else:
-            if marker[score_type] < 4.61:
-                if low_counter % 20 == 0:
-                    filtered_markers.append(marker)
-                low_counter += 1
-            elif 4.61 <= marker[score_type] < (2 * 4.61):
-                if med_counter % 10 == 0:
-                    filtered_markers.append(marker)
-                med_counter += 1
-            elif (2 * 4.61) <= marker[score_type] <= (3 * 4.61):
-                if high_counter % 2 == 0:
-                    filtered_markers.append(marker)
-                high_counter += 1
-            else:
-                filtered_markers.append(marker)
-    return filtered_markers
+    keep = figure_mask(score_column(markers, score_type), score_type)
+    return [marker for (marker, kept) in zip(markers, keep) if kept]
 
 
-def trim_markers_for_table(markers):
+def table_order(markers):
+    """The positions of the (at most 25000) markers shown in the results
+    table, highest score first"""
     if 'lod_score' in list(markers[0].keys()):
-        sorted_markers = sorted(
-            markers, key=lambda k: k['lod_score'], reverse=True)
+        scores = score_column(markers, 'lod_score')
     else:
-        sorted_markers = sorted(
-            markers, key=lambda k: k['lrs_value'], reverse=True)
+        scores = score_column(markers, 'lrs_value')
 
     #ZS: So we end up with a list of just 2000 markers
-    if len(sorted_markers) >= 25000:
-        trimmed_sorted_markers = sorted_markers[:25000]
-        return trimmed_sorted_markers
-    else:
-        return sorted_markers
+    return np.argsort(-scores, kind="stable")[:25000].tolist()
+
+
+def trim_markers_for_table(markers):
+    return [markers[idx] for idx in table_order(markers)]
 
 
 def write_input_for_browser(this_dataset, gwas_results, annotations):
@@ -669,13 +736,11 @@ def geno_db_exists(this_dataset):
 def get_chr_lengths(mapping_scale, mapping_method, dataset, qtl_results):
     chr_lengths = []
     if mapping_scale == "physic":
-        with database_connection(get_setting("SQL_URI")) as conn, conn.cursor() as db_cursor:
-            for i, the_chr in enumerate(dataset.species.chromosomes.chromosomes(db_cursor)):
-                this_chr = {
-                    "chr": dataset.species.chromosomes.chromosomes(db_cursor)[the_chr].name,
-                    "size": str(dataset.species.chromosomes.chromosomes(db_cursor)[the_chr].length)
-                }
-                chr_lengths.append(this_chr)
+        for chromosome in dataset.species.chromosomes.chromosomes().values():
+            chr_lengths.append({
+                "chr": chromosome.name,
+                "size": str(chromosome.length)
+            })
     else:
         this_chr = 1
         highest_pos = 0
@@ -342,6 +342,10 @@ View the diffs <a href='{url}' target='_blank'>here</a>", "success")
                 conn, {"id_": data_["old_id_"], **publication_})
         conn.commit()
 
+    if updated_phenotypes or updated_publications or existing_publication:
+        from gn2.utility.redis_tools import datasets_changed
+        datasets_changed(redis.from_url(current_app.config["REDIS_URL"]))
+
     if updated_publications:
         diff_data.update(
             {
@@ -532,8 +536,9 @@ View the diffs <a href='{url}' target='_blank'>here</a>", "success")
             conn, probeset_id, {"id_": data_["id"], **{
                 key: value for key,value in probeset_.items()
                 if value is not None}})
-
         if updated_probesets:
+            from gn2.utility.redis_tools import datasets_changed
+            datasets_changed(redis.from_url(current_app.config["REDIS_URL"]))
             diff_data.update(
                 {
                     "Probeset": diff_from_dict(
@@ -892,6 +897,11 @@ def approve_data(resource_id: str, file_name: str):
                 n_insertions += 1
             else:
                 sample_data.get("Additions").remove(data)
+    if n_deletions or n_insertions or modifications:
+        # The data tables changed: other processes must not keep using their
+        # memoized table timestamps
+        from gn2.utility.redis_tools import datasets_changed
+        datasets_changed(redis.from_url(current_app.config["REDIS_URL"]))
     if any(
         [
             sample_data.get("Additions"),
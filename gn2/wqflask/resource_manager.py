@@ -95,6 +95,7 @@ def view_resource(resource_id: str):
                            methods=('POST',))
 @login_required()
 def update_resource_publicity(resource_id: str):
+    from gn2.utility.redis_tools import permissions_changed
     redis_conn = redis.from_url(
         current_app.config["REDIS_URL"],
         decode_responses=True)
@@ -116,6 +117,7 @@ def update_resource_publicity(resource_id: str):
             'metadata': DataRole.NO_ACCESS.value,
         }
     redis_conn.hset("resources", resource_id, json.dumps(resource_info))
+    permissions_changed(redis_conn)
     return redirect(url_for("resource_management.view_resource",
                             resource_id=resource_id))
 
@@ -134,6 +136,7 @@ def view_resource_owner(resource_id: str):
 @edit_admins_access_required
 @login_required()
 def change_owner(resource_id: str):
+    from gn2.utility.redis_tools import permissions_changed
     if user_id := request.form.get("new_owner"):
         redis_conn = redis.from_url(
             current_app.config["REDIS_URL"],
@@ -141,6 +144,7 @@ def change_owner(resource_id: str):
         resource = json.loads(redis_conn.hget("resources", resource_id))
         resource["owner_id"] = user_id
         redis_conn.hset("resources", resource_id, json.dumps(resource))
+        permissions_changed(redis_conn)
         flash("The resource's owner has been changed.", "alert-info")
     return redirect(url_for("resource_management.view_resource",
                             resource_id=resource_id))
@@ -1,4 +1,8 @@
+import os
+import time
 import uuid
+import pickle
+import hashlib
 from math import *
 import requests
 import unicodedata
@@ -20,14 +24,25 @@ from gn2.wqflask import parser
 from gn2.wqflask import do_search
 
 from gn2.wqflask.database import database_connection
+from gn2.wqflask.server_side import TableRows
 
-from gn2.utility.authentication_tools import check_resource_availability
+from gn2.utility.authentication_tools import check_traits_availability
 from gn2.utility.hmac import hmac_creation
-from gn2.utility.tools import get_setting, GN2_BASE_URL, GN3_LOCAL_URL
+from gn2.utility.file_cache import mark_used, evict_least_recently_used
+from gn2.utility.tools import get_setting, get_setting_int, GN2_BASE_URL, GN3_LOCAL_URL
 from gn2.utility.type_checking import is_str
+from gn2.base.webqtlConfig import TMPDIR
 
 MAX_SEARCH_RESULTS = 50000 # Max number of search results, passed to Xapian search (this needs to match the value in GN3!)
 
+SEARCH_CACHE_DIR = os.path.join(TMPDIR, "search_cache")
+
+# Arguments DataTables adds to the search arguments when paging and sorting
+TABLE_ARGS = re.compile(
+    r"^(_|sEcho|iDisplayStart|iDisplayLength|iColumns|sColumns|iSortingCols"
+    r"|sSearch|bRegex|(iSortCol|sSortDir|mDataProp|sSearch|bRegex|bSearchable"
+    r"|bSortable)_\d+)$")
+
 
 class SearchResultPage:
     #maxReturn = 3000
@@ -109,6 +124,12 @@ class SearchResultPage:
         elif self.dataset.type == "Geno":
             self.header_data_names = ['index', 'display_name', 'location']
 
+        if self.dataset.type == "Publish" and self.search_type != "xapian":
+            # Check permissions on a trait-by-trait basis for phenotype traits
+            trait_privileges = check_traits_availability(
+                self.dataset, g.user_session.user_id,
+                [str(result[0]) for result in self.results if result])
+
         for index, result in enumerate(self.results):
             if not result:
                 continue
@@ -184,11 +205,9 @@ class SearchResultPage:
                     if (result[4] != "NULL" and result[4] != "") and (result[5] != 0):
                         trait_dict['location'] = f"Chr{result[4]}: {float(result[5]):.6f}"
                 elif self.dataset.type == "Publish":
-                    # Check permissions on a trait-by-trait basis for phenotype traits
                     trait_dict['name'] = trait_dict['display_name'] = str(result[0])
                     trait_dict['hmac'] = f"{trait_dict['display_name']}:{trait_dict['dataset']}:{hmac_creation('{}:{}'.format(trait_dict['display_name'], trait_dict['dataset']))}"
-                    permissions = check_resource_availability(
-                        self.dataset, g.user_session.user_id, trait_dict['display_name'])
+                    permissions = trait_privileges[trait_dict['display_name']]
                     if not any(x in permissions['data'] for x in ["view", "edit"]):
                         continue
 
@@ -541,3 +560,80 @@ def create_xapian_term(dataset, term):
             return xapian_term
         case None:
             return xapian_term + f"{search_term[0]}"
+
+
+def search_cache_key(kw, user_id):
+    """The key of the stored results of the search with arguments `kw`:
+    the arguments of the search itself, without those DataTables adds, and
+    the user for phenotype searches, since their results depend on the
+    user's privileges"""
+    args = sorted((key, value.strip()) for (key, value) in kw.items()
+                  if not TABLE_ARGS.match(key))
+    if kw.get("type") == "Phenotypes":
+        args.append(("user_id", str(user_id)))
+    return hashlib.md5(json.dumps(args).encode()).hexdigest()
+
+
+def fetch_search(file_path):
+    """The stored search at `file_path`, or None if it's missing or expired"""
+    try:
+        with open(file_path, "rb") as search_file:
+            stored = pickle.load(search_file)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+        os.unlink(file_path)
+        return None
+
+    if time.time() - stored["stored_at"] > get_setting_int("SEARCH_CACHE_TTL"):
+        os.unlink(file_path)
+        return None
+    mark_used(file_path)
+    return stored
+
+
+def store_search(file_path, the_search):
+    """Store the results of `the_search` at `file_path`, with the rows of
+    the results table in compact form"""
+    page_vars = {key: value for (key, value) in the_search.__dict__.items()
+                 if key not in ("results", "dataset", "trait_list")}
+    stored = {
+        "stored_at": time.time(),
+        "dataset": (the_search.dataset.name, the_search.dataset.type),
+        "result_count": len(the_search.results),
+        "page_vars": page_vars,
+        "trait_list": TableRows.from_dicts(
+            the_search.trait_list, getattr(the_search, "header_data_names", ()))}
+
+    os.makedirs(SEARCH_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as search_file:
+        pickle.dump(stored, search_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, file_path)
+
+    with os.scandir(SEARCH_CACHE_DIR) as cache_dir:
+        entries = [[entry.path] for entry in cache_dir
+                   if entry.name.endswith(".pkl")]
+    evict_least_recently_used(entries, get_setting_int("SEARCH_CACHE_MAX_BYTES"))
+    return stored
+
+
+def cached_search(kw, user_id):
+    """Run the search with arguments `kw`, or reuse its stored results.
+
+    Returns the variables for the search results page, with the rows of the
+    results table as `TableRows`, or None for an invalid search."""
+    file_path = os.path.join(
+        SEARCH_CACHE_DIR, f"{search_cache_key(kw, user_id)}.pkl")
+    stored = fetch_search(file_path)
+    if stored is None:
+        the_search = SearchResultPage(kw)
+        if not the_search.search_term_exists:
+            return None
+        stored = store_search(file_path, the_search)
+
+    return {**stored["page_vars"],
+            "dataset": create_dataset(*stored["dataset"]),
+            # Only ever counted, by the results page
+            "results": range(stored["result_count"]),
+            "trait_list": stored["trait_list"]}
@@ -1,5 +1,94 @@
 # handles server side table processing
 
+import numpy as np
+
+
+class TableRows:
+    """
+        The rows of a table in a compact form, for storing: each row is a
+        tuple of values along with the set of keys it has, since not all the
+        rows of a table need have the same keys. Rows are only turned back into
+        dicts when they are read, so slicing a page out of many rows is cheap.
+
+        `ranks` holds for some columns the rank of each row's value (equal
+        values share a rank), so that rows can be sorted on those columns
+        without comparing the values again. Other columns are ranked when first
+        sorted on.
+    """
+
+    def __init__(self, key_sets, rows, ranks=None, selection=None):
+        self.key_sets = key_sets
+        self.rows = rows
+        self.ranks = {} if ranks is None else ranks
+        # The rows, by position, in the order they are read; all by default
+        self.selection = selection
+
+    @classmethod
+    def from_dicts(cls, dicts, sort_columns=()):
+        """Build the rows from a list of dicts, ranking `sort_columns`"""
+        key_set_ids = {}
+        rows = []
+        for row in dicts:
+            key_set_id = key_set_ids.setdefault(tuple(row), len(key_set_ids))
+            rows.append((key_set_id, tuple(row.values())))
+        table = cls(list(key_set_ids), rows)
+        for column in sort_columns:
+            table.rank(column)
+        return table
+
+    def __len__(self):
+        return len(self.rows if self.selection is None else self.selection)
+
+    def __row__(self, position):
+        (key_set_id, values) = self.rows[position]
+        return dict(zip(self.key_sets[key_set_id], values))
+
+    def __getitem__(self, index):
+        positions = range(len(self.rows)) if self.selection is None else self.selection
+        if isinstance(index, slice):
+            return [self.__row__(position) for position in positions[index]]
+        return self.__row__(positions[index])
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def column(self, column):
+        """The values of `column` in all the rows, None where a row lacks it"""
+        indices = [key_set.index(column) if column in key_set else None
+                   for key_set in self.key_sets]
+        return [None if indices[key_set_id] is None
+                else values[indices[key_set_id]]
+                for (key_set_id, values) in self.rows]
+
+    def rank(self, column):
+        """The rank of every row's value of `column`"""
+        if column not in self.ranks:
+            values = self.column(column)
+            try:
+                order = sorted(range(len(values)), key=values.__getitem__)
+            except TypeError:
+                # Mixed types (or missing values): compare them as text
+                values = ["" if value is None else str(value)
+                          for value in values]
+                order = sorted(range(len(values)), key=values.__getitem__)
+            ranks = np.zeros(len(values), dtype=np.int32)
+            for (previous, position) in zip(order, order[1:]):
+                ranks[position] = ranks[previous] + (
+                    values[position] != values[previous])
+            self.ranks[column] = ranks
+        return self.ranks[column]
+
+    def sorted(self, sort_columns):
+        """The rows sorted on each of `sort_columns`, `(column, reverse)`
+        pairs, in turn. Like successive stable sorts, the last column is the
+        main sort key, with ties broken by the ones before it."""
+        keys = [np.arange(len(self.rows))]
+        for (column, reverse) in sort_columns:
+            ranks = self.rank(column)
+            keys.append(-ranks if reverse else ranks)
+        return TableRows(self.key_sets, self.rows, self.ranks,
+                         selection=np.lexsort(keys))
+
 
 class ServerSideTable:
     """
@@ -17,6 +106,9 @@ class ServerSideTable:
             `request_values` must have request arguments values
             including the DataTables server-side processing arguments.
 
+        `table_rows` may be a list of dicts or a `TableRows`, which is sorted
+        and paginated without building the rows that are not on the page.
+
         Have a look at snp_browser_table() function in 
         wqflask/wqflask/views.py for reference use.
     """
@@ -42,13 +134,20 @@ class ServerSideTable:
             return True if str_direction == 'desc' else False
 
         if (self.request_values['iSortCol_0'] != "") and (int(self.request_values['iSortingCols']) > 0):
+            sort_columns = []
             for i in range(0, int(self.request_values['iSortingCols'])):
                 column_number = int(self.request_values['iSortCol_' + str(i)])
                 column_name = self.header_data_names[column_number - 1]
                 sort_direction = self.request_values['sSortDir_' + str(i)]
+                sort_columns.append((column_name, is_reverse(sort_direction)))
+
+            if isinstance(self.table_rows, TableRows):
+                self.table_rows = self.table_rows.sorted(sort_columns)
+                return
+            for (column_name, reverse) in sort_columns:
                 self.table_rows = sorted(self.table_rows,
                                          key=lambda x: x[column_name],
-                                         reverse=is_reverse(sort_direction))
+                                         reverse=reverse)
 
     def paginate_rows(self):
         """
@@ -86,5 +185,5 @@ class ServerSideTable:
         output['sEcho'] = str(self.sEcho)
         output['iTotalRecords'] = str(float('Nan'))
         output['iTotalDisplayRecords'] = str(self.rows_count)
-        output['data'] = self.table_rows
+        output['data'] = list(self.table_rows)
         return output
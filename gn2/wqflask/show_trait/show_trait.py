@@ -202,9 +202,9 @@ class ShowTrait:
 
         # ZS: Get list of chromosomes to select for mapping
         self.chr_list = [["All", -1]]
-        for i, this_chr in enumerate(self.dataset.species.chromosomes.chromosomes(db_cursor)):
-            self.chr_list.append(
-                [self.dataset.species.chromosomes.chromosomes(db_cursor)[this_chr].name, i])
+        for i, chromosome in enumerate(
+                self.dataset.species.chromosomes.chromosomes().values()):
+            self.chr_list.append([chromosome.name, i])
 
         self.genofiles = self.dataset.group.get_genofiles()
         study_samplelist_json = self.dataset.group.get_study_samplelists()
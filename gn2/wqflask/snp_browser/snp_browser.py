@@ -53,13 +53,11 @@ class SnpBrowser:
         self.mouse_chr_list = []
         self.rat_chr_list = []
         mouse_species_ob = species.TheSpecies(species_name="Mouse")
-        for key in mouse_species_ob.chromosomes.chromosomes(db_cursor):
-            self.mouse_chr_list.append(
-                mouse_species_ob.chromosomes.chromosomes(db_cursor)[key].name)
+        for chromosome in mouse_species_ob.chromosomes.chromosomes().values():
+            self.mouse_chr_list.append(chromosome.name)
         rat_species_ob = species.TheSpecies(species_name="Rat")
-        for key in rat_species_ob.chromosomes.chromosomes(db_cursor):
-            self.rat_chr_list.append(
-                rat_species_ob.chromosomes.chromosomes(db_cursor)[key].name)
+        for chromosome in rat_species_ob.chromosomes.chromosomes().values():
+            self.rat_chr_list.append(chromosome.name)
 
         if self.species_id == 1:
             self.this_chr_list = self.mouse_chr_list
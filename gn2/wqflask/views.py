@@ -60,7 +60,8 @@ from gn2.wqflask.external_tools import send_to_bnw, send_to_webgestalt
 from gn2.wqflask.external_tools import send_to_geneweaver
 from gn2.wqflask.comparison_bar_chart import comparison_bar_chart
 from gn2.wqflask.marker_regression import run_mapping
-from gn2.wqflask.marker_regression.exceptions import NoMappingResultsError
+from gn2.wqflask.marker_regression.exceptions import (
+    NoMappingResultsError, MappingNotCachedError, NO_RESULTS_EXIT_CODE)
 from gn2.wqflask.marker_regression import display_mapping_results
 from gn2.wqflask.network_graph import network_graph
 from gn2.wqflask.correlation_matrix import show_corr_matrix
@@ -69,7 +70,6 @@ from gn2.wqflask.ctl.gn3_ctl_analysis import run_ctl
 
 from gn2.wqflask.wgcna.gn3_wgcna import run_wgcna
 from gn2.wqflask.snp_browser import snp_browser
-from gn2.wqflask.search_results import SearchResultPage
 from gn2.wqflask.export_traits import export_traits
 from gn2.wqflask.gsearch import GSearch
 from gn2.wqflask.update_search_results import GSearch as UpdateGSearch
@@ -81,6 +81,7 @@ from gn2.wqflask.oauth2.request_utils import with_flash_error
 
 from gn2.utility import temp_data
 from gn2.utility.tools import get_setting
+from gn2.utility.tools import get_setting_bool
 from gn2.utility.tools import TEMPDIR
 from gn2.utility.tools import USE_REDIS
 from gn2.utility.tools import REDIS_URL
@@ -210,32 +211,27 @@ def twitter(filename):
 
 @app.route("/search", methods=('GET',))
 def search_page():
-    result = None
-    if USE_REDIS:
-        key = "search_results:v1:" + \
-            json.dumps(request.args, sort_keys=True)
-        result = Redis.get(key)
-        if result:
-            result = pickle.loads(result)
-    result = SearchResultPage(request.args).__dict__
-    valid_search = result['search_term_exists']
-    if USE_REDIS and valid_search:
-        # Redis.set(key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
-        Redis.expire(key, 60 * 60)
-
-    if valid_search:
-        return render_template("search_result_page.html", **result)
-    else:
+    result = search_results.cached_search(
+        request.args, g.user_session.user_id)
+    if result is None:
         return render_template("search_error.html")
 
+    return render_template(
+        "search_result_page.html",
+        **{**result, "trait_list": list(result["trait_list"])})
+
 
 @app.route("/search_table", methods=('GET',))
 def search_page_table():
-    the_search = search_results.SearchResultPage(request.args)
+    result = search_results.cached_search(
+        request.args, g.user_session.user_id)
+    if result is None:
+        return flask.jsonify({"error": "Invalid search"}), 400
+
     current_page = server_side.ServerSideTable(
-        len(the_search.trait_list),
-        the_search.trait_list,
-        the_search.header_data_names,
+        len(result["trait_list"]),
+        result["trait_list"],
+        result["header_data_names"],
         request.args,
     ).get_page()
 
@@ -753,7 +749,10 @@ def heatmap_page():
 
             else:
                 template_vars = heatmap.Heatmap(
-                    cursor, request.form, temp_uuid)
+                    cursor, request.form, temp_uuid,
+                    progress=lambda done, total: app.logger.info(
+                        "Heatmap %s: scanned %s of %s traits",
+                        temp_uuid, done, total))
                 template_vars.js_data = json.dumps(template_vars.js_data,
                                                    default=json_default_handler,
                                                    indent="   ")
@@ -1015,37 +1014,120 @@ def mapping_results_page(hash_of_inputs=None):
     Redis.set(samples_hash, start_vars['sample_vals'], ex=7*24*60*60)
     start_vars['dataid'] = samples_hash
 
-    version = "v3"
-    key = "mapping_results:{}:".format(
-        version) + json.dumps(start_vars, sort_keys=True)
-    result = None  # Just for testing
+    if get_setting_bool("RUN_MAPPING_IN_BACKGROUND"):
+        # A cached mapping (e.g. on zooming in, or changing the chromosome)
+        # is rendered at once; only the others are queued
+        try:
+            return __render_mapping_results__(
+                __run_mapping__(start_vars, temp_uuid, cached_only=True))
+        except MappingNotCachedError:
+            return redirect(url_for(
+                "mapping_job_page",
+                job_id=str(__queue_mapping__(start_vars, temp_uuid))))
+
+    return __render_mapping_results__(__run_mapping__(start_vars, temp_uuid))
+
+
+def __run_mapping__(start_vars, temp_uuid, cached_only=False):
+    template_vars = run_mapping.RunMapping(
+        start_vars, temp_uuid, cached_only=cached_only)
+    if template_vars.no_results:
+        raise NoMappingResultsError(
+            start_vars["trait_id"], start_vars["dataset"], start_vars["method"])
+    return template_vars.__dict__
+
+
+def __render_mapping_results__(result):
+    if result['pair_scan']:
+        return render_template("pair_scan_results.html", **result)
+
+    result['js_data'] = json.dumps(result['js_data'],
+                                   default=json_default_handler,
+                                   indent="   ")
+    gn1_template_vars = display_mapping_results.DisplayMappingResults(
+        result).__dict__
+    return render_template("mapping_results.html", **gn1_template_vars)
+
+
+def __queue_mapping__(start_vars, temp_uuid):
+    """Queue the mapping as an external job, so the request returns at once;
+    the results are picked up from `mapping_job_page`"""
+    request_received = datetime.datetime.utcnow()
+    filename = hmac.hmac_creation(
+        f"mapping_inputs_{request_received.isoformat()}")
+    inputs_path = f"{TMPDIR}{filename}"
+    results_path = f"{TMPDIR}{filename}_results.pkl"
+    with open(inputs_path, "wb") as pfile:
+        pickle.dump((dict(start_vars), temp_uuid), pfile,
+                    protocol=pickle.HIGHEST_PROTOCOL)
 
-    if result:
-        result = pickle.loads(result)
-    else:
-        template_vars = run_mapping.RunMapping(start_vars, temp_uuid)
-        if template_vars.no_results:
+    with Redis.from_url(REDIS_URL, decode_responses=True) as rconn:
+        job_id = jobs.queue(
+            rconn, {
+                "command": [
+                    sys.executable, "-m", "gn2.scripts.mapping_compute",
+                    inputs_path, results_path, g.user_session.user_id],
+                "request_received_time": request_received.isoformat(),
+                "inputs-file": inputs_path,
+                "results-file": results_path,
+                "status": "queued"
+            })
+    jobs.run(job_id, REDIS_URL)
+    return job_id
+
+
+def __mapping_job__(job_id):
+    with Redis.from_url(REDIS_URL, decode_responses=True) as rconn:
+        return jobs.job(rconn, job_id).maybe({}, lambda the_job: the_job)
+
+
+@app.route("/mapping_job/<uuid:job_id>")
+def mapping_job_page(job_id):
+    job = __mapping_job__(job_id)
+    if not job:
+        return render_template("jobs/no-such-job.html", job_id=job_id)
+
+    if jobs.completed_successfully(job):
+        with open(job["results-file"], "rb") as results_file:
+            return __render_mapping_results__(pickle.load(results_file))
+
+    if jobs.completed_erroneously(job):
+        if job.get("return-code") == str(NO_RESULTS_EXIT_CODE):
+            with open(job["inputs-file"], "rb") as inputs_file:
+                (start_vars, _temp_uuid) = pickle.load(inputs_file)
             raise NoMappingResultsError(
-                start_vars["trait_id"], start_vars["dataset"], start_vars["method"])
+                start_vars["trait_id"], start_vars["dataset"],
+                start_vars["method"])
+        # The output names the server's paths and commands: it is only logged
+        app.logger.error("Mapping job %s failed:\n%s",
+                         job_id, job.get("stderr", ""))
+        return render_template("jobs/mapping-error.html", job_id=job_id)
 
-        if not template_vars.pair_scan:
-            template_vars.js_data = json.dumps(template_vars.js_data,
-                                               default=json_default_handler,
-                                               indent="   ")
+    return render_template("loading_mapping.html", job_id=job_id)
 
-        result = template_vars.__dict__
 
-        if result['pair_scan']:
-            rendered_template = render_template(
-                "pair_scan_results.html", **result)
-        else:
-            gn1_template_vars = display_mapping_results.DisplayMappingResults(
-                result).__dict__
+@app.route("/mapping_job/<uuid:job_id>/retry", methods=('POST',))
+def mapping_job_retry(job_id):
+    """Queue a failed mapping job's mapping again, as a new job"""
+    job = __mapping_job__(job_id)
+    if not job:
+        return render_template("jobs/no-such-job.html", job_id=job_id)
 
-            rendered_template = render_template(
-                "mapping_results.html", **gn1_template_vars)
+    if not jobs.completed_erroneously(job):
+        return redirect(url_for("mapping_job_page", job_id=str(job_id)))
+
+    with open(job["inputs-file"], "rb") as inputs_file:
+        (start_vars, temp_uuid) = pickle.load(inputs_file)
+    return redirect(url_for(
+        "mapping_job_page",
+        job_id=str(__queue_mapping__(start_vars, temp_uuid))))
 
-    return rendered_template
+
+@app.route("/mapping_job/<uuid:job_id>/status")
+def mapping_job_status(job_id):
+    job = __mapping_job__(job_id)
+    return jsonify({"status": job.get("status", "NOT-FOUND"),
+                    "completion-status": job.get("completion-status")})
 
 
 @app.route("/cache_mapping_inputs", methods=('POST',))
@@ -1134,18 +1216,23 @@ def corr_compute_page():
             filename = hmac.hmac_creation(
                 f"request_form_{request_received.isoformat()}")
             filepath = f"{TMPDIR}{filename}"
-            with open(filepath, "wb") as pfile:
+            # The inputs are complete before the workers can see the job
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as pfile:
                 pickle.dump(request.form, pfile,
                             protocol=pickle.HIGHEST_PROTOCOL)
-                job_id = jobs.queue(
-                    rconn, {
-                        "command": [
-                            sys.executable, "-m", "gn2.scripts.corr_compute", filepath,
-                            g.user_session.user_id],
-                        "request_received_time": request_received.isoformat(),
-                        "status": "queued"
-                    })
-                jobs.run(job_id, REDIS_URL)
+            os.replace(tmp_path, filepath)
+            job_id = jobs.queue(
+                rconn, {
+                    "command": [
+                        sys.executable, "-m", "gn2.scripts.corr_compute", filepath,
+                        g.user_session.user_id],
+                    "request_received_time": request_received.isoformat(),
+                    "inputs-file": filepath,
+                    "user-id": g.user_session.user_id,
+                    "status": "queued"
+                })
+            jobs.submit(rconn, jobs.CORRELATION_QUEUE, job_id, REDIS_URL)
 
             return redirect(url_for("corr_compute_page", job_id=str(job_id)))
 
@@ -1157,6 +1244,11 @@ def corr_compute_page():
             output = json.loads(job.get("stdout", "{}"))
             return render_template("correlation_page.html", **output)
 
+        if job.get("status") == "queued":
+            # The job may have been queued for workers that have since
+            # stopped
+            jobs.run_orphaned(rconn, jobs.CORRELATION_QUEUE, REDIS_URL)
+
         if jobs.completed_erroneously(job):
             try:
                 error_output = {
@@ -1272,6 +1364,8 @@ def json_default_handler(obj):
     elif isinstance(obj, int) or isinstance(obj, uuid.UUID):
         return str(obj)
     # Handle custom objects
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
     if hasattr(obj, '__dict__'):
         return obj.__dict__
     else: